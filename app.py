@@ -19,16 +19,38 @@ from flask import (
 from werkzeug.security import check_password_hash
 
 
+import db
 import users
 import movies
 import categories
+import conditional
 import platforms
 import directors
+import lookups
 import review
+import stats
 
 app = Flask(__name__, static_url_path="/static")
 app.secret_key = os.getenv("SECRET_KEY") or "fallback-secret-key-for-development-only"
 app.config['DEBUG'] = True
+app.teardown_appcontext(db.close_connection)
+
+# Fail fast on a bad DB_PRAGMA_PROFILE / DB_PRAGMA_* configuration
+db.configure()
+
+# Deferred stats mode: refresh the queued user/movie stats in the background
+if os.getenv("STATS_WORKER") == "1":
+    stats.start_worker()
+
+
+@app.cli.command("db-info")
+def db_info():
+    """Show the active PRAGMA profile and the values SQLite actually applied"""
+    profile, report = db.pragma_report()
+    print(f"PRAGMA profile: {profile}")
+    for pragma, configured, effective in report:
+        configured = "(sqlite default)" if configured is None else configured
+        print(f"  {pragma:<14} configured={configured}  effective={effective}")
 
 
 def check_csrf(request=None):
@@ -42,12 +64,24 @@ def check_csrf(request=None):
 def before_request():
     check_csrf(request)
     g.start_time = time.time()
+    # Deferred stats: apply overdue queued changes even if no worker runs
+    if request.endpoint != "static":
+        stats.flush_stale()
 
 
 @app.after_request
 def after_request(response):
     elapsed_time = round(time.time() - g.start_time, 2)
-    print("elapsed time:", elapsed_time, "s")
+    db_stats = db.request_stats()
+    print(
+        "elapsed time:",
+        elapsed_time,
+        "s | db:",
+        db_stats["count"],
+        "queries,",
+        round(db_stats["seconds"], 3),
+        "s",
+    )
     return response
 
 
@@ -73,6 +107,7 @@ def inject_globals():
 
 
 @app.route("/")
+@conditional.conditional(conditional.list_signals)
 def index():
     session["csrf_token"] = secrets.token_hex(16)
     user_id = None
@@ -86,13 +121,16 @@ def index():
     page = request.args.get("page", 1, type=int)
     per_page = 20  # Movies per page
 
-    user_movies = movies.get_movies(page=page, per_page=per_page)
-
-    # Calculate total items (simple query for count)
-    import db
+    # Prev/next links carry a keyset cursor so deep pages are a seek, not an OFFSET
+    user_movies = movies.get_movies(
+        page=page,
+        per_page=per_page,
+        after=request.args.get("after"),
+        before=request.args.get("before"),
+    )
 
-    count_result = db.query("SELECT COUNT(*) as total FROM movies")
-    total_items = count_result[0]["total"] if count_result else 0
+    # Total items from the trigger-maintained counter instead of COUNT(*)
+    total_items = movies.get_movies_count()
     total_pages = ceil(total_items / per_page) if total_items > 0 else 1
 
     pagination = {
@@ -100,9 +138,11 @@ def index():
         "current_page": page,
         "total_items": total_items,
         "has_prev": page > 1,
-        "has_next": page < total_pages,
+        "has_next": page < total_pages and len(user_movies) == per_page,
         "prev_page": page - 1 if page > 1 else None,
         "next_page": page + 1 if page < total_pages else None,
+        "prev_cursor": movies.encode_cursor(user_movies[0]) if user_movies else None,
+        "next_cursor": movies.encode_cursor(user_movies[-1]) if user_movies else None,
     }
 
     return render_template(
@@ -178,11 +218,11 @@ def register():
 
 
 def _get_form_entities():
-    """Cache entity lookups to avoid duplicate queries"""
+    """Form choices from the process-local lookup cache"""
     return {
-        "categories": categories.get_categories() or [],
-        "platforms": platforms.get_platforms() or [],
-        "directors": directors.get_directors() or [],
+        "categories": lookups.get_rows("categories"),
+        "platforms": lookups.get_rows("streaming_platforms"),
+        "directors": lookups.get_rows("directors"),
     }
 
 
@@ -235,11 +275,7 @@ def add():
             category_id = categories.add_category(new_category)
         except sqlite3.IntegrityError:
             # Category already exists, find it
-            existing_categories = categories.get_categories()
-            for cat in existing_categories:
-                if cat["name"].lower() == new_category.lower():
-                    category_id = cat["id"]
-                    break
+            category_id = lookups.get_id("categories", new_category)
     elif selected_category and selected_category != "":
         category_id = int(selected_category)
 
@@ -251,11 +287,7 @@ def add():
         try:
             streaming_platform_id = platforms.add_platform(new_platform)
         except sqlite3.IntegrityError:
-            existing_platforms = platforms.get_platforms()
-            for platform in existing_platforms:
-                if platform["name"].lower() == new_platform.lower():
-                    streaming_platform_id = platform["id"]
-                    break
+            streaming_platform_id = lookups.get_id("streaming_platforms", new_platform)
     elif selected_platform and selected_platform != "":
         streaming_platform_id = int(selected_platform)
 
@@ -267,11 +299,7 @@ def add():
         try:
             director_id = directors.add_director(new_director)
         except sqlite3.IntegrityError:
-            existing_directors = directors.get_directors()
-            for director in existing_directors:
-                if director["name"].lower() == new_director.lower():
-                    director_id = director["id"]
-                    break
+            director_id = lookups.get_id("directors", new_director)
     elif selected_director and selected_director != "":
         director_id = int(selected_director)
 
@@ -299,27 +327,16 @@ def add():
         entities = _get_form_entities()
         
         # Add entity names to movie_data so template can display them properly
-        if category_id:
-            for cat in entities["categories"]:
-                if cat["id"] == category_id:
-                    movie_data["category_name"] = cat["name"]
-                    movie_data["category_id_only"] = category_id  # Keep ID for selection
-                    break
-        
-        if streaming_platform_id:
-            for platform in entities["platforms"]:
-                if platform["id"] == streaming_platform_id:
-                    movie_data["platform_name"] = platform["name"]
-                    movie_data["platform_id_only"] = streaming_platform_id  # Keep ID for selection
-                    break
-        
-        if director_id:
-            for director in entities["directors"]:
-                if director["id"] == director_id:
-                    movie_data["director_name"] = director["name"]
-                    movie_data["director_id_only"] = director_id  # Keep ID for selection
-                    break
-        
+        for key, table, entity_id in (
+            ("category", "categories", category_id),
+            ("platform", "streaming_platforms", streaming_platform_id),
+            ("director", "directors", director_id),
+        ):
+            name = lookups.get_name(table, entity_id) if entity_id else None
+            if name is not None:
+                movie_data[f"{key}_name"] = name
+                movie_data[f"{key}_id_only"] = entity_id  # Keep ID for selection
+
         return render_template(
             "add.html",
             categories=entities["categories"],
@@ -332,6 +349,7 @@ def add():
 
 
 @app.route("/movie/<int:movie_id>")
+@conditional.conditional(conditional.detail_signals)
 def movie_detail(movie_id):
     user_id = None
     if "username" in session:
@@ -384,6 +402,7 @@ def add_review(movie_id):
 
 
 @app.route("/search", methods=["GET"])
+@conditional.conditional(conditional.list_signals)
 def search():
     user_id = None
     if "username" in session:
@@ -408,14 +427,14 @@ def search():
     # Get filter options for the form (always needed)
     entities = _get_form_entities()
 
-    # Get total count for accurate pagination
-    total_items = movies.get_search_count(filter_options)
+    # Get search results with pagination and the total count in one scan
+    search_results, total_items = movies.search_movies_page(
+        filter_options=filter_options, page=page, per_page=per_page
+    )
     total_pages = ceil(total_items / per_page) if total_items > 0 else 1
 
-    # Get search results with pagination (always show results)
-    search_results = movies.search_movies(
-        user_id=user_id, filter_options=filter_options, page=page, per_page=per_page
-    )
+    # Result counts for every filter option, from one aggregated pass
+    facets = movies.get_search_facets(filter_options)
 
     pagination = {
         "current_page": page,
@@ -434,6 +453,7 @@ def search():
         pagination=pagination,
         categories=entities["categories"],
         platforms=entities["platforms"],
+        facets=facets,
     )
 
 
@@ -477,17 +497,13 @@ def edit(movie_id):
     is_owner = existing_movie["owner_id"] == user["id"]
 
     # Helper function to handle category/platform/director selection
-    def get_entity_id(selected_value, new_value, add_func, get_func):
+    def get_entity_id(selected_value, new_value, add_func, table):
         entity_id = None
         if new_value:
             try:
                 entity_id = add_func(new_value)
             except sqlite3.IntegrityError:
-                entities = get_func()
-                for entity in entities:
-                    if entity["name"].lower() == new_value.lower():
-                        entity_id = entity["id"]
-                        break
+                entity_id = lookups.get_id(table, new_value)
         elif selected_value and selected_value != "":
             entity_id = int(selected_value)
         return entity_id
@@ -498,21 +514,21 @@ def edit(movie_id):
             request.form.get("category"),
             request.form.get("new_category", "").strip(),
             categories.add_category,
-            categories.get_categories,
+            "categories",
         )
 
         streaming_platform_id = get_entity_id(
             request.form.get("streaming_platform"),
             request.form.get("new_platform", "").strip(),
             platforms.add_platform,
-            platforms.get_platforms,
+            "streaming_platforms",
         )
 
         director_id = get_entity_id(
             request.form.get("director"),
             request.form.get("new_director", "").strip(),
             directors.add_director,
-            directors.get_directors,
+            "directors",
         )
 
         # Prepare movie data for owner update (full edit)
@@ -598,15 +614,12 @@ def dashboard():
     per_page = 10  # Movies per page in dashboard
 
     user_movies = movies.get_movies_by_user(user["id"], page=page, per_page=per_page)
-    user_reviews = review.get_reviews_by_user(user["id"])
 
     # Get total count for pagination
     total_movies_count = movies.get_user_movies_count(user["id"])
     total_pages = ceil(total_movies_count / per_page) if total_movies_count > 0 else 1
 
     # Fetch all stats from materialized user_stats table (optimized by triggers)
-    import db
-
     user_stats_result = db.query(
         """SELECT 
            total_movies_watched,
@@ -624,22 +637,28 @@ def dashboard():
     if user_stats_result:
         stats = user_stats_result[0]
         total_movies = stats["total_movies_watched"] or 0
-        avg_rating = round(float(stats["avg_rating"]) or 0, 2)
+        avg_rating = round(float(stats["avg_rating"] or 0), 2)
         total_favorites = stats["total_favorites"] or 0
-        total_watch_time = round(float(stats["total_watch_hours"]) or 0, 1)
+        total_watch_time = round(float(stats["total_watch_hours"] or 0), 1)
         total_ratings_given = stats["total_ratings_given"] or 0
         total_reviews_written = stats["total_reviews_written"] or 0
     else:
-        # Fallback if no stats exist yet
+        # Fallback if no stats exist yet: aggregate the review history in one
+        # streamed pass instead of loading it all into memory
         total_movies = total_movies_count
-        total_ratings_given = len(user_reviews)
-        ratings = [r["rating"] for r in user_reviews if "rating" in r and r["rating"]]
-        avg_rating = round(sum(ratings) / len(ratings), 2) if ratings else 0
+        total_ratings_given = 0
+        rating_sum = 0
+        total_reviews_written = 0
+        for user_review in review.iter_reviews_by_user(user["id"]):
+            total_ratings_given += 1
+            rating_sum += user_review["rating"]
+            if user_review["review"]:
+                total_reviews_written += 1
+        avg_rating = (
+            round(rating_sum / total_ratings_given, 2) if total_ratings_given else 0
+        )
         total_favorites = movies.get_favorites(user["id"])
         total_watch_time = 0
-        total_reviews_written = len(
-            [r for r in user_reviews if "review" in r and r["review"]]
-        )
 
     # Convert created_at string to datetime object
     created_at = datetime.fromisoformat(user["created_at"])
@@ -664,7 +683,6 @@ def dashboard():
         "avg_rating": avg_rating,
         "member_since": member_since,
         "movies": user_movies,
-        "reviews": user_reviews,
     }
 
     return render_template(
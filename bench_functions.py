@@ -0,0 +1,287 @@
+"""
+Micro-benchmarks for the data-access functions in movies.py.
+
+Each benchmark calls one function (or one variant of its arguments) against
+a fixed fixture database, seeded with the triggers in place so writes pay
+the same trigger cost as in the application. The median time of every
+benchmark is compared with the stored baseline (function_benchmarks.json),
+and with --check the script exits with status 1 when a median has slowed
+by more than --threshold percent. A benchmark over the threshold is measured
+again, up to --attempts times in all, and only fails if every attempt is
+slow; the write benchmarks commit to disk and are noisy otherwise:
+
+    $ python bench_functions.py --check
+    $ python bench_functions.py --update-baseline
+
+Timings depend on the machine, so record the baseline on the machine that
+runs the check.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from flask import Flask
+
+import db
+import movies
+import seed
+
+BASELINE_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "function_benchmarks.json"
+)
+
+FIXTURE = {"num_users": 50, "num_movies": 10000, "num_ratings": 50000, "num_favorites": 2000}
+
+THRESHOLD_PERCENT = 25
+
+# Slowdowns smaller than this are timer noise on the sub-millisecond benchmarks
+MIN_REGRESSION_MS = 0.05
+
+# Measurements of a benchmark before a slowdown counts as a regression
+CHECK_ATTEMPTS = 3
+
+
+def _new_movie(title, rating=4, favorite=True):
+    """Form data for add_movie"""
+    return {
+        "title": title,
+        "year": 2020,
+        "duration": 120,
+        "category_id": 1,
+        "streaming_platform_id": 1,
+        "director_id": 1,
+        "review": "Benchmark review",
+        "rating": rating,
+        "watch_date": "2024-01-01",
+        "watched_with": None,
+        "favorite": favorite,
+    }
+
+
+def benchmarks():
+    """{name: (setup, run, teardown)}
+
+    setup() returns the argument passed to run() and teardown(); writes are
+    undone in teardown so every round starts from the same fixture state.
+    """
+    user_id = db.query(
+        "SELECT user_id FROM user_stats ORDER BY total_movies_watched DESC, user_id LIMIT 1"
+    )[0]["user_id"]
+    other_user_id = db.query(
+        "SELECT id FROM users WHERE id != ? ORDER BY id LIMIT 1", [user_id]
+    )[0]["id"]
+    rated_title = db.query(
+        """SELECT m.title FROM movies m
+        WHERE m.owner_id != ? AND NOT EXISTS (
+            SELECT 1 FROM user_ratings ur WHERE ur.movie_id = m.id AND ur.user_id = ?
+        )
+        ORDER BY m.id LIMIT 1""",
+        [other_user_id, other_user_id],
+    )[0]["title"]
+    first_page = movies.get_movies(page=1)
+    cursor = movies.encode_cursor(first_page[-1])
+
+    text_search = {"query": "dark", "sort_by": "relevance"}
+    filtered_search = {"genre": "action", "year": "2010s", "rating": "3", "sort_by": "rating"}
+
+    def read(function, *args, **kwargs):
+        return (lambda: None, lambda _: function(*args, **kwargs), lambda _: None)
+
+    def add_new():
+        return (
+            lambda: None,
+            lambda _: movies.add_movie(user_id, _new_movie("Benchmark movie")),
+            lambda movie_id: movies.delete_movie(user_id, movie_id),
+        )
+
+    def add_existing():
+        # An existing title: only the rating upsert and favorite sync run
+        return (
+            lambda: None,
+            lambda _: movies.add_movie(other_user_id, _new_movie(rated_title)),
+            lambda movie_id: (
+                movies.remove_from_favorites(other_user_id, movie_id),
+                movies.delete_movie(other_user_id, movie_id),
+            ),
+        )
+
+    def delete_owned():
+        return (
+            lambda: movies.add_movie(user_id, _new_movie("Benchmark movie")),
+            lambda movie_id: movies.delete_movie(user_id, movie_id),
+            lambda _: None,
+        )
+
+    return {
+        "get_movies": read(movies.get_movies, page=1),
+        "get_movies:page=50": read(movies.get_movies, page=50),
+        "get_movies:cursor": read(movies.get_movies, after=cursor),
+        "search_movies": read(movies.search_movies, filter_options={}),
+        "search_movies:text": read(movies.search_movies, filter_options=text_search),
+        "search_movies:filters": read(movies.search_movies, filter_options=filtered_search),
+        "get_search_count:text": read(movies.get_search_count, text_search),
+        "get_search_count:filters": read(movies.get_search_count, filtered_search),
+        "get_movies_by_user": read(movies.get_movies_by_user, user_id),
+        "get_user_movies_count": read(movies.get_user_movies_count, user_id),
+        "get_favorite_movies": read(movies.get_favorite_movies, user_id),
+        "add_movie:new": add_new(),
+        "add_movie:existing": add_existing(),
+        "delete_movie:owner": delete_owned(),
+    }
+
+
+def measure(setup, run, teardown, rounds, warmup=3):
+    """Per-round seconds of run(), excluding setup and teardown"""
+    timings = []
+    for round_number in range(warmup + rounds):
+        argument = setup()
+        start = time.perf_counter()
+        result = run(argument)
+        elapsed = time.perf_counter() - start
+        teardown(argument if argument is not None else result)
+        if round_number >= warmup:
+            timings.append(elapsed)
+    return timings
+
+
+def run_benchmarks(rounds, only=None, names=None):
+    """Benchmarks starting with one of only, or exactly those in names"""
+    report = {}
+    # One app context for the whole run: like within a request, db keeps its
+    # connections open, so the timings are the functions' own and not the
+    # cost of opening a connection per statement
+    with Flask(__name__).app_context():
+        for name, (setup, run, teardown) in benchmarks().items():
+            if only and not any(name.startswith(prefix) for prefix in only):
+                continue
+            if names is not None and name not in names:
+                continue
+            timings = [seconds * 1000 for seconds in measure(setup, run, teardown, rounds)]
+            report[name] = {
+                "median_ms": round(statistics.median(timings), 4),
+                "min_ms": round(min(timings), 4),
+                "max_ms": round(max(timings), 4),
+                "rounds": rounds,
+            }
+    return report
+
+
+def check_against_baseline(report, threshold):
+    """(name, baseline, median, change %) for medians slower than the threshold"""
+    with open(BASELINE_PATH, "r") as f:
+        baseline = json.load(f)
+    regressions = []
+    for name, entry in report.items():
+        if name not in baseline:
+            continue
+        change = (entry["median_ms"] - baseline[name]) / baseline[name] * 100
+        entry["baseline_ms"] = baseline[name]
+        entry["change_percent"] = round(change, 1)
+        if change > threshold and entry["median_ms"] - baseline[name] > MIN_REGRESSION_MS:
+            regressions.append((name, baseline[name], entry["median_ms"], change))
+    return regressions
+
+
+def check_with_retries(report, threshold, rounds, attempts):
+    """Re-measure slow benchmarks; each keeps its fastest median across attempts"""
+    regressions = check_against_baseline(report, threshold)
+    for _ in range(attempts - 1):
+        if not regressions:
+            break
+        retry = run_benchmarks(rounds, names={name for name, *_ in regressions})
+        for name, entry in retry.items():
+            if entry["median_ms"] < report[name]["median_ms"]:
+                report[name] = entry
+        regressions = check_against_baseline(report, threshold)
+    return regressions
+
+
+def print_report(report):
+    for name, entry in report.items():
+        line = f"  {name:<26} median {entry['median_ms']:>9.3f} ms  min {entry['min_ms']:>9.3f} ms"
+        if "baseline_ms" in entry:
+            line += f"  baseline {entry['baseline_ms']:>9.3f} ms ({entry['change_percent']:+.0f}%)"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=50, help="measured calls per benchmark")
+    parser.add_argument("--check", action="store_true", help="fail on medians slower than the baseline")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=THRESHOLD_PERCENT,
+        help="allowed slowdown of a median in percent",
+    )
+    parser.add_argument(
+        "--attempts",
+        type=int,
+        default=CHECK_ATTEMPTS,
+        help="measurements of a slow benchmark before it fails the check, "
+        "and runs whose median is recorded as the baseline",
+    )
+    parser.add_argument("--update-baseline", action="store_true", help="record the medians as the baseline")
+    parser.add_argument("--only", nargs="+", help="run only benchmarks starting with these names")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    # The slow-query log runs EXPLAIN on slow statements, which would be timed too
+    db.SLOW_QUERY_SECONDS = float("inf")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DATABASE = os.path.join(tmp, "benchmark.db")
+        with contextlib.redirect_stdout(io.StringIO()):
+            seed.build_fixture_database(db.DATABASE, **FIXTURE)
+        report = run_benchmarks(args.rounds, args.only)
+
+        if args.update_baseline:
+            # The median of several runs, so one fast or slow run does not set the bar
+            runs = [report] + [
+                run_benchmarks(args.rounds, args.only) for _ in range(args.attempts - 1)
+            ]
+            medians = {
+                name: round(statistics.median(run[name]["median_ms"] for run in runs), 4)
+                for name in report
+            }
+
+        regressions = []
+        if args.check and os.path.exists(BASELINE_PATH):
+            regressions = check_with_retries(
+                report, args.threshold, args.rounds, args.attempts
+            )
+
+    if args.update_baseline:
+        baseline = {}
+        if args.only and os.path.exists(BASELINE_PATH):
+            with open(BASELINE_PATH, "r") as f:
+                baseline = json.load(f)
+        baseline.update(medians)
+        with open(BASELINE_PATH, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"✓ Baseline written to {BASELINE_PATH}")
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+    if args.check:
+        if regressions:
+            print(f"✗ {len(regressions)} benchmark(s) slower than {args.threshold:g}%:")
+            for name, baseline_ms, median_ms, change in regressions:
+                print(f"  {name}: {baseline_ms:.3f} -> {median_ms:.3f} ms ({change:+.0f}%)")
+            sys.exit(1)
+        print("✓ No benchmark regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""
+Route-level load benchmark with scale profiles.
+
+Seeds a database at a named scale profile, drives the read routes (/, the
+/search filter x sort matrix, /movie/<id>, /dashboard and /favorites)
+through the Flask test client with logged-in sessions, and reports p50, p95
+and p99 latency and the number of queries per request as JSON:
+
+    $ python bench_routes.py --profile small
+    $ python bench_routes.py --profile 500k --database bench-500k.db --output before.json
+    $ python bench_routes.py --profile 500k --database bench-500k.db --compare before.json
+
+Without --database the profile is seeded into a temporary file. A database
+given with --database is seeded on the first run and reused afterwards
+(seeding the large profiles takes minutes); --reseed forces a fresh one.
+"""
+
+import argparse
+import contextlib
+import json
+import math
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import db
+import seed
+from index_advisor import search_urls
+
+# Row counts per profile; 500k and 7m match the runs in performance.md
+PROFILES = {
+    "small": {"users": 20, "movies": 2000, "ratings": 5000, "favorites": 500},
+    "500k": {"users": 100, "movies": 500000, "ratings": 500000, "favorites": 1000},
+    "7m": {"users": 2000, "movies": 4000000, "ratings": 7000000, "favorites": 20000},
+}
+
+RANDOM_SEED = 42
+
+# Per-request query stats, filled by an after_request hook
+_samples = []
+
+
+def prepare_database(path, profile, reseed=False):
+    """Seed the profile into path unless a database is already there"""
+    if os.path.exists(path) and not reseed:
+        print(f"Reusing {path}", file=sys.stderr)
+        return
+    sizes = PROFILES[profile]
+    # Progress output goes to stderr so stdout stays valid JSON
+    with contextlib.redirect_stdout(sys.stderr):
+        seed.create_database(path)
+        seed.set_random_seed(RANDOM_SEED)
+        seed.seed_database(
+            sizes["users"], sizes["movies"], sizes["ratings"], sizes["favorites"], bulk_load=True
+        )
+
+
+def row_counts():
+    con = db.get_connection(readonly=True)
+    try:
+        return {
+            table: con.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            for table in ("users", "movies", "user_ratings", "user_favorites")
+        }
+    finally:
+        con.close()
+
+
+def benchmark_urls(num_movies=20):
+    """{route: [urls]} with a fixed sample of movie detail pages"""
+    rows = db.query("SELECT id FROM movies ORDER BY id")
+    movie_ids = random.Random(RANDOM_SEED).sample(
+        [row["id"] for row in rows], min(num_movies, len(rows))
+    )
+    return {
+        "/": ["/", "/?page=2", "/?page=50"],
+        "/search": search_urls(),
+        "/movie/<id>": [f"/movie/{movie_id}" for movie_id in movie_ids],
+        "/dashboard": ["/dashboard"],
+        "/favorites": ["/favorites"],
+    }
+
+
+def session_users(count):
+    """The users with the most ratings, i.e. the heaviest dashboards and lists"""
+    return db.query(
+        """SELECT u.id, u.username
+        FROM users u
+        LEFT JOIN user_stats us ON us.user_id = u.id
+        ORDER BY COALESCE(us.total_movies_watched, 0) DESC, u.id
+        LIMIT ?""",
+        [count],
+    )
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(samples):
+    latencies = [sample["seconds"] * 1000 for sample in samples]
+    queries = [sample["queries"] for sample in samples]
+    return {
+        "requests": len(samples),
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "mean_ms": round(sum(latencies) / len(latencies), 3),
+        "max_ms": round(max(latencies), 3),
+        "db_p50_ms": round(percentile([s["db_seconds"] * 1000 for s in samples], 50), 3),
+        "queries_per_request": round(sum(queries) / len(queries), 2),
+        "max_queries": max(queries),
+    }
+
+
+def run(sessions, repeat):
+    """Request every URL repeat times per session and return {route: [samples]}"""
+    # Imported here so db.DATABASE is already pointing at the benchmark database
+    import app as application
+
+    def record_stats(response):
+        stats = db.request_stats()
+        _samples.append({"queries": stats["count"], "db_seconds": stats["seconds"]})
+        return response
+
+    application.app.after_request(record_stats)
+    urls = benchmark_urls()
+    results = {route: [] for route in urls}
+
+    for user in session_users(sessions):
+        client = application.app.test_client()
+        with client.session_transaction() as session:
+            session["username"] = user["username"]
+            session["user_id"] = user["id"]
+
+        # The first pass only warms the page cache
+        for iteration in range(repeat + 1):
+            for route, route_urls in urls.items():
+                for url in route_urls:
+                    start = time.perf_counter()
+                    response = client.get(url)
+                    elapsed = time.perf_counter() - start
+                    if response.status_code != 200:
+                        raise RuntimeError(f"GET {url} returned {response.status_code}")
+                    sample = _samples.pop()
+                    if iteration:
+                        results[route].append(dict(sample, seconds=elapsed))
+    return results
+
+
+def compare(report, previous):
+    """Print latency changes per route against an earlier report"""
+    print(f"Compared with {previous['profile']} run from {previous['started_at']}:", file=sys.stderr)
+    for route, entry in report["routes"].items():
+        before = previous["routes"].get(route)
+        if not before:
+            continue
+        changes = []
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            change = (entry[key] - before[key]) / before[key] * 100 if before[key] else 0.0
+            changes.append(f"{key[:3]} {before[key]:.1f} -> {entry[key]:.1f} ms ({change:+.0f}%)")
+        print(f"  {route:<12} {'  '.join(changes)}", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--profile", choices=PROFILES, default="small", help="scale profile")
+    parser.add_argument("--database", help="database to seed or reuse (default: a temporary file)")
+    parser.add_argument("--reseed", action="store_true", help="seed --database again even if it exists")
+    parser.add_argument("--sessions", type=int, default=3, help="logged-in users to run as")
+    parser.add_argument("--repeat", type=int, default=3, help="measured passes over the URLs per user")
+    parser.add_argument("--output", help="write the JSON report to a file instead of stdout")
+    parser.add_argument("--compare", help="earlier JSON report to compare against")
+    args = parser.parse_args()
+
+    # The slow-query log runs EXPLAIN inside the request, which would skew the timings
+    db.SLOW_QUERY_SECONDS = float("inf")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.database or os.path.join(tmp, f"bench-{args.profile}.db")
+        seed.DATABASE = db.DATABASE = path
+        prepare_database(path, args.profile, args.reseed)
+
+        started_at = datetime.now().isoformat(timespec="seconds")
+        # The app prints a timing line for every request
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            results = run(args.sessions, args.repeat)
+        rows = row_counts()
+
+    report = {
+        "profile": args.profile,
+        "started_at": started_at,
+        "rows": rows,
+        "sessions": args.sessions,
+        "repeat": args.repeat,
+        "pragma_profile": db.configure()[0],
+        "sqlite_version": sqlite3.sqlite_version,
+        "python_version": platform.python_version(),
+        "routes": {route: summarize(samples) for route, samples in results.items()},
+        "total": summarize([sample for samples in results.values() for sample in samples]),
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+        print(f"✓ Report written to {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import db
+import lookups
 
 
 def get_categories():
@@ -11,4 +12,5 @@ def add_category(category_name):
     """Lisää uusi kategoria"""
     sql = "INSERT INTO categories (name) VALUES (?)"
     category_id = db.execute(sql, [category_name])
+    lookups.invalidate()
     return category_id
@@ -0,0 +1,196 @@
+"""
+Cross-process cache invalidation through the change_log table.
+
+Triggers on movies, user_ratings, user_favorites and the dimension tables
+append the changed keys to change_log: ('movie', movie id) when the movie
+row changes, ('rating', movie id) when its ratings (and so its average)
+change, ('user', user id) or ('dimension', table name). A favorite is
+per-user data and is logged under its user only. The seq only ever grows,
+so every process remembers the last seq it has seen and reads just the
+newer rows.
+
+Caches register an eviction callback per kind and call poll() before they
+serve a value:
+
+    changes.subscribe("movie", lambda movie_ids: ...)
+
+poll() first checks PRAGMA data_version on a long-lived probe connection;
+while no other connection has committed it costs no query at all. Writes
+that bypass the triggers (bulk loads, stats rebuilds) log an 'all' entry,
+and a process that fell behind a prune evicts everything, in both cases
+with keys=None.
+
+The log is pruned from the command line or a cron job:
+
+    $ python changes.py status
+    $ python changes.py prune --older-than 3600
+"""
+
+import argparse
+import sqlite3
+import threading
+from collections import defaultdict
+
+import db
+
+KINDS = ("movie", "rating", "user", "dimension")
+
+# Rows read per poll query; a longer backlog is read in several rounds
+POLL_BATCH_SIZE = 1000
+
+_subscribers = defaultdict(list)
+_lock = threading.RLock()
+_probe = None
+_probe_database = None
+_data_version = None
+
+# Last seq this process has applied; None until the first poll
+_last_seq = None
+
+
+def subscribe(kind, callback):
+    """Call callback(keys) when keys of kind change; keys=None means all of them"""
+    if kind not in KINDS:
+        raise ValueError(f"Unknown change kind {kind!r}, expected one of {KINDS}")
+    with _lock:
+        _subscribers[kind].append(callback)
+
+
+def _probe_connection():
+    global _probe, _probe_database, _data_version, _last_seq
+    if _probe is None or _probe_database != db.DATABASE:
+        if _probe is not None:
+            _probe.close()
+        # Shared by the request threads, always under _lock
+        _probe = sqlite3.connect(
+            f"file:{db.DATABASE}?mode=ro", uri=True, check_same_thread=False
+        )
+        _probe_database = db.DATABASE
+        _data_version = _last_seq = None
+    return _probe
+
+
+def _notify(changed):
+    """changed is {kind: set of keys}, or None for everything"""
+    for kind in KINDS:
+        if changed is None or changed.get(kind):
+            for callback in _subscribers[kind]:
+                callback(None if changed is None else changed[kind])
+
+
+def poll():
+    """Evict what changed since the last poll; returns the number of log rows read"""
+    global _data_version, _last_seq
+    with _lock:
+        con = _probe_connection()
+        data_version = con.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == _data_version:
+            return 0
+        _data_version = data_version
+
+        if _last_seq is None:
+            # Nothing is known about what the caches were filled from; start
+            # after the last seq handed out, even if its row is pruned since
+            _last_seq = con.execute(
+                "SELECT COALESCE(MAX(seq), 0) FROM sqlite_sequence WHERE name = 'change_log'"
+            ).fetchone()[0]
+            _notify(None)
+            return 0
+
+        changed = defaultdict(set)
+        read = 0
+        everything = False
+        while True:
+            rows = con.execute(
+                "SELECT seq, kind, key FROM change_log WHERE seq > ? ORDER BY seq LIMIT ?",
+                [_last_seq, POLL_BATCH_SIZE],
+            ).fetchall()
+            if not rows:
+                break
+            # Seqs are assigned in commit order, so a hole means pruned rows
+            if rows[0][0] != _last_seq + 1:
+                everything = True
+            for seq, kind, key in rows:
+                if kind == "all":
+                    everything = True
+                else:
+                    changed[kind].add(key)
+            read += len(rows)
+            _last_seq = rows[-1][0]
+
+        if not read:
+            # Rows written since the last poll and already pruned leave no
+            # hole to see, but the sequence has still moved past _last_seq
+            last_handed_out = con.execute(
+                "SELECT COALESCE(MAX(seq), 0) FROM sqlite_sequence WHERE name = 'change_log'"
+            ).fetchone()[0]
+            if last_handed_out > _last_seq:
+                _last_seq = last_handed_out
+                everything = True
+
+        if everything:
+            _notify(None)
+        elif changed:
+            _notify(changed)
+        return read
+
+
+def log_all():
+    """Record a change to everything, for writes made with the triggers off"""
+    db.execute("INSERT INTO change_log (kind, key) VALUES ('all', '*')")
+
+
+def log_keys(kind, keys):
+    """Record changed keys that the triggers did not see (e.g. deferred stats)"""
+    keys = list(keys)
+    if keys:
+        db.execute(
+            f"INSERT INTO change_log (kind, key) VALUES {', '.join(['(?, ?)'] * len(keys))}",
+            [value for key in keys for value in (kind, key)],
+        )
+
+
+def prune(older_than_seconds):
+    """Delete log rows older than the given age; returns how many went"""
+    with db.transaction():
+        before = db.query("SELECT COUNT(*) AS n FROM change_log")[0]["n"]
+        db.execute(
+            "DELETE FROM change_log WHERE changed_at < julianday('now') - ? / 86400.0",
+            [older_than_seconds],
+        )
+        return before - db.query("SELECT COUNT(*) AS n FROM change_log")[0]["n"]
+
+
+def status():
+    return db.query(
+        """SELECT COUNT(*) AS entries, MIN(seq) AS first_seq, MAX(seq) AS last_seq,
+            (julianday('now') - MIN(changed_at)) * 86400 AS oldest_seconds
+        FROM change_log"""
+    )[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("status", help="show the size and range of the log")
+    prune_parser = commands.add_parser("prune", help="delete old log rows")
+    prune_parser.add_argument(
+        "--older-than", type=float, default=3600, help="age in seconds (default: 3600)"
+    )
+    args = parser.parse_args()
+
+    if args.command == "status":
+        info = status()
+        if not info["entries"]:
+            print("Change log is empty")
+        else:
+            print(
+                f"{info['entries']} entries, seq {info['first_seq']}..{info['last_seq']}, "
+                f"oldest {info['oldest_seconds']:.0f}s ago"
+            )
+    else:
+        print(f"✓ Pruned {prune(args.older_than)} entries")
+
+
+if __name__ == "__main__":
+    main()
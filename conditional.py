@@ -0,0 +1,151 @@
+"""
+Conditional GET (ETag / 304 Not Modified) for the read-only pages.
+
+A page's ETag is a hash of the data-version signals it depends on, the
+request URL and the per-user parts of the page (user, CSRF token). It is
+computed before the view runs, so when the client's If-None-Match matches,
+the 304 goes out without any of the page's queries or template rendering.
+
+The signals are the version counters in table_counters, which triggers bump
+on every change to movies, ratings, favorites and the dimension tables.
+They are read through one long-lived probe connection and only re-read when
+its PRAGMA data_version shows that another connection has committed since,
+so an unchanged database costs no query at all. Pages can add signals of
+their own, e.g. the rating stats row of a single movie.
+"""
+
+import hashlib
+import sqlite3
+import threading
+from functools import wraps
+
+from flask import make_response, request, session
+
+import db
+import stats
+
+_probe_lock = threading.Lock()
+_probe = None
+_probe_database = None
+
+# (data_version, counters) from the last read through the probe
+_counters = (None, None)
+
+
+def _probe_connection():
+    global _probe, _probe_database
+    if _probe is None or _probe_database != db.DATABASE:
+        if _probe is not None:
+            _probe.close()
+        # Shared by the request threads, always under _probe_lock
+        _probe = sqlite3.connect(
+            f"file:{db.DATABASE}?mode=ro", uri=True, check_same_thread=False
+        )
+        _probe_database = db.DATABASE
+    return _probe
+
+
+def version_counters():
+    """{name: value} of the version counters, re-read only after a commit
+
+    None when the database has no version counters yet.
+    """
+    global _counters
+    with _probe_lock:
+        con = _probe_connection()
+        data_version = con.execute("PRAGMA data_version").fetchone()[0]
+        if _counters[0] != data_version:
+            placeholders = ", ".join("?" * len(stats.VERSION_COUNTERS))
+            rows = con.execute(
+                f"SELECT name, value FROM table_counters WHERE name IN ({placeholders})",
+                stats.VERSION_COUNTERS,
+            )
+            counters = dict(sorted(rows.fetchall()))
+            # Without the counters (an unmigrated database) no page is cacheable
+            if len(counters) < len(stats.VERSION_COUNTERS):
+                counters = None
+            _counters = (data_version, counters)
+        return _counters[1]
+
+
+def movie_signals(movie_id):
+    """The rating stats of one movie, which its detail page shows
+
+    The sum and count change whenever the shown average or count does, with
+    no timestamp resolution to worry about.
+    """
+    with _probe_lock:
+        row = _probe_connection().execute(
+            "SELECT total_ratings, rating_sum FROM movie_rating_stats WHERE movie_id = ?",
+            [movie_id],
+        ).fetchone()
+    return row
+
+
+def _etag(signals):
+    key = repr(
+        (
+            request.full_path,
+            session.get("user_id"),
+            session.get("username"),
+            session.get("csrf_token"),
+            signals,
+        )
+    )
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def conditional(signals):
+    """Answer GET requests with 304 while signals(**view_args) is unchanged
+
+    Requests with pending flash messages always run the view, so the message
+    is shown and consumed. The ETag of a rendered page is computed from the
+    signals read before the view ran: a write that lands while the page is
+    rendered then only causes one unnecessary full response later.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if "_flashes" in session:
+                return view(*args, **kwargs)
+
+            values = signals(**kwargs)
+            if values is None:
+                return view(*args, **kwargs)
+            if request.if_none_match.contains_weak(_etag(values)):
+                response = make_response("", 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            # After the view, since it may have issued a new CSRF token
+            response.set_etag(_etag(values), weak=True)
+            # Per-user pages: the browser keeps them, but always revalidates
+            response.headers["Cache-Control"] = "private, no-cache"
+            response.vary.add("Cookie")
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def list_signals(**view_args):
+    return version_counters()
+
+
+def detail_signals(movie_id):
+    counters = version_counters()
+    if counters is None:
+        return None
+    values = [
+        counters.get("movies_version"),
+        counters.get("dimensions_version"),
+        movie_signals(movie_id),
+    ]
+    # The user's own rating and favorite are part of a logged-in page
+    if "username" in session:
+        values += [counters.get("ratings_version"), counters.get("favorites_version")]
+    return values
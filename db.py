@@ -1,31 +1,305 @@
+import logging
+import os
+import re
 import sqlite3
-from flask import g
+import threading
+import time
+from contextlib import contextmanager
+from flask import g, has_app_context
 
+# Database file; tools (benchmarks, the index advisor) point this elsewhere
+DATABASE = os.getenv("DATABASE_PATH", "database.db")
 
-def get_connection():
-    con = sqlite3.connect("database.db")
-    con.execute("PRAGMA foreign_keys = ON")
+# Per-thread state for code running outside a Flask app context (scripts, tests)
+_local = threading.local()
+
+# Single writer path: writes from this process queue here instead of spinning
+# on SQLite's busy handler, and never hold up the read-only connections
+_write_lock = threading.RLock()
+
+# Named PRAGMA profiles for serving connections. "sqlite-defaults" keeps the
+# bare SQLite behaviour; "serving" is tuned for the large read-heavy catalog.
+PRAGMA_PROFILES = {
+    "sqlite-defaults": {},
+    "serving": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "mmap_size": 268435456,  # 256MB memory-mapped reads
+        "cache_size": -65536,  # 64MB page cache
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,  # ms
+    },
+}
+
+_PRAGMA_CHOICES = {
+    "journal_mode": {"DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"},
+    "synchronous": {"OFF", "NORMAL", "FULL", "EXTRA"},
+    "temp_store": {"DEFAULT", "FILE", "MEMORY"},
+}
+_PRAGMA_INTEGERS = {"mmap_size", "cache_size", "busy_timeout"}
+
+_pragmas = None
+
+# Rows fetched per round trip by stream()
+STREAM_BATCH_SIZE = 500
+
+# Statements slower than this are written to the slow-query log with their plan
+SLOW_QUERY_SECONDS = float(os.getenv("DB_SLOW_QUERY_MS", "100")) / 1000
+
+slow_query_log = logging.getLogger("db.slow")
+if os.getenv("DB_SLOW_QUERY_LOG"):
+    slow_query_log.addHandler(logging.FileHandler(os.getenv("DB_SLOW_QUERY_LOG")))
+
+_SQL_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_SQL_IN_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+
+
+def load_pragma_profile(name=None):
+    """Resolve and validate a PRAGMA profile, applying DB_PRAGMA_<NAME> overrides
+
+    The profile is chosen by name, the DB_PRAGMA_PROFILE environment variable
+    or "serving", in that order. Raises ValueError on unknown profiles, unknown
+    pragmas or invalid values so a bad configuration fails at startup.
+    """
+    name = name or os.getenv("DB_PRAGMA_PROFILE", "serving")
+    if name not in PRAGMA_PROFILES:
+        raise ValueError(
+            f"Unknown PRAGMA profile {name!r}, expected one of {sorted(PRAGMA_PROFILES)}"
+        )
+
+    pragmas = dict(PRAGMA_PROFILES[name])
+    for pragma in sorted(_PRAGMA_CHOICES.keys() | _PRAGMA_INTEGERS):
+        override = os.getenv(f"DB_PRAGMA_{pragma.upper()}")
+        if override:
+            pragmas[pragma] = override
+
+    for pragma, value in pragmas.items():
+        if pragma in _PRAGMA_INTEGERS:
+            try:
+                pragmas[pragma] = int(value)
+            except (TypeError, ValueError):
+                raise ValueError(
+                    f"PRAGMA {pragma} must be an integer, got {value!r}"
+                ) from None
+            if pragma != "cache_size" and pragmas[pragma] < 0:
+                raise ValueError(f"PRAGMA {pragma} must not be negative")
+        elif pragma in _PRAGMA_CHOICES:
+            pragmas[pragma] = str(value).upper()
+            if pragmas[pragma] not in _PRAGMA_CHOICES[pragma]:
+                raise ValueError(
+                    f"PRAGMA {pragma} must be one of {sorted(_PRAGMA_CHOICES[pragma])}, got {value!r}"
+                )
+        else:
+            raise ValueError(f"Unsupported PRAGMA {pragma!r} in profile {name!r}")
+
+    return name, pragmas
+
+
+def configure(profile=None):
+    """Validate the PRAGMA profile once at startup and use it for new connections"""
+    global _pragmas
+    _pragmas = load_pragma_profile(profile)
+    return _pragmas
+
+
+def get_connection(readonly=False):
+    """Open a connection with the configured PRAGMA profile
+
+    Read-only connections use a mode=ro URI plus query_only, so they can never
+    take the write lock; under WAL they keep reading while a writer commits.
+    """
+    if _pragmas is None:
+        configure()
+    if readonly:
+        con = sqlite3.connect(f"file:{DATABASE}?mode=ro", uri=True)
+        con.execute("PRAGMA query_only = ON")
+    else:
+        con = sqlite3.connect(DATABASE)
+        con.execute("PRAGMA foreign_keys = ON")
+    for pragma, value in _pragmas[1].items():
+        # The journal mode is a property of the database file, set by writers
+        if readonly and pragma == "journal_mode":
+            continue
+        con.execute(f"PRAGMA {pragma} = {value}")
     con.row_factory = sqlite3.Row
     return con
 
 
-def execute(sql, params=()):
+def pragma_report():
+    """Configured vs. effective PRAGMA values of a fresh serving connection"""
+    name, pragmas = _pragmas or configure()
     con = get_connection()
     try:
-        result = con.execute(sql, params)
-        con.commit()
-        g.last_insert_id = result.lastrowid
-        return g.last_insert_id
+        report = []
+        for pragma in PRAGMA_PROFILES["serving"]:
+            effective = con.execute(f"PRAGMA {pragma}").fetchone()[0]
+            report.append((pragma, pragmas.get(pragma), effective))
+        return name, report
     finally:
         con.close()
 
 
+def normalize_sql(sql):
+    """Collapse whitespace and replace literals so equal query shapes compare equal"""
+    sql = " ".join(sql.split())
+    sql = _SQL_LITERALS.sub("?", sql)
+    return _SQL_IN_LISTS.sub("(?)", sql).rstrip(";")
+
+
+def _record(con, sql, params, elapsed):
+    """Record a statement in the request's query stats and the slow-query log"""
+    normalized = normalize_sql(sql)
+    if has_app_context():
+        g.setdefault("db_queries", []).append(
+            {"sql": normalized, "seconds": elapsed, "statement": sql, "params": params}
+        )
+
+    if elapsed >= SLOW_QUERY_SECONDS:
+        try:
+            plan = con.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+            plan_text = "\n".join(f"  {row[3]}" for row in plan)
+        except sqlite3.Error as e:
+            plan_text = f"  (no plan: {e})"
+        slow_query_log.warning(
+            "slow query (%.1f ms): %s\n%s", elapsed * 1000, normalized, plan_text
+        )
+
+
+def request_stats():
+    """Query count, total DB time and per-statement timings for the current request"""
+    queries = g.get("db_queries", []) if has_app_context() else []
+    return {
+        "count": len(queries),
+        "seconds": sum(q["seconds"] for q in queries),
+        "queries": queries,
+    }
+
+
+def _state():
+    """Per-request state inside an app context, per-thread state outside it"""
+    return g if has_app_context() else _local
+
+
+@contextmanager
+def _connection(readonly=False):
+    """Reuse the request's connection, or open a short-lived one outside a request
+
+    Reads inside a transaction go to the writer so they see its own changes.
+    """
+    if getattr(_state(), "in_transaction", False):
+        readonly = False
+
+    if has_app_context():
+        key = "db_reader" if readonly else "db_writer"
+        if key not in g:
+            setattr(g, key, get_connection(readonly=readonly))
+        yield g.get(key)
+        return
+
+    con = getattr(_local, "connection", None)
+    if con is not None:
+        yield con
+        return
+
+    con = get_connection(readonly=readonly)
+    try:
+        yield con
+    finally:
+        con.close()
+
+
+def close_connection(exception=None):
+    """Teardown handler: close the connections opened for this request"""
+    for key in ("db_reader", "db_writer"):
+        con = g.pop(key, None)
+        if con is not None:
+            con.close()
+
+
+@contextmanager
+def transaction():
+    """Run the enclosed db.execute/db.query calls as one atomic unit
+
+    BEGIN IMMEDIATE takes the write lock up front, so reads made inside the
+    block (e.g. duplicate checks) cannot race with other writers. Everything
+    is committed once at the end, or rolled back if the block raises. Nested
+    transaction() blocks join the outermost one.
+    """
+    state = _state()
+    if getattr(state, "in_transaction", False):
+        yield
+        return
+
+    with _write_lock, _connection() as con:
+        con.execute("BEGIN IMMEDIATE")
+        state.in_transaction = True
+        if not has_app_context():
+            _local.connection = con
+        try:
+            yield
+            con.commit()
+        except BaseException:
+            con.rollback()
+            raise
+        finally:
+            state.in_transaction = False
+            if not has_app_context():
+                _local.connection = None
+
+
+def execute(sql, params=()):
+    state = _state()
+    with _write_lock, _connection() as con:
+        start = time.perf_counter()
+        in_transaction = getattr(state, "in_transaction", False)
+        try:
+            result = con.execute(sql, params)
+        except sqlite3.Error:
+            # A failed statement (e.g. an IntegrityError the caller handles)
+            # must not leave the implicit transaction open on the connection
+            if not in_transaction and con.in_transaction:
+                con.rollback()
+            raise
+        if not in_transaction:
+            con.commit()
+        _record(con, sql, params, time.perf_counter() - start)
+        state.last_insert_id = result.lastrowid
+        return result.lastrowid
+
+
 def last_insert_id():
-    return g.last_insert_id
+    return _state().last_insert_id
 
 
 def query(sql, params=()):
-    con = get_connection()
-    result = con.execute(sql, params).fetchall()
-    con.close()
-    return result
+    with _connection(readonly=True) as con:
+        start = time.perf_counter()
+        result = con.execute(sql, params).fetchall()
+        _record(con, sql, params, time.perf_counter() - start)
+        return result
+
+
+def stream(sql, params=(), batch_size=None):
+    """Iterate over a result set without materialising it
+
+    Rows are fetched with fetchmany() in batches of batch_size, so memory
+    stays flat regardless of the result size. The connection stays open for
+    as long as the iterator is alive; outside a request it is closed when the
+    iterator is exhausted or closed.
+    """
+    with _connection(readonly=True) as con:
+        # Only time spent inside SQLite counts, not the consumer's work per row
+        start = time.perf_counter()
+        cursor = con.execute(sql, params)
+        elapsed = time.perf_counter() - start
+        try:
+            while True:
+                start = time.perf_counter()
+                rows = cursor.fetchmany(batch_size or STREAM_BATCH_SIZE)
+                elapsed += time.perf_counter() - start
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            cursor.close()
+            _record(con, sql, params, elapsed)
@@ -1,4 +1,5 @@
 import db
+import lookups
 
 
 def get_directors():
@@ -11,4 +12,5 @@ def add_director(director_name):
     """Lisää uusi ohjaaja"""
     sql = "INSERT INTO directors (name) VALUES (?)"
     director_id = db.execute(sql, [director_name])
+    lookups.invalidate()
     return director_id
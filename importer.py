@@ -0,0 +1,369 @@
+"""
+Bulk importer for movies, ratings and favorites from CSV or JSONL files.
+
+Meant for moving large diaries from other tools into the database without
+going through the web forms:
+
+    $ python importer.py --movies movies.csv --ratings ratings.jsonl --favorites favorites.csv
+
+Files are streamed record by record, so memory stays flat however large they
+are. Category, director, platform, user and movie lookups are resolved from
+in-memory maps, and rows are inserted with executemany in large batches,
+one explicit transaction per batch.
+
+Triggers are dropped for the duration of the load (like seed.py does) and
+recreated afterwards; the derived tables (row counters, rating and user
+statistics, the search index) are then rebuilt in one set-based pass each.
+With --bulk-load the secondary indexes from schema.sql are dropped as well
+and rebuilt once at the end, which pays off when the import is large
+compared to what is already in the database. If an import is interrupted,
+running `python importer.py` again without files restores the indexes and
+triggers and rebuilds the derived tables.
+
+Record fields (CSV header names or JSON keys):
+
+    movies:    title, year, duration, owner, category, director, platform, created_at
+    ratings:   user, title, rating, watched, watch_date, watched_with, review, created_at
+    favorites: user, title
+
+A rating without a watched field counts as watched when it has a rating or
+a watch_date (the dashboard lists watched movies only); give watched
+explicitly to import a rating for an unwatched movie.
+
+A movie is identified by its title alone, compared case-insensitively like
+movies.add_movie does, so an import never creates a title the web app would
+treat as a duplicate. Records for unknown users or movies, or with a value
+that is not a number where one is expected, are skipped and counted in the
+summary.
+"""
+
+import argparse
+import csv
+import itertools
+import json
+import os
+import string
+import sys
+import time
+from collections import Counter
+from datetime import datetime
+
+import db
+import seed
+import stats
+
+BATCH_SIZE = 50000
+
+FILE_TYPES = (".csv", ".jsonl", ".ndjson")
+
+# add_movie compares titles with SQLite's NOCASE, which folds ASCII letters only
+_ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+
+def read_records(path):
+    """Stream dicts from a .csv or .jsonl/.ndjson file"""
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if extension not in FILE_TYPES:
+            raise ValueError(f"Unsupported file type {extension!r}, expected .csv or .jsonl")
+        if extension == ".csv":
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def _text(record, name):
+    value = record.get(name)
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def _int(record, name):
+    value = _text(record, name)
+    return int(float(value)) if value is not None else None
+
+
+def _float(record, name):
+    value = _text(record, name)
+    return float(value) if value is not None else None
+
+
+def _bool(record, name, default=False):
+    value = _text(record, name)
+    if value is None:
+        return int(default)
+    return int(value.lower() in ("1", "true", "yes", "x"))
+
+
+def _movie_key(title):
+    return title.translate(_ASCII_LOWER)
+
+
+class Importer:
+    """Holds the connection and the name -> id maps for one import run"""
+
+    def __init__(self, con, default_user=None, batch_size=BATCH_SIZE):
+        self.con = con
+        self.batch_size = batch_size
+        self.default_user = default_user
+        self.stats = Counter()
+
+        self.users = dict(con.execute("SELECT username, id FROM users"))
+        self.names = {
+            table: {name.lower(): id for name, id in con.execute(f"SELECT name, id FROM {table}")}
+            for table in ("categories", "directors", "streaming_platforms")
+        }
+        self.movies = {}
+        for id, title in con.execute("SELECT id, title FROM movies ORDER BY id"):
+            self.movies.setdefault(_movie_key(title), id)
+
+    def _name_id(self, table, name):
+        """Id for a category/director/platform name, created on first use"""
+        if name is None:
+            return None
+        ids = self.names[table]
+        if name.lower() not in ids:
+            cursor = self.con.execute(f"INSERT INTO {table} (name) VALUES (?)", [name])
+            ids[name.lower()] = cursor.lastrowid
+            self.stats[f"new {table}"] += 1
+        return ids[name.lower()]
+
+    def _user_id(self, record):
+        return self.users.get(_text(record, "user") or self.default_user)
+
+    def _batches(self, path, label, convert):
+        """Convert and yield records in batches, each inside its own transaction"""
+        records = read_records(path)
+        done = 0
+        while True:
+            chunk = list(itertools.islice(records, self.batch_size))
+            if not chunk:
+                break
+            self.con.execute("BEGIN")
+            try:
+                rows = []
+                for record in chunk:
+                    row = convert(record)
+                    if row is not None:
+                        rows.append(row)
+                yield rows
+                self.con.execute("COMMIT")
+            except BaseException:
+                self.con.execute("ROLLBACK")
+                raise
+            done += len(chunk)
+            sys.stdout.write(f"\r{label}: {done} records read")
+            sys.stdout.flush()
+        print()
+
+    def _skip(self, kind, reason):
+        self.stats[f"{kind} skipped ({reason})"] += 1
+        return None
+
+    def changed_anything(self):
+        """Whether any row was written (imported or created on first use)"""
+        return any(count for name, count in self.stats.items() if "skipped" not in name)
+
+    def _movie_row(self, record):
+        title = _text(record, "title")
+        if title is None:
+            return self._skip("movies", "no title")
+        key = _movie_key(title)
+        if key in self.movies:
+            return self._skip("movies", "already exists")
+        try:
+            year = _int(record, "year")
+        except (ValueError, OverflowError):
+            return self._skip("movies", "bad year")
+        try:
+            duration = _int(record, "duration")
+        except (ValueError, OverflowError):
+            return self._skip("movies", "bad duration")
+        owner_id = self.users.get(_text(record, "owner") or self.default_user)
+        if owner_id is None:
+            return self._skip("movies", "unknown owner")
+
+        # Claimed before the insert so duplicates within the file are caught
+        self.movies[key] = None
+        return (
+            title,
+            year,
+            duration,
+            owner_id,
+            self._name_id("categories", _text(record, "category")),
+            self._name_id("streaming_platforms", _text(record, "platform")),
+            self._name_id("directors", _text(record, "director")),
+            _text(record, "created_at") or datetime.now(),
+        )
+
+    def import_movies(self, path):
+        for rows in self._batches(path, "Importing movies", self._movie_row):
+            last_id = self.con.execute("SELECT COALESCE(MAX(id), 0) FROM movies").fetchone()[0]
+            self.con.executemany(
+                """INSERT INTO movies
+                (title, year, duration, owner_id, category_id, streaming_platform_id, director_id, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                rows,
+            )
+            # One writer inside the transaction, so the new ids follow last_id
+            for id, title in self.con.execute(
+                "SELECT id, title FROM movies WHERE id > ?", [last_id]
+            ):
+                self.movies[_movie_key(title)] = id
+            self.stats["movies imported"] += len(rows)
+
+    def _movie_id(self, record):
+        title = _text(record, "title")
+        if title is None:
+            return None
+        return self.movies.get(_movie_key(title))
+
+    def _rating_row(self, record):
+        user_id = self._user_id(record)
+        if user_id is None:
+            return self._skip("ratings", "unknown user")
+        movie_id = self._movie_id(record)
+        if movie_id is None:
+            return self._skip("ratings", "unknown movie")
+        try:
+            rating = _float(record, "rating")
+        except ValueError:
+            return self._skip("ratings", "bad rating")
+        if rating is not None and not 1 <= rating <= 5:
+            return self._skip("ratings", "rating out of range")
+        watch_date = _text(record, "watch_date")
+        return (
+            user_id,
+            movie_id,
+            rating,
+            # A rated or dated movie was watched, like the web form records it
+            _bool(record, "watched", default=rating is not None or watch_date is not None),
+            watch_date,
+            _text(record, "watched_with"),
+            _text(record, "review"),
+            _text(record, "created_at") or datetime.now(),
+        )
+
+    def import_ratings(self, path):
+        for rows in self._batches(path, "Importing ratings", self._rating_row):
+            cursor = self.con.executemany(
+                """INSERT INTO user_ratings
+                (user_id, movie_id, rating, watched, watch_date, watched_with, review, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(user_id, movie_id) DO UPDATE SET
+                    rating = excluded.rating,
+                    watched = excluded.watched,
+                    watch_date = excluded.watch_date,
+                    watched_with = excluded.watched_with,
+                    review = excluded.review""",
+                rows,
+            )
+            self.stats["ratings imported"] += cursor.rowcount
+
+    def _favorite_row(self, record):
+        user_id = self._user_id(record)
+        if user_id is None:
+            return self._skip("favorites", "unknown user")
+        movie_id = self._movie_id(record)
+        if movie_id is None:
+            return self._skip("favorites", "unknown movie")
+        return (user_id, movie_id)
+
+    def import_favorites(self, path):
+        for rows in self._batches(path, "Importing favorites", self._favorite_row):
+            cursor = self.con.executemany(
+                """INSERT INTO user_favorites (user_id, movie_id) VALUES (?, ?)
+                ON CONFLICT(user_id, movie_id) DO NOTHING""",
+                rows,
+            )
+            # Favorites that already existed are not counted
+            self.stats["favorites imported"] += cursor.rowcount
+
+
+def restore_schema():
+    """Recreate the indexes and triggers dropped for the load"""
+    con = seed.get_connection()
+    seed.recreate_indexes_from_schema(con)
+    seed.recreate_triggers_from_schema(con)
+    con.close()
+
+
+def rebuild_derived_tables():
+    """Restore indexes and triggers and rebuild everything the triggers maintain"""
+    restore_schema()
+    stats.rebuild()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--movies", help="movies file (.csv or .jsonl)")
+    parser.add_argument("--ratings", help="ratings file (.csv or .jsonl)")
+    parser.add_argument("--favorites", help="favorites file (.csv or .jsonl)")
+    parser.add_argument("--user", help="username for records without a user/owner field")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="rows per transaction")
+    parser.add_argument("--database", default=seed.DATABASE, help="database file")
+    parser.add_argument(
+        "--bulk-load",
+        action="store_true",
+        help="drop the secondary indexes during the import and rebuild them afterwards",
+    )
+    args = parser.parse_args()
+
+    # Checked before anything is dropped, so a typo leaves the database alone
+    files = [path for path in (args.movies, args.ratings, args.favorites) if path]
+    for path in files:
+        if not os.path.isfile(path):
+            parser.error(f"no such file: {path}")
+        if os.path.splitext(path)[1].lower() not in FILE_TYPES:
+            parser.error(f"unsupported file type: {path} (expected .csv or .jsonl)")
+
+    seed.DATABASE = db.DATABASE = args.database
+    start = time.perf_counter()
+
+    con = seed.get_connection()
+    if args.user and not con.execute(
+        "SELECT 1 FROM users WHERE username = ?", [args.user]
+    ).fetchone():
+        con.close()
+        sys.exit(f"✗ Unknown user {args.user!r}")
+
+    if not files:
+        # Nothing to import: repair what an interrupted import left behind
+        con.close()
+        rebuild_derived_tables()
+        print(f"\n✓ Indexes, triggers and derived tables restored in {time.perf_counter() - start:.1f}s")
+        return
+
+    con.isolation_level = None
+    importer = None
+    try:
+        seed.disable_all_triggers(con)
+        if args.bulk_load:
+            seed.drop_secondary_indexes(con)
+        importer = Importer(con, default_user=args.user, batch_size=args.batch_size)
+
+        # Movies first, so ratings and favorites in the same run can refer to them
+        if args.movies:
+            importer.import_movies(args.movies)
+        if args.ratings:
+            importer.import_ratings(args.ratings)
+        if args.favorites:
+            importer.import_favorites(args.favorites)
+    finally:
+        con.close()
+        if importer is not None and importer.changed_anything():
+            rebuild_derived_tables()
+        else:
+            restore_schema()
+
+    print(f"\n✓ Import finished in {time.perf_counter() - start:.1f}s")
+    for name, count in sorted(importer.stats.items()):
+        print(f"  • {name}: {count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,400 @@
+"""
+Index advisor and query-plan regression guard.
+
+Drives the application's read paths (the routes in app.py and through them
+movies.py and review.py, including the full /search filter x sort matrix)
+and the write functions of movies.py and review.py against a seeded
+database, collects every distinct query shape that db.query/db.stream/
+db.execute executed, and runs EXPLAIN QUERY PLAN on each one. The writes run
+inside one transaction that is rolled back, so --database is left unchanged;
+the plans of the statements inside triggers are not covered.
+
+Full scans of the large tables (a SCAN without a seek, even one that walks
+an index) and temp B-tree sorts are flagged and an index is suggested for
+them. With --check the flags are compared against the committed baseline
+(query_plans.json) and the script exits with status 1 when a query shape
+has gained a scan or sort that the baseline does not have, so it can run
+as a test:
+
+    $ python index_advisor.py --check
+
+Every baseline entry carries a "reason" saying why its scan or sort is
+accepted; --update-baseline keeps the reasons of the shapes still flagged
+and leaves new ones empty, which --check reports until they are filled in.
+
+Without --database a small fixture database is built from schema.sql, so
+the plans (SQLite's planner has no statistics there) are reproducible.
+"""
+
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import re
+import sys
+import tempfile
+
+import db
+import seed
+
+BASELINE_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "query_plans.json"
+)
+
+# Tables large enough that a full scan on a hot path is a problem
+LARGE_TABLES = {"movies", "user_ratings", "user_favorites", "movie_rating_stats", "user_stats"}
+
+SEARCH_SORTS = ["relevance", "title", "year", "rating", "date_added"]
+
+
+def search_urls():
+    """Every combination of the /search filters and sorts"""
+    urls = []
+    for query, genre, year, platform, rating, sort in itertools.product(
+        ["", "dark"],
+        ["", "action"],
+        ["", "2010s"],
+        ["", "netflix"],
+        ["", "4"],
+        SEARCH_SORTS,
+    ):
+        urls.append(
+            f"/search?q={query}&genre={genre}&year={year}&platform={platform}"
+            f"&rating={rating}&sort={sort}"
+        )
+    return urls
+
+
+class _RollBack(Exception):
+    """Raised to roll the write workload back"""
+
+
+def _write_workload(user_id, other_user_id, movie_id, title, dimension_ids):
+    """(source, call) for the write functions of movies.py and review.py
+
+    user_id adds, edits and deletes a movie of its own; other_user_id rates,
+    reviews and drops movie_id (titled title), which it does not own.
+    dimension_ids are existing category, platform and director ids.
+    """
+    import movies
+    import review
+
+    def form(title, favorite, **extra):
+        return dict(
+            title=title,
+            year=2020,
+            duration=120,
+            category_id=dimension_ids["categories"],
+            streaming_platform_id=dimension_ids["streaming_platforms"],
+            director_id=dimension_ids["directors"],
+            review="Advisor review",
+            rating=4,
+            watch_date="2024-01-01",
+            watched_with=None,
+            favorite=favorite,
+            **extra,
+        )
+
+    new_title = "Index advisor movie"
+    new = {}
+
+    def add_new():
+        new["id"] = movies.add_movie(user_id, form(new_title, True))
+
+    return [
+        ("movies.add_movie (new)", add_new),
+        ("movies.add_movie (existing)", lambda: movies.add_movie(other_user_id, form(title, False))),
+        ("review.add_review", lambda: review.add_review(other_user_id, form(title, True, id=movie_id))),
+        ("movies.update_movie", lambda: movies.update_movie(other_user_id, form(title, True, id=movie_id))),
+        (
+            "movies.update_movie_owner",
+            lambda: movies.update_movie_owner(user_id, form(new_title, False, id=new["id"])),
+        ),
+        ("movies.add_to_favorites", lambda: movies.add_to_favorites(user_id, movie_id)),
+        ("movies.remove_from_favorites", lambda: movies.remove_from_favorites(user_id, movie_id)),
+        ("movies.delete_movie (rating)", lambda: movies.delete_movie(other_user_id, movie_id)),
+        ("movies.delete_movie (owner)", lambda: movies.delete_movie(user_id, new["id"])),
+    ]
+
+
+def collect_query_shapes():
+    """Run the read routes and the write functions
+
+    Returns {normalized sql: (statement, params, [sources])}.
+    """
+    # Imported here so db.DATABASE is already pointing at the target database
+    from flask import g
+    import app as application
+
+    shapes = {}
+
+    def record_shapes(source):
+        for record in g.pop("db_queries", []):
+            shape = shapes.setdefault(
+                record["sql"], (record["statement"], record["params"], set())
+            )
+            shape[2].add(source)
+
+    def capture(response):
+        record_shapes(g.advisor_source)
+        return response
+
+    def tag_source():
+        g.advisor_source = application.request.path
+
+    application.app.before_request(tag_source)
+    application.app.after_request(capture)
+    client = application.app.test_client()
+
+    user = db.query("SELECT id, username FROM users ORDER BY id LIMIT 1")[0]
+    movie = db.query("SELECT id, title FROM movies ORDER BY id LIMIT 1")[0]
+    movie_id = movie["id"]
+    with client.session_transaction() as session:
+        session["username"] = user["username"]
+        session["user_id"] = user["id"]
+
+    first_page = client.get("/")
+    cursor_link = re.search(r'href="(/\?after=[^"]+)"', first_page.get_data(as_text=True))
+    urls = ["/", "/?page=3", f"/movie/{movie_id}", "/dashboard", "/favorites"]
+    if cursor_link:
+        urls.append(cursor_link.group(1).replace("&amp;", "&"))
+    urls += search_urls()
+
+    for url in urls:
+        response = client.get(url)
+        if response.status_code != 200:
+            raise RuntimeError(f"GET {url} returned {response.status_code}")
+
+    other_user_id = db.query(
+        "SELECT id FROM users WHERE id != ? ORDER BY id LIMIT 1", [user["id"]]
+    )[0]["id"]
+    dimension_ids = {
+        table: db.query(f"SELECT MIN(id) AS id FROM {table}")[0]["id"]
+        for table in ("categories", "streaming_platforms", "directors")
+    }
+    with application.app.test_request_context():
+        try:
+            with db.transaction():
+                workload = _write_workload(
+                    user["id"], other_user_id, movie_id, movie["title"], dimension_ids
+                )
+                for source, call in workload:
+                    call()
+                    record_shapes(source)
+                raise _RollBack
+        except _RollBack:
+            pass
+    return shapes
+
+
+def explain(con, statement, params):
+    """EXPLAIN QUERY PLAN rows as (id, parent, detail)"""
+    return [
+        (row[0], row[1], row[3])
+        for row in con.execute(f"EXPLAIN QUERY PLAN {statement}", params)
+    ]
+
+
+def _table_aliases(statement):
+    """{alias or name: table} for every table in FROM/JOIN clauses"""
+    aliases = {}
+    for table, alias in re.findall(
+        r"\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(?!ON\b|WHERE\b|LEFT\b|JOIN\b|GROUP\b|ORDER\b|LIMIT\b)(\w+))?",
+        statement,
+        re.I,
+    ):
+        aliases[table] = table
+        if alias:
+            aliases[alias] = table
+    return aliases
+
+
+def analyse_plan(statement, plan):
+    """Flags for a plan: unconstrained scans of large tables and temp B-tree sorts
+
+    A sort is not flagged when its input is a CTE of the statement itself
+    (e.g. the LIMITed page rows of the search query being put back in order);
+    that sort is bounded by the page size.
+    """
+    aliases = _table_aliases(statement)
+    ctes = set(re.findall(r"(?:\bWITH|,)\s+(\w+) AS \(", statement))
+    flags = []
+    for _, parent, detail in plan:
+        match = re.match(r"SCAN (\w+)", detail)
+        if match and "VIRTUAL TABLE" not in detail:
+            table = aliases.get(match.group(1), match.group(1))
+            # SCAN reads the whole table, in index order or not; only a
+            # SEARCH seeks on an equality or range constraint
+            if table in LARGE_TABLES:
+                flags.append(f"full scan: {table}")
+
+        if detail.startswith("USE TEMP B-TREE FOR") and "ORDER BY" in detail:
+            inputs = [
+                re.match(r"SCAN \(?([\w-]+)", d).group(1)
+                for _, p, d in plan
+                if p == parent and d.startswith("SCAN ")
+            ]
+            if inputs and all(name in ctes for name in inputs):
+                continue
+            if "RIGHT PART OF ORDER BY" in detail:
+                flags.append("partial temp b-tree sort")
+            else:
+                flags.append("temp b-tree sort")
+    return sorted(set(flags))
+
+
+def existing_indexes(con, table="movies"):
+    """Column lists of the indexes already on a table"""
+    return [
+        tuple(column["name"] for column in con.execute(f"PRAGMA index_info({index['name']})"))
+        for index in con.execute(f"PRAGMA index_list({table})")
+    ]
+
+
+def suggest_index(statement, plan, existing):
+    """Heuristic composite index for a flagged query on movies
+
+    Equality predicates first, then the ORDER BY columns, which lets SQLite
+    both seek and read rows already in order. Nothing is suggested when the
+    rows come from the FTS index (no B-tree index can order those) or when an
+    existing index already leads with the same columns.
+    """
+    if any("VIRTUAL TABLE" in detail for _, _, detail in plan):
+        return None
+    # Predicates inside an OR group cannot lead an index
+    conjuncts = re.sub(r"\([^()]*\bOR\b[^()]*\)", "", statement)
+    equality = re.findall(r"\bm\.(\w+) = \?", conjuncts)
+    order_match = re.search(r"ORDER BY (.*?)(?:LIMIT|$)", statement, re.S)
+    order = re.findall(r"\bm\.(\w+)", order_match.group(1)) if order_match else []
+    columns = tuple(dict.fromkeys(equality + order))
+    if not columns or any(index[: len(columns)] == columns for index in existing):
+        return None
+    name = "idx_movies_" + "_".join(columns)
+    return f"CREATE INDEX {name} ON movies({', '.join(columns)});"
+
+
+def build_report(shapes):
+    con = db.get_connection(readonly=True)
+    report = {}
+    try:
+        existing = existing_indexes(con)
+        for shape, (statement, params, sources) in sorted(shapes.items()):
+            plan = explain(con, statement, params)
+            flags = analyse_plan(statement, plan)
+            report[shape] = {
+                "sources": sorted(sources),
+                "plan": [detail for _, _, detail in plan],
+                "flags": flags,
+                "suggestion": suggest_index(statement, plan, existing) if flags else None,
+            }
+    finally:
+        con.close()
+    return report
+
+
+def print_report(report):
+    flagged = {shape: entry for shape, entry in report.items() if entry["flags"]}
+    print(f"{len(report)} query shapes, {len(flagged)} flagged\n")
+    for shape, entry in flagged.items():
+        print(f"[{', '.join(entry['flags'])}] from {', '.join(entry['sources'])}")
+        print(f"  {shape[:200]}")
+        for detail in entry["plan"]:
+            print(f"    {detail}")
+        if entry["suggestion"]:
+            print(f"  suggestion: {entry['suggestion']}")
+        print()
+
+
+def load_baseline():
+    """{shape: {"flags": [...], "reason": str}}; {} before the first baseline"""
+    if not os.path.exists(BASELINE_PATH):
+        return {}
+    with open(BASELINE_PATH, "r") as f:
+        return json.load(f)
+
+
+def update_baseline(report):
+    """Record the current flags, keeping the reasons of shapes still flagged"""
+    old = load_baseline()
+    baseline = {
+        shape: {
+            "flags": entry["flags"],
+            "reason": old.get(shape, {}).get("reason", ""),
+        }
+        for shape, entry in report.items()
+        if entry["flags"]
+    }
+    with open(BASELINE_PATH, "w") as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+        f.write("\n")
+    return [shape for shape, entry in baseline.items() if not entry["reason"]]
+
+
+def check_against_baseline(report):
+    """Shapes whose flags are not covered by a justified baseline entry
+
+    [] means no regression. A shape whose baseline entry has no reason
+    counts with all of its flags.
+    """
+    baseline = load_baseline()
+    regressions = []
+    for shape, entry in report.items():
+        accepted = baseline.get(shape, {})
+        if not accepted.get("reason"):
+            accepted = {}
+        new_flags = set(entry["flags"]) - set(accepted.get("flags", []))
+        if new_flags:
+            regressions.append((shape, sorted(new_flags), entry))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--database", help="seeded database to analyse (default: build a fixture)")
+    parser.add_argument("--check", action="store_true", help="fail on plans that regressed from the baseline")
+    parser.add_argument("--update-baseline", action="store_true", help="record the current flags as the baseline")
+    parser.add_argument("--json", action="store_true", help="print the full report as JSON")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.database:
+            db.DATABASE = args.database
+        else:
+            db.DATABASE = os.path.join(tmp, "advisor.db")
+            with contextlib.redirect_stdout(io.StringIO()):
+                seed.build_fixture_database(db.DATABASE)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            shapes = collect_query_shapes()
+        report = build_report(shapes)
+
+    if args.update_baseline:
+        unjustified = update_baseline(report)
+        print(f"✓ Baseline written to {BASELINE_PATH}")
+        if unjustified:
+            print(f"  {len(unjustified)} entries need a reason before --check accepts them")
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+    if args.check:
+        regressions = check_against_baseline(report)
+        if regressions:
+            baseline = load_baseline()
+            print(f"✗ {len(regressions)} query shape(s) regressed:")
+            for shape, flags, entry in regressions:
+                print(f"  [{', '.join(flags)}] {shape[:200]}")
+                if shape in baseline:
+                    print("    baseline entry has no reason")
+                if entry["suggestion"]:
+                    print(f"    suggestion: {entry['suggestion']}")
+            sys.exit(1)
+        print("✓ No query plan regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Process-local cache of the small dimension tables: categories, streaming
+platforms and directors.
+
+The forms and the search filters need these tables on almost every request,
+but they change rarely. Each process keeps them in memory with id -> name and
+lowercased name -> id maps, so lookups are dictionary hits.
+
+The cache is invalidated directly by add_category/add_platform/add_director
+in this process, and per table across processes through the change log
+(changes.py), which is polled before every lookup.
+"""
+
+import threading
+
+import changes
+import db
+
+TABLES = ("categories", "streaming_platforms", "directors")
+
+# {table: {"rows": [...], "names": {id: name}, "ids": {name: id}}}
+_cache = {}
+_lock = threading.Lock()
+
+# Bumped by every eviction, so a load that raced with one is not stored
+_generation = 0
+
+
+def _evict(tables):
+    global _generation
+    with _lock:
+        _generation += 1
+        for table in TABLES if tables is None else tables:
+            _cache.pop(table, None)
+
+
+changes.subscribe("dimension", _evict)
+
+
+def _load(table):
+    changes.poll()
+    entry = _cache.get(table)
+    if entry is None:
+        generation = _generation
+        rows = db.query(f"SELECT id, name FROM {table}")
+        entry = {
+            "rows": rows,
+            "names": {row["id"]: row["name"] for row in rows},
+            "ids": {row["name"].lower(): row["id"] for row in rows},
+        }
+        # Stored whole, so concurrent requests never see a half-built entry
+        with _lock:
+            if generation == _generation:
+                _cache[table] = entry
+    return entry
+
+
+def get_rows(table):
+    """All (id, name) rows of a dimension table"""
+    return _load(table)["rows"]
+
+
+def get_name(table, entity_id):
+    return _load(table)["names"].get(entity_id)
+
+
+def get_id(table, name):
+    """Id for a name, compared case-insensitively; None if there is none"""
+    if name is None:
+        return None
+    return _load(table)["ids"].get(name.lower())
+
+
+def invalidate():
+    """Drop this process's cache after a write to one of the tables"""
+    _evict(None)
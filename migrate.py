@@ -0,0 +1,56 @@
+"""
+Apply pending schema migrations to an existing database.
+
+Migrations live in migrations/NNN_name.sql and are applied in order. The
+number of the last applied migration is kept in PRAGMA user_version;
+schema.sql sets it to the latest number, so a freshly created database
+has nothing to migrate.
+"""
+
+import os
+import re
+import sqlite3
+import sys
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+
+
+def get_migrations():
+    """List (number, path) of all migration files in order"""
+    migrations = []
+    for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+        match = re.match(r"(\d+)_.*\.sql$", filename)
+        if match:
+            migrations.append((int(match.group(1)), os.path.join(MIGRATIONS_DIR, filename)))
+    return migrations
+
+
+def migrate(database="database.db"):
+    """Apply every migration newer than the database's user_version"""
+    con = sqlite3.connect(database)
+    try:
+        current = con.execute("PRAGMA user_version").fetchone()[0]
+        pending = [(n, path) for n, path in get_migrations() if n > current]
+        if not pending:
+            print(f"✓ Database is up to date (version {current})")
+            return
+
+        for number, path in pending:
+            with open(path, "r") as f:
+                sql = f.read()
+            # executescript commits on its own, so the migration and the
+            # version bump are wrapped in one explicit transaction
+            con.executescript(
+                f"BEGIN;\n{sql}\nPRAGMA user_version = {number};\nCOMMIT;"
+            )
+            print(f"✓ Applied {os.path.basename(path)}")
+    except sqlite3.Error:
+        if con.in_transaction:
+            con.rollback()
+        raise
+    finally:
+        con.close()
+
+
+if __name__ == "__main__":
+    migrate(sys.argv[1] if len(sys.argv) > 1 else "database.db")
@@ -0,0 +1,93 @@
+-- RIVIMÄÄRÄLASKURIT (triggerit ylläpitävät, korvaavat COUNT(*)-kyselyt)
+CREATE TABLE table_counters (
+  name TEXT PRIMARY KEY,
+  value INTEGER NOT NULL DEFAULT 0
+);
+
+INSERT INTO table_counters (name, value) VALUES ('movies', 0);
+
+CREATE TABLE user_counters (
+  user_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+  owned_movies INTEGER NOT NULL DEFAULT 0,
+  watched_movies INTEGER NOT NULL DEFAULT 0,
+  favorite_movies INTEGER NOT NULL DEFAULT 0
+);
+
+-- TRIGGERIT RIVIMÄÄRÄLASKUREILLE (O(1) päivitys per rivi)
+CREATE TRIGGER count_movies_after_insert
+AFTER INSERT ON movies
+FOR EACH ROW
+BEGIN
+  UPDATE table_counters SET value = value + 1 WHERE name = 'movies';
+  INSERT INTO user_counters (user_id, owned_movies) VALUES (NEW.owner_id, 1)
+  ON CONFLICT(user_id) DO UPDATE SET owned_movies = owned_movies + 1;
+END;
+
+CREATE TRIGGER count_movies_after_delete
+AFTER DELETE ON movies
+FOR EACH ROW
+BEGIN
+  UPDATE table_counters SET value = value - 1 WHERE name = 'movies';
+  UPDATE user_counters SET owned_movies = owned_movies - 1 WHERE user_id = OLD.owner_id;
+END;
+
+CREATE TRIGGER count_movies_after_owner_update
+AFTER UPDATE OF owner_id ON movies
+FOR EACH ROW WHEN NEW.owner_id IS NOT OLD.owner_id
+BEGIN
+  UPDATE user_counters SET owned_movies = owned_movies - 1 WHERE user_id = OLD.owner_id;
+  INSERT INTO user_counters (user_id, owned_movies) VALUES (NEW.owner_id, 1)
+  ON CONFLICT(user_id) DO UPDATE SET owned_movies = owned_movies + 1;
+END;
+
+CREATE TRIGGER count_watched_after_insert
+AFTER INSERT ON user_ratings
+FOR EACH ROW WHEN NEW.watched
+BEGIN
+  INSERT INTO user_counters (user_id, watched_movies) VALUES (NEW.user_id, 1)
+  ON CONFLICT(user_id) DO UPDATE SET watched_movies = watched_movies + 1;
+END;
+
+CREATE TRIGGER count_watched_after_delete
+AFTER DELETE ON user_ratings
+FOR EACH ROW WHEN OLD.watched
+BEGIN
+  UPDATE user_counters SET watched_movies = watched_movies - 1 WHERE user_id = OLD.user_id;
+END;
+
+CREATE TRIGGER count_watched_after_update
+AFTER UPDATE OF user_id, watched ON user_ratings
+FOR EACH ROW
+BEGIN
+  UPDATE user_counters SET watched_movies = watched_movies - 1
+  WHERE user_id = OLD.user_id AND OLD.watched;
+  INSERT INTO user_counters (user_id, watched_movies)
+  SELECT NEW.user_id, 1 WHERE NEW.watched
+  ON CONFLICT(user_id) DO UPDATE SET watched_movies = watched_movies + 1;
+END;
+
+CREATE TRIGGER count_favorites_after_insert
+AFTER INSERT ON user_favorites
+FOR EACH ROW
+BEGIN
+  INSERT INTO user_counters (user_id, favorite_movies) VALUES (NEW.user_id, 1)
+  ON CONFLICT(user_id) DO UPDATE SET favorite_movies = favorite_movies + 1;
+END;
+
+CREATE TRIGGER count_favorites_after_delete
+AFTER DELETE ON user_favorites
+FOR EACH ROW
+BEGIN
+  UPDATE user_counters SET favorite_movies = favorite_movies - 1 WHERE user_id = OLD.user_id;
+END;
+
+-- Alkuarvot olemassa olevasta datasta
+UPDATE table_counters SET value = (SELECT COUNT(*) FROM movies) WHERE name = 'movies';
+
+INSERT INTO user_counters (user_id, owned_movies, watched_movies, favorite_movies)
+SELECT
+  u.id,
+  (SELECT COUNT(*) FROM movies m WHERE m.owner_id = u.id),
+  (SELECT COUNT(*) FROM user_ratings ur WHERE ur.user_id = u.id AND ur.watched),
+  (SELECT COUNT(*) FROM user_favorites uf WHERE uf.user_id = u.id)
+FROM users u;
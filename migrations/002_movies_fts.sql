@@ -0,0 +1,63 @@
+-- KOKOTEKSTIHAKU (FTS5: nimi, ohjaaja ja genre, rowid = movies.id)
+CREATE VIRTUAL TABLE movies_fts USING fts5(
+  title,
+  director,
+  genre,
+  tokenize = 'unicode61 remove_diacritics 2',
+  prefix = '2 3'
+);
+
+-- TRIGGERIT KOKOTEKSTIHAKUINDEKSILLE
+CREATE TRIGGER movies_fts_after_insert
+AFTER INSERT ON movies
+FOR EACH ROW
+BEGIN
+  INSERT INTO movies_fts (rowid, title, director, genre)
+  VALUES (
+    NEW.id,
+    NEW.title,
+    (SELECT name FROM directors WHERE id = NEW.director_id),
+    (SELECT name FROM categories WHERE id = NEW.category_id)
+  );
+END;
+
+CREATE TRIGGER movies_fts_after_update
+AFTER UPDATE OF title, director_id, category_id ON movies
+FOR EACH ROW
+BEGIN
+  UPDATE movies_fts
+  SET title = NEW.title,
+      director = (SELECT name FROM directors WHERE id = NEW.director_id),
+      genre = (SELECT name FROM categories WHERE id = NEW.category_id)
+  WHERE rowid = NEW.id;
+END;
+
+CREATE TRIGGER movies_fts_after_delete
+AFTER DELETE ON movies
+FOR EACH ROW
+BEGIN
+  DELETE FROM movies_fts WHERE rowid = OLD.id;
+END;
+
+CREATE TRIGGER movies_fts_after_director_rename
+AFTER UPDATE OF name ON directors
+FOR EACH ROW
+BEGIN
+  UPDATE movies_fts SET director = NEW.name
+  WHERE rowid IN (SELECT id FROM movies WHERE director_id = NEW.id);
+END;
+
+CREATE TRIGGER movies_fts_after_category_rename
+AFTER UPDATE OF name ON categories
+FOR EACH ROW
+BEGIN
+  UPDATE movies_fts SET genre = NEW.name
+  WHERE rowid IN (SELECT id FROM movies WHERE category_id = NEW.id);
+END;
+
+-- Olemassa olevien elokuvien indeksointi
+INSERT INTO movies_fts (rowid, title, director, genre)
+SELECT m.id, m.title, d.name, c.name
+FROM movies m
+LEFT JOIN directors d ON m.director_id = d.id
+LEFT JOIN categories c ON m.category_id = c.id;
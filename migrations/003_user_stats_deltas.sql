@@ -0,0 +1,239 @@
+-- KÄYTTÄJÄTILASTOJEN DELTA-PÄIVITYS
+-- Vanhat triggerit laskivat käyttäjän koko user_stats-rivin uudelleen joka
+-- muutoksella, ja user_ratings x user_favorites -liitos monisti summat.
+DROP TRIGGER IF EXISTS update_user_stats_after_favorite_insert;
+DROP TRIGGER IF EXISTS update_user_stats_after_favorite_delete;
+DROP TRIGGER IF EXISTS update_movie_stats_after_insert;
+DROP TRIGGER IF EXISTS update_movie_stats_after_update;
+DROP TRIGGER IF EXISTS update_movie_stats_after_delete;
+
+ALTER TABLE user_stats ADD COLUMN total_watch_minutes INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE user_stats ADD COLUMN rating_sum REAL NOT NULL DEFAULT 0;
+
+CREATE TRIGGER update_movie_stats_after_insert
+AFTER INSERT ON user_ratings
+FOR EACH ROW
+BEGIN
+  INSERT INTO movie_rating_stats (movie_id, average_rating, total_ratings, updated_at)
+  SELECT 
+    NEW.movie_id,
+    CASE WHEN COUNT(rating) > 0 THEN AVG(CAST(rating AS FLOAT)) ELSE NULL END,
+    COUNT(rating),
+    CURRENT_TIMESTAMP
+  FROM user_ratings
+  WHERE movie_id = NEW.movie_id AND rating IS NOT NULL
+  ON CONFLICT(movie_id) DO UPDATE SET
+    average_rating = excluded.average_rating,
+    total_ratings = excluded.total_ratings,
+    updated_at = excluded.updated_at;
+END;
+
+CREATE TRIGGER update_movie_stats_after_update
+AFTER UPDATE ON user_ratings
+FOR EACH ROW
+BEGIN
+  INSERT INTO movie_rating_stats (movie_id, average_rating, total_ratings, updated_at)
+  SELECT 
+    NEW.movie_id,
+    CASE WHEN COUNT(rating) > 0 THEN AVG(CAST(rating AS FLOAT)) ELSE NULL END,
+    COUNT(rating),
+    CURRENT_TIMESTAMP
+  FROM user_ratings
+  WHERE movie_id = NEW.movie_id AND rating IS NOT NULL
+  ON CONFLICT(movie_id) DO UPDATE SET
+    average_rating = excluded.average_rating,
+    total_ratings = excluded.total_ratings,
+    updated_at = excluded.updated_at;
+END;
+
+CREATE TRIGGER update_movie_stats_after_delete
+AFTER DELETE ON user_ratings
+FOR EACH ROW
+BEGIN
+  INSERT INTO movie_rating_stats (movie_id, average_rating, total_ratings, updated_at)
+  SELECT 
+    OLD.movie_id,
+    CASE WHEN COUNT(rating) > 0 THEN AVG(CAST(rating AS FLOAT)) ELSE NULL END,
+    COUNT(rating),
+    CURRENT_TIMESTAMP
+  FROM user_ratings
+  WHERE movie_id = OLD.movie_id AND rating IS NOT NULL
+  ON CONFLICT(movie_id) DO UPDATE SET
+    average_rating = excluded.average_rating,
+    total_ratings = excluded.total_ratings,
+    updated_at = excluded.updated_at;
+END;
+
+-- TRIGGERIT KÄYTTÄJÄTILASTOILLE (delta-päivitys: vain muutos OLD -> NEW, O(1) per rivi)
+CREATE TRIGGER update_user_stats_after_rating_insert
+AFTER INSERT ON user_ratings
+FOR EACH ROW
+BEGIN
+  INSERT INTO user_stats (
+    user_id, total_movies_watched, rating_sum, total_ratings_given, avg_rating,
+    total_reviews_written, total_watch_minutes, total_watch_hours, updated_at
+  )
+  SELECT
+    NEW.user_id,
+    1,
+    COALESCE(NEW.rating, 0),
+    NEW.rating IS NOT NULL,
+    NEW.rating,
+    COALESCE(NEW.review, '') != '',
+    minutes,
+    minutes / 60.0,
+    CURRENT_TIMESTAMP
+  FROM (SELECT COALESCE((SELECT duration FROM movies WHERE id = NEW.movie_id), 0) AS minutes)
+  WHERE 1
+  ON CONFLICT(user_id) DO UPDATE SET
+    total_movies_watched = total_movies_watched + 1,
+    rating_sum = rating_sum + excluded.rating_sum,
+    total_ratings_given = total_ratings_given + excluded.total_ratings_given,
+    avg_rating = (rating_sum + excluded.rating_sum)
+      / NULLIF(total_ratings_given + excluded.total_ratings_given, 0),
+    total_reviews_written = total_reviews_written + excluded.total_reviews_written,
+    total_watch_minutes = total_watch_minutes + excluded.total_watch_minutes,
+    total_watch_hours = (total_watch_minutes + excluded.total_watch_minutes) / 60.0,
+    updated_at = CURRENT_TIMESTAMP;
+END;
+
+CREATE TRIGGER update_user_stats_after_rating_update
+AFTER UPDATE OF user_id, movie_id, rating, review ON user_ratings
+FOR EACH ROW
+BEGIN
+  -- Vanhan rivin osuus pois...
+  UPDATE user_stats SET
+    total_movies_watched = total_movies_watched - 1,
+    rating_sum = rating_sum - COALESCE(OLD.rating, 0),
+    total_ratings_given = total_ratings_given - (OLD.rating IS NOT NULL),
+    avg_rating = (rating_sum - COALESCE(OLD.rating, 0))
+      / NULLIF(total_ratings_given - (OLD.rating IS NOT NULL), 0),
+    total_reviews_written = total_reviews_written - (COALESCE(OLD.review, '') != ''),
+    total_watch_minutes = total_watch_minutes
+      - COALESCE((SELECT duration FROM movies WHERE id = OLD.movie_id), 0),
+    total_watch_hours = (total_watch_minutes
+      - COALESCE((SELECT duration FROM movies WHERE id = OLD.movie_id), 0)) / 60.0,
+    updated_at = CURRENT_TIMESTAMP
+  WHERE user_id = OLD.user_id;
+
+  -- ...ja uuden rivin osuus tilalle
+  INSERT INTO user_stats (
+    user_id, total_movies_watched, rating_sum, total_ratings_given, avg_rating,
+    total_reviews_written, total_watch_minutes, total_watch_hours, updated_at
+  )
+  SELECT
+    NEW.user_id,
+    1,
+    COALESCE(NEW.rating, 0),
+    NEW.rating IS NOT NULL,
+    NEW.rating,
+    COALESCE(NEW.review, '') != '',
+    minutes,
+    minutes / 60.0,
+    CURRENT_TIMESTAMP
+  FROM (SELECT COALESCE((SELECT duration FROM movies WHERE id = NEW.movie_id), 0) AS minutes)
+  WHERE 1
+  ON CONFLICT(user_id) DO UPDATE SET
+    total_movies_watched = total_movies_watched + 1,
+    rating_sum = rating_sum + excluded.rating_sum,
+    total_ratings_given = total_ratings_given + excluded.total_ratings_given,
+    avg_rating = (rating_sum + excluded.rating_sum)
+      / NULLIF(total_ratings_given + excluded.total_ratings_given, 0),
+    total_reviews_written = total_reviews_written + excluded.total_reviews_written,
+    total_watch_minutes = total_watch_minutes + excluded.total_watch_minutes,
+    total_watch_hours = (total_watch_minutes + excluded.total_watch_minutes) / 60.0,
+    updated_at = CURRENT_TIMESTAMP;
+END;
+
+CREATE TRIGGER update_user_stats_after_rating_delete
+AFTER DELETE ON user_ratings
+FOR EACH ROW
+BEGIN
+  UPDATE user_stats SET
+    total_movies_watched = total_movies_watched - 1,
+    rating_sum = rating_sum - COALESCE(OLD.rating, 0),
+    total_ratings_given = total_ratings_given - (OLD.rating IS NOT NULL),
+    avg_rating = (rating_sum - COALESCE(OLD.rating, 0))
+      / NULLIF(total_ratings_given - (OLD.rating IS NOT NULL), 0),
+    total_reviews_written = total_reviews_written - (COALESCE(OLD.review, '') != ''),
+    total_watch_minutes = total_watch_minutes
+      - COALESCE((SELECT duration FROM movies WHERE id = OLD.movie_id), 0),
+    total_watch_hours = (total_watch_minutes
+      - COALESCE((SELECT duration FROM movies WHERE id = OLD.movie_id), 0)) / 60.0,
+    updated_at = CURRENT_TIMESTAMP
+  WHERE user_id = OLD.user_id;
+END;
+
+CREATE TRIGGER update_user_stats_after_favorite_insert
+AFTER INSERT ON user_favorites
+FOR EACH ROW
+BEGIN
+  INSERT INTO user_stats (user_id, total_favorites, updated_at)
+  VALUES (NEW.user_id, 1, CURRENT_TIMESTAMP)
+  ON CONFLICT(user_id) DO UPDATE SET
+    total_favorites = total_favorites + 1,
+    updated_at = CURRENT_TIMESTAMP;
+END;
+
+CREATE TRIGGER update_user_stats_after_favorite_delete
+AFTER DELETE ON user_favorites
+FOR EACH ROW
+BEGIN
+  UPDATE user_stats SET
+    total_favorites = total_favorites - 1,
+    updated_at = CURRENT_TIMESTAMP
+  WHERE user_id = OLD.user_id;
+END;
+
+-- Elokuvan keston muutos päivittää kaikkien sen arvostelleiden katseluajan
+CREATE TRIGGER update_user_stats_after_duration_update
+AFTER UPDATE OF duration ON movies
+FOR EACH ROW WHEN NEW.duration IS NOT OLD.duration
+BEGIN
+  UPDATE user_stats SET
+    total_watch_minutes = total_watch_minutes
+      + COALESCE(NEW.duration, 0) - COALESCE(OLD.duration, 0),
+    total_watch_hours = (total_watch_minutes
+      + COALESCE(NEW.duration, 0) - COALESCE(OLD.duration, 0)) / 60.0,
+    updated_at = CURRENT_TIMESTAMP
+  WHERE user_id IN (SELECT user_id FROM user_ratings WHERE movie_id = NEW.id);
+END;
+
+-- Tilastojen uudelleenlaskenta ilman monistumista
+DELETE FROM user_stats;
+
+INSERT INTO user_stats (
+  user_id, total_movies_watched, rating_sum, total_ratings_given, avg_rating,
+  total_reviews_written, total_watch_minutes, total_watch_hours, total_favorites,
+  updated_at
+)
+SELECT
+  u.id,
+  COALESCE(r.movies, 0),
+  COALESCE(r.rating_sum, 0),
+  COALESCE(r.ratings, 0),
+  r.rating_sum / NULLIF(r.ratings, 0),
+  COALESCE(r.reviews, 0),
+  COALESCE(r.minutes, 0),
+  COALESCE(r.minutes, 0) / 60.0,
+  COALESCE(f.favorites, 0),
+  CURRENT_TIMESTAMP
+FROM users u
+LEFT JOIN (
+  SELECT
+    ur.user_id,
+    COUNT(*) AS movies,
+    TOTAL(ur.rating) AS rating_sum,
+    COUNT(ur.rating) AS ratings,
+    SUM(COALESCE(ur.review, '') != '') AS reviews,
+    COALESCE(SUM(m.duration), 0) AS minutes
+  FROM user_ratings ur
+  LEFT JOIN movies m ON ur.movie_id = m.id
+  GROUP BY ur.user_id
+) r ON r.user_id = u.id
+LEFT JOIN (
+  SELECT user_id, COUNT(*) AS favorites
+  FROM user_favorites
+  GROUP BY user_id
+) f ON f.user_id = u.id
+WHERE r.user_id IS NOT NULL OR f.user_id IS NOT NULL;
@@ -0,0 +1,64 @@
+-- ELOKUVIEN RATING-TILASTOT JUOKSEVALLA SUMMALLA
+-- Vanhat triggerit laskivat AVG/COUNT-arvot elokuvan kaikista arvioista
+-- jokaisella muutoksella; nyt summaa ja määrää päivitetään OLD/NEW-erotuksella.
+DROP TRIGGER IF EXISTS update_movie_stats_after_insert;
+DROP TRIGGER IF EXISTS update_movie_stats_after_update;
+DROP TRIGGER IF EXISTS update_movie_stats_after_delete;
+
+ALTER TABLE movie_rating_stats ADD COLUMN rating_sum REAL NOT NULL DEFAULT 0;
+
+CREATE TRIGGER update_movie_stats_after_insert
+AFTER INSERT ON user_ratings
+FOR EACH ROW WHEN NEW.rating IS NOT NULL
+BEGIN
+  INSERT INTO movie_rating_stats (movie_id, rating_sum, total_ratings, average_rating, updated_at)
+  VALUES (NEW.movie_id, NEW.rating, 1, NEW.rating, CURRENT_TIMESTAMP)
+  ON CONFLICT(movie_id) DO UPDATE SET
+    rating_sum = rating_sum + excluded.rating_sum,
+    total_ratings = total_ratings + 1,
+    average_rating = (rating_sum + excluded.rating_sum) / (total_ratings + 1),
+    updated_at = CURRENT_TIMESTAMP;
+END;
+
+CREATE TRIGGER update_movie_stats_after_update
+AFTER UPDATE OF movie_id, rating ON user_ratings
+FOR EACH ROW
+BEGIN
+  -- Summa nollataan, kun viimeinen arvio poistuu, ettei liukulukujäännös jää
+  UPDATE movie_rating_stats SET
+    rating_sum = CASE WHEN total_ratings > 1 THEN rating_sum - OLD.rating ELSE 0 END,
+    total_ratings = total_ratings - 1,
+    average_rating = (rating_sum - OLD.rating) / NULLIF(total_ratings - 1, 0),
+    updated_at = CURRENT_TIMESTAMP
+  WHERE movie_id = OLD.movie_id AND OLD.rating IS NOT NULL;
+
+  INSERT INTO movie_rating_stats (movie_id, rating_sum, total_ratings, average_rating, updated_at)
+  SELECT NEW.movie_id, NEW.rating, 1, NEW.rating, CURRENT_TIMESTAMP
+  WHERE NEW.rating IS NOT NULL
+  ON CONFLICT(movie_id) DO UPDATE SET
+    rating_sum = rating_sum + excluded.rating_sum,
+    total_ratings = total_ratings + 1,
+    average_rating = (rating_sum + excluded.rating_sum) / (total_ratings + 1),
+    updated_at = CURRENT_TIMESTAMP;
+END;
+
+CREATE TRIGGER update_movie_stats_after_delete
+AFTER DELETE ON user_ratings
+FOR EACH ROW WHEN OLD.rating IS NOT NULL
+BEGIN
+  UPDATE movie_rating_stats SET
+    rating_sum = CASE WHEN total_ratings > 1 THEN rating_sum - OLD.rating ELSE 0 END,
+    total_ratings = total_ratings - 1,
+    average_rating = (rating_sum - OLD.rating) / NULLIF(total_ratings - 1, 0),
+    updated_at = CURRENT_TIMESTAMP
+  WHERE movie_id = OLD.movie_id;
+END;
+
+-- Nykyisten tilastojen uudelleenlaskenta
+DELETE FROM movie_rating_stats;
+
+INSERT INTO movie_rating_stats (movie_id, rating_sum, total_ratings, average_rating, updated_at)
+SELECT movie_id, TOTAL(rating), COUNT(rating), AVG(rating), CURRENT_TIMESTAMP
+FROM user_ratings
+WHERE rating IS NOT NULL
+GROUP BY movie_id;
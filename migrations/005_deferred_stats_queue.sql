@@ -0,0 +1,264 @@
+-- VIIVÄSTETYT TILASTOPÄIVITYKSET (valinnainen tila massakirjoituksille)
+-- Kun deferred = 1, triggerit vain merkitsevät muuttuneet avaimet jonoon ja
+-- stats.py:n työntekijä laskee tilastot niille erissä.
+CREATE TABLE stats_settings (
+  name TEXT PRIMARY KEY,
+  value INTEGER NOT NULL
+);
+
+INSERT INTO stats_settings (name, value) VALUES ('deferred', 0);
+
+CREATE TABLE stats_queue (
+  kind TEXT NOT NULL CHECK (kind IN ('movie', 'user')),
+  key INTEGER NOT NULL,
+  queued_at REAL NOT NULL DEFAULT (julianday('now')),
+  PRIMARY KEY (kind, key)
+) WITHOUT ROWID;
+
+CREATE INDEX idx_stats_queue_queued_at ON stats_queue(queued_at);
+
+-- Välittömät (inkrementaaliset) triggerit ohitetaan viivästetyssä tilassa
+DROP TRIGGER IF EXISTS update_movie_stats_after_insert;
+DROP TRIGGER IF EXISTS update_movie_stats_after_update;
+DROP TRIGGER IF EXISTS update_movie_stats_after_delete;
+DROP TRIGGER IF EXISTS update_user_stats_after_rating_insert;
+DROP TRIGGER IF EXISTS update_user_stats_after_rating_update;
+DROP TRIGGER IF EXISTS update_user_stats_after_rating_delete;
+DROP TRIGGER IF EXISTS update_user_stats_after_favorite_insert;
+DROP TRIGGER IF EXISTS update_user_stats_after_favorite_delete;
+DROP TRIGGER IF EXISTS update_user_stats_after_duration_update;
+
+CREATE TRIGGER update_movie_stats_after_insert
+AFTER INSERT ON user_ratings
+FOR EACH ROW WHEN NEW.rating IS NOT NULL
+  AND NOT EXISTS (SELECT 1 FROM stats_settings WHERE name = 'deferred' AND value = 1)
+BEGIN
+  INSERT INTO movie_rating_stats (movie_id, rating_sum, total_ratings, average_rating, updated_at)
+  VALUES (NEW.movie_id, NEW.rating, 1, NEW.rating, CURRENT_TIMESTAMP)
+  ON CONFLICT(movie_id) DO UPDATE SET
+    rating_sum = rating_sum + excluded.rating_sum,
+    total_ratings = total_ratings + 1,
+    average_rating = (rating_sum + excluded.rating_sum) / (total_ratings + 1),
+    updated_at = CURRENT_TIMESTAMP;
+END;
+
+CREATE TRIGGER update_movie_stats_after_update
+AFTER UPDATE OF movie_id, rating ON user_ratings
+FOR EACH ROW WHEN NOT EXISTS (SELECT 1 FROM stats_settings WHERE name = 'deferred' AND value = 1)
+BEGIN
+  -- Summa nollataan, kun viimeinen arvio poistuu, ettei liukulukujäännös jää
+  UPDATE movie_rating_stats SET
+    rating_sum = CASE WHEN total_ratings > 1 THEN rating_sum - OLD.rating ELSE 0 END,
+    total_ratings = total_ratings - 1,
+    average_rating = (rating_sum - OLD.rating) / NULLIF(total_ratings - 1, 0),
+    updated_at = CURRENT_TIMESTAMP
+  WHERE movie_id = OLD.movie_id AND OLD.rating IS NOT NULL;
+
+  INSERT INTO movie_rating_stats (movie_id, rating_sum, total_ratings, average_rating, updated_at)
+  SELECT NEW.movie_id, NEW.rating, 1, NEW.rating, CURRENT_TIMESTAMP
+  WHERE NEW.rating IS NOT NULL
+  ON CONFLICT(movie_id) DO UPDATE SET
+    rating_sum = rating_sum + excluded.rating_sum,
+    total_ratings = total_ratings + 1,
+    average_rating = (rating_sum + excluded.rating_sum) / (total_ratings + 1),
+    updated_at = CURRENT_TIMESTAMP;
+END;
+
+CREATE TRIGGER update_movie_stats_after_delete
+AFTER DELETE ON user_ratings
+FOR EACH ROW WHEN OLD.rating IS NOT NULL
+  AND NOT EXISTS (SELECT 1 FROM stats_settings WHERE name = 'deferred' AND value = 1)
+BEGIN
+  UPDATE movie_rating_stats SET
+    rating_sum = CASE WHEN total_ratings > 1 THEN rating_sum - OLD.rating ELSE 0 END,
+    total_ratings = total_ratings - 1,
+    average_rating = (rating_sum - OLD.rating) / NULLIF(total_ratings - 1, 0),
+    updated_at = CURRENT_TIMESTAMP
+  WHERE movie_id = OLD.movie_id;
+END;
+
+CREATE TRIGGER update_user_stats_after_rating_insert
+AFTER INSERT ON user_ratings
+FOR EACH ROW WHEN NOT EXISTS (SELECT 1 FROM stats_settings WHERE name = 'deferred' AND value = 1)
+BEGIN
+  INSERT INTO user_stats (
+    user_id, total_movies_watched, rating_sum, total_ratings_given, avg_rating,
+    total_reviews_written, total_watch_minutes, total_watch_hours, updated_at
+  )
+  SELECT
+    NEW.user_id,
+    1,
+    COALESCE(NEW.rating, 0),
+    NEW.rating IS NOT NULL,
+    NEW.rating,
+    COALESCE(NEW.review, '') != '',
+    minutes,
+    minutes / 60.0,
+    CURRENT_TIMESTAMP
+  FROM (SELECT COALESCE((SELECT duration FROM movies WHERE id = NEW.movie_id), 0) AS minutes)
+  WHERE 1
+  ON CONFLICT(user_id) DO UPDATE SET
+    total_movies_watched = total_movies_watched + 1,
+    rating_sum = rating_sum + excluded.rating_sum,
+    total_ratings_given = total_ratings_given + excluded.total_ratings_given,
+    avg_rating = (rating_sum + excluded.rating_sum)
+      / NULLIF(total_ratings_given + excluded.total_ratings_given, 0),
+    total_reviews_written = total_reviews_written + excluded.total_reviews_written,
+    total_watch_minutes = total_watch_minutes + excluded.total_watch_minutes,
+    total_watch_hours = (total_watch_minutes + excluded.total_watch_minutes) / 60.0,
+    updated_at = CURRENT_TIMESTAMP;
+END;
+
+CREATE TRIGGER update_user_stats_after_rating_update
+AFTER UPDATE OF user_id, movie_id, rating, review ON user_ratings
+FOR EACH ROW WHEN NOT EXISTS (SELECT 1 FROM stats_settings WHERE name = 'deferred' AND value = 1)
+BEGIN
+  -- Vanhan rivin osuus pois...
+  UPDATE user_stats SET
+    total_movies_watched = total_movies_watched - 1,
+    rating_sum = rating_sum - COALESCE(OLD.rating, 0),
+    total_ratings_given = total_ratings_given - (OLD.rating IS NOT NULL),
+    avg_rating = (rating_sum - COALESCE(OLD.rating, 0))
+      / NULLIF(total_ratings_given - (OLD.rating IS NOT NULL), 0),
+    total_reviews_written = total_reviews_written - (COALESCE(OLD.review, '') != ''),
+    total_watch_minutes = total_watch_minutes
+      - COALESCE((SELECT duration FROM movies WHERE id = OLD.movie_id), 0),
+    total_watch_hours = (total_watch_minutes
+      - COALESCE((SELECT duration FROM movies WHERE id = OLD.movie_id), 0)) / 60.0,
+    updated_at = CURRENT_TIMESTAMP
+  WHERE user_id = OLD.user_id;
+
+  -- ...ja uuden rivin osuus tilalle
+  INSERT INTO user_stats (
+    user_id, total_movies_watched, rating_sum, total_ratings_given, avg_rating,
+    total_reviews_written, total_watch_minutes, total_watch_hours, updated_at
+  )
+  SELECT
+    NEW.user_id,
+    1,
+    COALESCE(NEW.rating, 0),
+    NEW.rating IS NOT NULL,
+    NEW.rating,
+    COALESCE(NEW.review, '') != '',
+    minutes,
+    minutes / 60.0,
+    CURRENT_TIMESTAMP
+  FROM (SELECT COALESCE((SELECT duration FROM movies WHERE id = NEW.movie_id), 0) AS minutes)
+  WHERE 1
+  ON CONFLICT(user_id) DO UPDATE SET
+    total_movies_watched = total_movies_watched + 1,
+    rating_sum = rating_sum + excluded.rating_sum,
+    total_ratings_given = total_ratings_given + excluded.total_ratings_given,
+    avg_rating = (rating_sum + excluded.rating_sum)
+      / NULLIF(total_ratings_given + excluded.total_ratings_given, 0),
+    total_reviews_written = total_reviews_written + excluded.total_reviews_written,
+    total_watch_minutes = total_watch_minutes + excluded.total_watch_minutes,
+    total_watch_hours = (total_watch_minutes + excluded.total_watch_minutes) / 60.0,
+    updated_at = CURRENT_TIMESTAMP;
+END;
+
+CREATE TRIGGER update_user_stats_after_rating_delete
+AFTER DELETE ON user_ratings
+FOR EACH ROW WHEN NOT EXISTS (SELECT 1 FROM stats_settings WHERE name = 'deferred' AND value = 1)
+BEGIN
+  UPDATE user_stats SET
+    total_movies_watched = total_movies_watched - 1,
+    rating_sum = rating_sum - COALESCE(OLD.rating, 0),
+    total_ratings_given = total_ratings_given - (OLD.rating IS NOT NULL),
+    avg_rating = (rating_sum - COALESCE(OLD.rating, 0))
+      / NULLIF(total_ratings_given - (OLD.rating IS NOT NULL), 0),
+    total_reviews_written = total_reviews_written - (COALESCE(OLD.review, '') != ''),
+    total_watch_minutes = total_watch_minutes
+      - COALESCE((SELECT duration FROM movies WHERE id = OLD.movie_id), 0),
+    total_watch_hours = (total_watch_minutes
+      - COALESCE((SELECT duration FROM movies WHERE id = OLD.movie_id), 0)) / 60.0,
+    updated_at = CURRENT_TIMESTAMP
+  WHERE user_id = OLD.user_id;
+END;
+
+CREATE TRIGGER update_user_stats_after_favorite_insert
+AFTER INSERT ON user_favorites
+FOR EACH ROW WHEN NOT EXISTS (SELECT 1 FROM stats_settings WHERE name = 'deferred' AND value = 1)
+BEGIN
+  INSERT INTO user_stats (user_id, total_favorites, updated_at)
+  VALUES (NEW.user_id, 1, CURRENT_TIMESTAMP)
+  ON CONFLICT(user_id) DO UPDATE SET
+    total_favorites = total_favorites + 1,
+    updated_at = CURRENT_TIMESTAMP;
+END;
+
+CREATE TRIGGER update_user_stats_after_favorite_delete
+AFTER DELETE ON user_favorites
+FOR EACH ROW WHEN NOT EXISTS (SELECT 1 FROM stats_settings WHERE name = 'deferred' AND value = 1)
+BEGIN
+  UPDATE user_stats SET
+    total_favorites = total_favorites - 1,
+    updated_at = CURRENT_TIMESTAMP
+  WHERE user_id = OLD.user_id;
+END;
+
+CREATE TRIGGER update_user_stats_after_duration_update
+AFTER UPDATE OF duration ON movies
+FOR EACH ROW WHEN NEW.duration IS NOT OLD.duration
+  AND NOT EXISTS (SELECT 1 FROM stats_settings WHERE name = 'deferred' AND value = 1)
+BEGIN
+  UPDATE user_stats SET
+    total_watch_minutes = total_watch_minutes
+      + COALESCE(NEW.duration, 0) - COALESCE(OLD.duration, 0),
+    total_watch_hours = (total_watch_minutes
+      + COALESCE(NEW.duration, 0) - COALESCE(OLD.duration, 0)) / 60.0,
+    updated_at = CURRENT_TIMESTAMP
+  WHERE user_id IN (SELECT user_id FROM user_ratings WHERE movie_id = NEW.id);
+END;
+
+-- TRIGGERIT VIIVÄSTETYLLE TILASTOJONOLLE (vain kun deferred = 1)
+CREATE TRIGGER queue_stats_after_rating_insert
+AFTER INSERT ON user_ratings
+FOR EACH ROW WHEN EXISTS (SELECT 1 FROM stats_settings WHERE name = 'deferred' AND value = 1)
+BEGIN
+  INSERT INTO stats_queue (kind, key) VALUES ('movie', NEW.movie_id), ('user', NEW.user_id)
+  ON CONFLICT DO NOTHING;
+END;
+
+CREATE TRIGGER queue_stats_after_rating_update
+AFTER UPDATE OF user_id, movie_id, rating, review ON user_ratings
+FOR EACH ROW WHEN EXISTS (SELECT 1 FROM stats_settings WHERE name = 'deferred' AND value = 1)
+BEGIN
+  INSERT INTO stats_queue (kind, key)
+  VALUES ('movie', OLD.movie_id), ('user', OLD.user_id), ('movie', NEW.movie_id), ('user', NEW.user_id)
+  ON CONFLICT DO NOTHING;
+END;
+
+CREATE TRIGGER queue_stats_after_rating_delete
+AFTER DELETE ON user_ratings
+FOR EACH ROW WHEN EXISTS (SELECT 1 FROM stats_settings WHERE name = 'deferred' AND value = 1)
+BEGIN
+  INSERT INTO stats_queue (kind, key) VALUES ('movie', OLD.movie_id), ('user', OLD.user_id)
+  ON CONFLICT DO NOTHING;
+END;
+
+CREATE TRIGGER queue_stats_after_favorite_insert
+AFTER INSERT ON user_favorites
+FOR EACH ROW WHEN EXISTS (SELECT 1 FROM stats_settings WHERE name = 'deferred' AND value = 1)
+BEGIN
+  INSERT INTO stats_queue (kind, key) VALUES ('user', NEW.user_id)
+  ON CONFLICT DO NOTHING;
+END;
+
+CREATE TRIGGER queue_stats_after_favorite_delete
+AFTER DELETE ON user_favorites
+FOR EACH ROW WHEN EXISTS (SELECT 1 FROM stats_settings WHERE name = 'deferred' AND value = 1)
+BEGIN
+  INSERT INTO stats_queue (kind, key) VALUES ('user', OLD.user_id)
+  ON CONFLICT DO NOTHING;
+END;
+
+CREATE TRIGGER queue_stats_after_duration_update
+AFTER UPDATE OF duration ON movies
+FOR EACH ROW WHEN NEW.duration IS NOT OLD.duration
+  AND EXISTS (SELECT 1 FROM stats_settings WHERE name = 'deferred' AND value = 1)
+BEGIN
+  INSERT INTO stats_queue (kind, key)
+  SELECT 'user', user_id FROM user_ratings WHERE movie_id = NEW.id
+  ON CONFLICT DO NOTHING;
+END;
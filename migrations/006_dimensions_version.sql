@@ -0,0 +1,72 @@
+-- HAKUTAULUJEN VERSIOLASKURI
+-- Jokainen categories/streaming_platforms/directors-muutos kasvattaa laskuria,
+-- joten lookups.py:n välimuistia pitävät prosessit huomaavat myös muiden
+-- prosessien tekemät muutokset.
+
+INSERT INTO table_counters (name, value) VALUES ('dimensions_version', 0)
+ON CONFLICT(name) DO NOTHING;
+
+-- TRIGGERIT HAKUTAULUJEN VERSIOLLE (prosessien välimuistit lataavat taulut uudelleen, kun versio muuttuu)
+CREATE TRIGGER bump_dimensions_version_after_category_insert
+AFTER INSERT ON categories
+FOR EACH ROW
+BEGIN
+  UPDATE table_counters SET value = value + 1 WHERE name = 'dimensions_version';
+END;
+
+CREATE TRIGGER bump_dimensions_version_after_category_update
+AFTER UPDATE ON categories
+FOR EACH ROW
+BEGIN
+  UPDATE table_counters SET value = value + 1 WHERE name = 'dimensions_version';
+END;
+
+CREATE TRIGGER bump_dimensions_version_after_category_delete
+AFTER DELETE ON categories
+FOR EACH ROW
+BEGIN
+  UPDATE table_counters SET value = value + 1 WHERE name = 'dimensions_version';
+END;
+
+CREATE TRIGGER bump_dimensions_version_after_platform_insert
+AFTER INSERT ON streaming_platforms
+FOR EACH ROW
+BEGIN
+  UPDATE table_counters SET value = value + 1 WHERE name = 'dimensions_version';
+END;
+
+CREATE TRIGGER bump_dimensions_version_after_platform_update
+AFTER UPDATE ON streaming_platforms
+FOR EACH ROW
+BEGIN
+  UPDATE table_counters SET value = value + 1 WHERE name = 'dimensions_version';
+END;
+
+CREATE TRIGGER bump_dimensions_version_after_platform_delete
+AFTER DELETE ON streaming_platforms
+FOR EACH ROW
+BEGIN
+  UPDATE table_counters SET value = value + 1 WHERE name = 'dimensions_version';
+END;
+
+CREATE TRIGGER bump_dimensions_version_after_director_insert
+AFTER INSERT ON directors
+FOR EACH ROW
+BEGIN
+  UPDATE table_counters SET value = value + 1 WHERE name = 'dimensions_version';
+END;
+
+CREATE TRIGGER bump_dimensions_version_after_director_update
+AFTER UPDATE ON directors
+FOR EACH ROW
+BEGIN
+  UPDATE table_counters SET value = value + 1 WHERE name = 'dimensions_version';
+END;
+
+CREATE TRIGGER bump_dimensions_version_after_director_delete
+AFTER DELETE ON directors
+FOR EACH ROW
+BEGIN
+  UPDATE table_counters SET value = value + 1 WHERE name = 'dimensions_version';
+END;
+
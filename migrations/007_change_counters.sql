@@ -0,0 +1,69 @@
+-- MUUTOSLASKURIT
+-- Elokuvien, arvostelujen ja suosikkien jokainen muutos kasvattaa taulunsa
+-- laskuria. Sivujen ETag-tunnisteet (conditional.py) lasketaan näistä, joten
+-- muuttumaton sivu voidaan vastata 304-koodilla ilman kyselyitä.
+
+INSERT INTO table_counters (name, value) VALUES ('movies_version', 0)
+ON CONFLICT(name) DO NOTHING;
+INSERT INTO table_counters (name, value) VALUES ('ratings_version', 0)
+ON CONFLICT(name) DO NOTHING;
+INSERT INTO table_counters (name, value) VALUES ('favorites_version', 0)
+ON CONFLICT(name) DO NOTHING;
+
+-- TRIGGERIT MUUTOSLASKUREILLE (sivujen ETag-tunnisteet, conditional.py)
+CREATE TRIGGER bump_movies_version_after_insert
+AFTER INSERT ON movies
+FOR EACH ROW
+BEGIN
+  UPDATE table_counters SET value = value + 1 WHERE name = 'movies_version';
+END;
+
+CREATE TRIGGER bump_movies_version_after_update
+AFTER UPDATE ON movies
+FOR EACH ROW
+BEGIN
+  UPDATE table_counters SET value = value + 1 WHERE name = 'movies_version';
+END;
+
+CREATE TRIGGER bump_movies_version_after_delete
+AFTER DELETE ON movies
+FOR EACH ROW
+BEGIN
+  UPDATE table_counters SET value = value + 1 WHERE name = 'movies_version';
+END;
+
+CREATE TRIGGER bump_ratings_version_after_insert
+AFTER INSERT ON user_ratings
+FOR EACH ROW
+BEGIN
+  UPDATE table_counters SET value = value + 1 WHERE name = 'ratings_version';
+END;
+
+CREATE TRIGGER bump_ratings_version_after_update
+AFTER UPDATE ON user_ratings
+FOR EACH ROW
+BEGIN
+  UPDATE table_counters SET value = value + 1 WHERE name = 'ratings_version';
+END;
+
+CREATE TRIGGER bump_ratings_version_after_delete
+AFTER DELETE ON user_ratings
+FOR EACH ROW
+BEGIN
+  UPDATE table_counters SET value = value + 1 WHERE name = 'ratings_version';
+END;
+
+CREATE TRIGGER bump_favorites_version_after_insert
+AFTER INSERT ON user_favorites
+FOR EACH ROW
+BEGIN
+  UPDATE table_counters SET value = value + 1 WHERE name = 'favorites_version';
+END;
+
+CREATE TRIGGER bump_favorites_version_after_delete
+AFTER DELETE ON user_favorites
+FOR EACH ROW
+BEGIN
+  UPDATE table_counters SET value = value + 1 WHERE name = 'favorites_version';
+END;
+
@@ -0,0 +1,135 @@
+-- MUUTOSLOKI (prosessien välimuistien mitätöinti, changes.py)
+-- seq kasvaa aina (AUTOINCREMENT ei käytä numeroita uudelleen), joten jokainen
+-- prosessi lukee vain viimeksi näkemänsä seq-arvon jälkeiset rivit.
+CREATE TABLE change_log (
+  seq INTEGER PRIMARY KEY AUTOINCREMENT,
+  kind TEXT NOT NULL CHECK (kind IN ('movie', 'user', 'dimension', 'all')),
+  key NOT NULL,
+  changed_at REAL NOT NULL DEFAULT (julianday('now'))
+);
+
+-- TRIGGERIT MUUTOSLOKILLE (kuka tahansa prosessi näkee, mitkä avaimet muuttuivat)
+CREATE TRIGGER log_change_after_movie_insert
+AFTER INSERT ON movies
+FOR EACH ROW
+BEGIN
+  INSERT INTO change_log (kind, key) VALUES ('movie', NEW.id), ('user', NEW.owner_id);
+END;
+
+CREATE TRIGGER log_change_after_movie_update
+AFTER UPDATE ON movies
+FOR EACH ROW
+BEGIN
+  INSERT INTO change_log (kind, key)
+  SELECT 'movie', NEW.id
+  UNION SELECT 'user', OLD.owner_id WHERE NEW.owner_id IS NOT OLD.owner_id
+  UNION SELECT 'user', NEW.owner_id WHERE NEW.owner_id IS NOT OLD.owner_id;
+END;
+
+CREATE TRIGGER log_change_after_movie_delete
+AFTER DELETE ON movies
+FOR EACH ROW
+BEGIN
+  INSERT INTO change_log (kind, key) VALUES ('movie', OLD.id), ('user', OLD.owner_id);
+END;
+
+CREATE TRIGGER log_change_after_rating_insert
+AFTER INSERT ON user_ratings
+FOR EACH ROW
+BEGIN
+  INSERT INTO change_log (kind, key) VALUES ('movie', NEW.movie_id), ('user', NEW.user_id);
+END;
+
+CREATE TRIGGER log_change_after_rating_update
+AFTER UPDATE ON user_ratings
+FOR EACH ROW
+BEGIN
+  INSERT INTO change_log (kind, key)
+  SELECT 'movie', NEW.movie_id UNION SELECT 'movie', OLD.movie_id
+  UNION SELECT 'user', NEW.user_id UNION SELECT 'user', OLD.user_id;
+END;
+
+CREATE TRIGGER log_change_after_rating_delete
+AFTER DELETE ON user_ratings
+FOR EACH ROW
+BEGIN
+  INSERT INTO change_log (kind, key) VALUES ('movie', OLD.movie_id), ('user', OLD.user_id);
+END;
+
+CREATE TRIGGER log_change_after_favorite_insert
+AFTER INSERT ON user_favorites
+FOR EACH ROW
+BEGIN
+  INSERT INTO change_log (kind, key) VALUES ('movie', NEW.movie_id), ('user', NEW.user_id);
+END;
+
+CREATE TRIGGER log_change_after_favorite_delete
+AFTER DELETE ON user_favorites
+FOR EACH ROW
+BEGIN
+  INSERT INTO change_log (kind, key) VALUES ('movie', OLD.movie_id), ('user', OLD.user_id);
+END;
+
+CREATE TRIGGER log_change_after_category_insert
+AFTER INSERT ON categories
+FOR EACH ROW
+BEGIN
+  INSERT INTO change_log (kind, key) VALUES ('dimension', 'categories');
+END;
+
+CREATE TRIGGER log_change_after_category_update
+AFTER UPDATE ON categories
+FOR EACH ROW
+BEGIN
+  INSERT INTO change_log (kind, key) VALUES ('dimension', 'categories');
+END;
+
+CREATE TRIGGER log_change_after_category_delete
+AFTER DELETE ON categories
+FOR EACH ROW
+BEGIN
+  INSERT INTO change_log (kind, key) VALUES ('dimension', 'categories');
+END;
+
+CREATE TRIGGER log_change_after_platform_insert
+AFTER INSERT ON streaming_platforms
+FOR EACH ROW
+BEGIN
+  INSERT INTO change_log (kind, key) VALUES ('dimension', 'streaming_platforms');
+END;
+
+CREATE TRIGGER log_change_after_platform_update
+AFTER UPDATE ON streaming_platforms
+FOR EACH ROW
+BEGIN
+  INSERT INTO change_log (kind, key) VALUES ('dimension', 'streaming_platforms');
+END;
+
+CREATE TRIGGER log_change_after_platform_delete
+AFTER DELETE ON streaming_platforms
+FOR EACH ROW
+BEGIN
+  INSERT INTO change_log (kind, key) VALUES ('dimension', 'streaming_platforms');
+END;
+
+CREATE TRIGGER log_change_after_director_insert
+AFTER INSERT ON directors
+FOR EACH ROW
+BEGIN
+  INSERT INTO change_log (kind, key) VALUES ('dimension', 'directors');
+END;
+
+CREATE TRIGGER log_change_after_director_update
+AFTER UPDATE ON directors
+FOR EACH ROW
+BEGIN
+  INSERT INTO change_log (kind, key) VALUES ('dimension', 'directors');
+END;
+
+CREATE TRIGGER log_change_after_director_delete
+AFTER DELETE ON directors
+FOR EACH ROW
+BEGIN
+  INSERT INTO change_log (kind, key) VALUES ('dimension', 'directors');
+END;
+
@@ -0,0 +1,19 @@
+-- SUOSIKIT MUUTOSLOKISSA VAIN KÄYTTÄJÄN AVAIMELLA
+-- Suosikki on käyttäjäkohtainen tieto; elokuvan tiedot tai hakusivun laskurit
+-- eivät muutu sen mukana, joten muutos kirjataan vain ('user', käyttäjä).
+DROP TRIGGER IF EXISTS log_change_after_favorite_insert;
+DROP TRIGGER IF EXISTS log_change_after_favorite_delete;
+
+CREATE TRIGGER log_change_after_favorite_insert
+AFTER INSERT ON user_favorites
+FOR EACH ROW
+BEGIN
+  INSERT INTO change_log (kind, key) VALUES ('user', NEW.user_id);
+END;
+
+CREATE TRIGGER log_change_after_favorite_delete
+AFTER DELETE ON user_favorites
+FOR EACH ROW
+BEGIN
+  INSERT INTO change_log (kind, key) VALUES ('user', OLD.user_id);
+END;
@@ -0,0 +1,162 @@
+-- ARVIOT OMANA LAJINAAN MUUTOSLOKISSA
+-- Arvion muutos kirjataan ('rating', elokuva) eikä ('movie', elokuva), joten
+-- elokuvien tietoihin perustuvat välimuistit (hakusivun laskurit) säilyvät.
+-- CHECK-ehtoa ei voi muuttaa, joten taulu luodaan uudelleen; seq jatkuu
+-- samasta kohdasta, vaikka loki olisi karsittu tyhjäksi.
+DROP TRIGGER IF EXISTS log_change_after_movie_insert;
+DROP TRIGGER IF EXISTS log_change_after_movie_update;
+DROP TRIGGER IF EXISTS log_change_after_movie_delete;
+DROP TRIGGER IF EXISTS log_change_after_rating_insert;
+DROP TRIGGER IF EXISTS log_change_after_rating_update;
+DROP TRIGGER IF EXISTS log_change_after_rating_delete;
+DROP TRIGGER IF EXISTS log_change_after_favorite_insert;
+DROP TRIGGER IF EXISTS log_change_after_favorite_delete;
+DROP TRIGGER IF EXISTS log_change_after_category_insert;
+DROP TRIGGER IF EXISTS log_change_after_category_update;
+DROP TRIGGER IF EXISTS log_change_after_category_delete;
+DROP TRIGGER IF EXISTS log_change_after_platform_insert;
+DROP TRIGGER IF EXISTS log_change_after_platform_update;
+DROP TRIGGER IF EXISTS log_change_after_platform_delete;
+DROP TRIGGER IF EXISTS log_change_after_director_insert;
+DROP TRIGGER IF EXISTS log_change_after_director_update;
+DROP TRIGGER IF EXISTS log_change_after_director_delete;
+
+ALTER TABLE change_log RENAME TO change_log_old;
+
+CREATE TABLE change_log (
+  seq INTEGER PRIMARY KEY AUTOINCREMENT,
+  kind TEXT NOT NULL CHECK (kind IN ('movie', 'rating', 'user', 'dimension', 'all')),
+  key NOT NULL,
+  changed_at REAL NOT NULL DEFAULT (julianday('now'))
+);
+
+INSERT INTO change_log (seq, kind, key, changed_at)
+SELECT seq, kind, key, changed_at FROM change_log_old;
+DELETE FROM sqlite_sequence WHERE name = 'change_log';
+INSERT INTO sqlite_sequence (name, seq)
+SELECT 'change_log', seq FROM sqlite_sequence WHERE name = 'change_log_old';
+DROP TABLE change_log_old;
+
+CREATE TRIGGER log_change_after_movie_insert
+AFTER INSERT ON movies
+FOR EACH ROW
+BEGIN
+  INSERT INTO change_log (kind, key) VALUES ('movie', NEW.id), ('user', NEW.owner_id);
+END;
+
+CREATE TRIGGER log_change_after_movie_update
+AFTER UPDATE ON movies
+FOR EACH ROW
+BEGIN
+  INSERT INTO change_log (kind, key)
+  SELECT 'movie', NEW.id
+  UNION SELECT 'user', OLD.owner_id WHERE NEW.owner_id IS NOT OLD.owner_id
+  UNION SELECT 'user', NEW.owner_id WHERE NEW.owner_id IS NOT OLD.owner_id;
+END;
+
+CREATE TRIGGER log_change_after_movie_delete
+AFTER DELETE ON movies
+FOR EACH ROW
+BEGIN
+  INSERT INTO change_log (kind, key) VALUES ('movie', OLD.id), ('user', OLD.owner_id);
+END;
+
+CREATE TRIGGER log_change_after_rating_insert
+AFTER INSERT ON user_ratings
+FOR EACH ROW
+BEGIN
+  INSERT INTO change_log (kind, key) VALUES ('rating', NEW.movie_id), ('user', NEW.user_id);
+END;
+
+CREATE TRIGGER log_change_after_rating_update
+AFTER UPDATE ON user_ratings
+FOR EACH ROW
+BEGIN
+  INSERT INTO change_log (kind, key)
+  SELECT 'rating', NEW.movie_id UNION SELECT 'rating', OLD.movie_id
+  UNION SELECT 'user', NEW.user_id UNION SELECT 'user', OLD.user_id;
+END;
+
+CREATE TRIGGER log_change_after_rating_delete
+AFTER DELETE ON user_ratings
+FOR EACH ROW
+BEGIN
+  INSERT INTO change_log (kind, key) VALUES ('rating', OLD.movie_id), ('user', OLD.user_id);
+END;
+
+CREATE TRIGGER log_change_after_favorite_insert
+AFTER INSERT ON user_favorites
+FOR EACH ROW
+BEGIN
+  INSERT INTO change_log (kind, key) VALUES ('user', NEW.user_id);
+END;
+
+CREATE TRIGGER log_change_after_favorite_delete
+AFTER DELETE ON user_favorites
+FOR EACH ROW
+BEGIN
+  INSERT INTO change_log (kind, key) VALUES ('user', OLD.user_id);
+END;
+
+CREATE TRIGGER log_change_after_category_insert
+AFTER INSERT ON categories
+FOR EACH ROW
+BEGIN
+  INSERT INTO change_log (kind, key) VALUES ('dimension', 'categories');
+END;
+
+CREATE TRIGGER log_change_after_category_update
+AFTER UPDATE ON categories
+FOR EACH ROW
+BEGIN
+  INSERT INTO change_log (kind, key) VALUES ('dimension', 'categories');
+END;
+
+CREATE TRIGGER log_change_after_category_delete
+AFTER DELETE ON categories
+FOR EACH ROW
+BEGIN
+  INSERT INTO change_log (kind, key) VALUES ('dimension', 'categories');
+END;
+
+CREATE TRIGGER log_change_after_platform_insert
+AFTER INSERT ON streaming_platforms
+FOR EACH ROW
+BEGIN
+  INSERT INTO change_log (kind, key) VALUES ('dimension', 'streaming_platforms');
+END;
+
+CREATE TRIGGER log_change_after_platform_update
+AFTER UPDATE ON streaming_platforms
+FOR EACH ROW
+BEGIN
+  INSERT INTO change_log (kind, key) VALUES ('dimension', 'streaming_platforms');
+END;
+
+CREATE TRIGGER log_change_after_platform_delete
+AFTER DELETE ON streaming_platforms
+FOR EACH ROW
+BEGIN
+  INSERT INTO change_log (kind, key) VALUES ('dimension', 'streaming_platforms');
+END;
+
+CREATE TRIGGER log_change_after_director_insert
+AFTER INSERT ON directors
+FOR EACH ROW
+BEGIN
+  INSERT INTO change_log (kind, key) VALUES ('dimension', 'directors');
+END;
+
+CREATE TRIGGER log_change_after_director_update
+AFTER UPDATE ON directors
+FOR EACH ROW
+BEGIN
+  INSERT INTO change_log (kind, key) VALUES ('dimension', 'directors');
+END;
+
+CREATE TRIGGER log_change_after_director_delete
+AFTER DELETE ON directors
+FOR EACH ROW
+BEGIN
+  INSERT INTO change_log (kind, key) VALUES ('dimension', 'directors');
+END;
@@ -0,0 +1,5 @@
+-- NIMEN KIRJAINKOOSTA RIIPPUMATON INDEKSI
+-- add_movie etsii olemassa olevan elokuvan nimellä kirjainkoosta välittämättä.
+-- LOWER(title) = LOWER(?) luki koko idx_movies_title-indeksin; NOCASE-indeksi
+-- hakee nimen suoraan (molemmat taittavat vain ASCII-kirjaimet).
+CREATE INDEX idx_movies_title_nocase ON movies(title COLLATE NOCASE);
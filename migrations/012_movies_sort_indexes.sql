@@ -0,0 +1,12 @@
+-- HAKUSUODATTIMIEN JA JÄRJESTYKSEN YHDISTETYT INDEKSIT
+-- Oletusjärjestys (lisäysaika) lajilla tai palvelulla suodatettuna ja
+-- vuosijärjestys luetaan valmiiksi järjestetystä indeksistä ilman lajittelua.
+-- Uudet indeksit alkavat samalla sarakkeella kuin korvattavat, joten
+-- yhtäsuuruus- ja vuosivälihaut käyttävät niitä kuten ennenkin.
+DROP INDEX idx_movies_category_id;
+DROP INDEX idx_movies_platform_id;
+DROP INDEX idx_movies_year;
+
+CREATE INDEX idx_movies_category_created_at ON movies(category_id, created_at);
+CREATE INDEX idx_movies_platform_created_at ON movies(streaming_platform_id, created_at);
+CREATE INDEX idx_movies_year_title ON movies(year DESC, title);
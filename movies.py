@@ -1,4 +1,12 @@
+import base64
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import changes
 import db
+import lookups
 
 
 def _transform_movie(row, user_id=None):
@@ -25,9 +33,51 @@ def _transform_movie(row, user_id=None):
     return movie_dict
 
 
-def get_movies(page=1, per_page=20):
-    offset = (page - 1) * per_page
-    sql = """
+def encode_cursor(movie):
+    """Opaque pagination cursor for a movie row, keyed on (created_at, id)"""
+    raw = f"{movie['created_at']}|{movie['id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; returns None for a malformed cursor"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, movie_id = (
+            base64.urlsafe_b64decode(padded.encode()).decode().rsplit("|", 1)
+        )
+        return created_at, int(movie_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def get_movies(page=1, per_page=20, after=None, before=None):
+    """Newest movies first
+
+    Pass a cursor from encode_cursor as after (older movies) or before (newer
+    movies) to seek straight to the position through idx_movies_created_at
+    instead of walking and discarding every earlier row with OFFSET. Without
+    a cursor the classic page number is used, which is fine for shallow pages.
+    """
+    params = []
+    where_sql = ""
+    order_sql = "m.created_at DESC, m.id DESC"
+    limit_sql = "LIMIT ? OFFSET ?"
+
+    after_key = decode_cursor(after) if after else None
+    before_key = decode_cursor(before) if before else None
+    if after_key:
+        where_sql = "WHERE (m.created_at, m.id) < (?, ?)"
+        params.extend(after_key)
+        limit_sql = "LIMIT ?"
+    elif before_key:
+        # Walk forwards from the cursor and flip the page back afterwards
+        where_sql = "WHERE (m.created_at, m.id) > (?, ?)"
+        params.extend(before_key)
+        order_sql = "m.created_at ASC, m.id ASC"
+        limit_sql = "LIMIT ?"
+
+    sql = f"""
         SELECT 
             m.id,
             m.title,
@@ -48,11 +98,16 @@ def get_movies(page=1, per_page=20):
         LEFT JOIN directors d ON m.director_id = d.id
         LEFT JOIN streaming_platforms s ON m.streaming_platform_id = s.id
         LEFT JOIN movie_rating_stats mrs ON m.id = mrs.movie_id
-        ORDER BY m.created_at DESC
-        LIMIT ?
-        OFFSET ?;
+        {where_sql}
+        ORDER BY {order_sql}
+        {limit_sql};
     """
-    results = db.query(sql, [per_page, offset])
+    params.append(per_page)
+    if not (after_key or before_key):
+        params.append((page - 1) * per_page)
+    results = db.query(sql, params)
+    if before_key:
+        results = list(reversed(results))
 
     # Convert to list of dictionaries for easier handling
     movies = [_transform_movie(row) for row in results]
@@ -176,330 +231,424 @@ def get_movies_by_user(user_id, page=1, per_page=20):
     return movies
 
 
+def get_movies_count():
+    """Total number of movies, read from the trigger-maintained counter"""
+    sql = "SELECT value FROM table_counters WHERE name = 'movies'"
+    result = db.query(sql)
+    return result[0]["value"] if result else 0
+
+
+def _get_user_counter(user_id, column):
+    sql = f"SELECT {column} FROM user_counters WHERE user_id = ?"
+    result = db.query(sql, [user_id])
+    return result[0][column] if result else 0
+
+
 def get_user_movies_count(user_id):
-    """Get total count of movies for a user (owned or rated)"""
-    sql = """
-        SELECT COUNT(DISTINCT m.id) as count
-        FROM movies m
-        LEFT JOIN user_ratings ur ON m.id = ur.movie_id AND ur.user_id = ?
-        WHERE m.owner_id = ? OR ur.user_id = ?
-    """
-    result = db.query(sql, [user_id, user_id, user_id])
-    return result[0]["count"] if result else 0
+    """Get total count of movies the user has watched (the rows get_movies_by_user lists)"""
+    return _get_user_counter(user_id, "watched_movies")
 
 
 def add_movie(user_id, movie):
     if not user_id:
         return "User ID is required."
 
-    # First, check if movie already exists
-    sql_check = "SELECT id FROM movies WHERE LOWER(title) = LOWER(?)"
-    result = db.query(sql_check, [movie["title"]])
-
-    if result:
-        # Movie exists, just add user rating
-        movie_id = result[0]["id"]
-    else:
-        # Insert new movie into the movies table
-        sql = """INSERT INTO movies
-                    (title, 
-                    year, 
-                    duration, 
-                    category_id,
-                    streaming_platform_id,
-                    owner_id,
-                    director_id,
-                    review) 
-                VALUES 
-                    (?, ?, ?, ?, ?, ?, ?, ?)"""
-
-        params = (
-            movie["title"],
-            movie["year"] if movie["year"] else None,
-            movie["duration"] if movie["duration"] else None,
-            movie.get("category_id") if movie.get("category_id") else None,
-            (
-                movie.get("streaming_platform_id")
-                if movie.get("streaming_platform_id")
-                else None
-            ),
+    # One transaction per user action: a single commit, and the duplicate
+    # title check cannot race with a concurrent insert of the same title
+    with db.transaction():
+        # First, check if movie already exists
+        sql_check = "SELECT id FROM movies WHERE title = ? COLLATE NOCASE"
+        result = db.query(sql_check, [movie["title"]])
+
+        if result:
+            # Movie exists, just add user rating
+            movie_id = result[0]["id"]
+        else:
+            # Insert new movie into the movies table
+            sql = """INSERT INTO movies
+                        (title, 
+                        year, 
+                        duration, 
+                        category_id,
+                        streaming_platform_id,
+                        owner_id,
+                        director_id,
+                        review) 
+                    VALUES 
+                        (?, ?, ?, ?, ?, ?, ?, ?)"""
+
+            params = (
+                movie["title"],
+                movie["year"] if movie["year"] else None,
+                movie["duration"] if movie["duration"] else None,
+                movie.get("category_id") if movie.get("category_id") else None,
+                (
+                    movie.get("streaming_platform_id")
+                    if movie.get("streaming_platform_id")
+                    else None
+                ),
+                user_id,
+                movie.get("director_id") if movie.get("director_id") else None,
+                movie["review"] if movie["review"] else None,
+            )
+
+            movie_id = db.execute(sql, params)
+
+        # Add user rating
+        # Upsert rather than INSERT OR REPLACE: REPLACE deletes the old row
+        # without firing delete triggers, which would skew the counters
+        sql_rating = """INSERT INTO user_ratings
+                    (user_id, movie_id, rating, watched, watch_date, watched_with, review, favorite)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(user_id, movie_id) DO UPDATE SET
+                        rating = excluded.rating,
+                        watched = excluded.watched,
+                        watch_date = excluded.watch_date,
+                        watched_with = excluded.watched_with,
+                        review = excluded.review,
+                        favorite = excluded.favorite"""
+
+        rating_value = movie.get("rating")
+
+        params_rating = (
             user_id,
-            movie.get("director_id") if movie.get("director_id") else None,
-            movie["review"] if movie["review"] else None,
+            movie_id,
+            rating_value if rating_value else None,
+            1,  # Mark as watched
+            movie["watch_date"] if movie["watch_date"] else None,
+            movie["watched_with"] if movie["watched_with"] else None,
+            movie.get("review") if movie.get("review") else None,
+            bool(movie.get("favorite", False)),
         )
 
-        movie_id = db.execute(sql, params)
+        db.execute(sql_rating, params_rating)
+
+        # Sync favorite status with user_favorites table
+        is_favorite = bool(movie.get("favorite", False))
+        if is_favorite:
+            # Add to favorites if not already there
+            sql_add_fav = (
+                "INSERT OR IGNORE INTO user_favorites (user_id, movie_id) VALUES (?, ?)"
+            )
+            db.execute(sql_add_fav, [user_id, movie_id])
+        else:
+            # Remove from favorites if it was there
+            sql_remove_fav = "DELETE FROM user_favorites WHERE user_id = ? AND movie_id = ?"
+            db.execute(sql_remove_fav, [user_id, movie_id])
 
-    # Add user rating
-    sql_rating = """INSERT OR REPLACE INTO user_ratings
-                (user_id, movie_id, rating, watched, watch_date, watched_with, review, favorite)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)"""
+    return movie_id
 
-    rating_value = movie.get("rating")
 
-    params_rating = (
-        user_id,
-        movie_id,
-        rating_value if rating_value else None,
-        1,  # Mark as watched
-        movie["watch_date"] if movie["watch_date"] else None,
-        movie["watched_with"] if movie["watched_with"] else None,
-        movie.get("review") if movie.get("review") else None,
-        bool(movie.get("favorite", False)),
-    )
+def fts_match_query(text):
+    """Turn free text into an FTS5 MATCH expression of prefix tokens
 
-    db.execute(sql_rating, params_rating)
+    Every word must match (implicit AND) as a token prefix in the title,
+    director or genre; quoting each token keeps FTS5 operators and
+    punctuation in user input from being interpreted. Returns None when the
+    text has no searchable words.
+    """
+    tokens = re.findall(r"\w+", text.lower())
+    if not tokens:
+        return None
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+# Release year buckets offered by the search form
+YEAR_FILTERS = {
+    "2024": "m.year = 2024",
+    "2023": "m.year = 2023",
+    "2022": "m.year = 2022",
+    "2021": "m.year = 2021",
+    "2020": "m.year = 2020",
+    "2010s": "m.year BETWEEN 2010 AND 2019",
+    "2000s": "m.year BETWEEN 2000 AND 2009",
+    "1990s": "m.year BETWEEN 1990 AND 1999",
+    "older": "m.year < 1990",
+}
+
+# Minimum rating options offered by the search form
+RATING_THRESHOLDS = [1, 2, 3, 4, 5]
+
+# Relevance ranking: bm25 column weights for (title, director, genre) and how
+# strongly rating popularity from movie_rating_stats lifts the text score
+BM25_WEIGHTS = (10.0, 3.0, 1.0)
+RELEVANCE_POPULARITY_WEIGHT = 0.5
+RELEVANCE_RATINGS_PRIOR = 20
+
+
+def _relevance_order_sql():
+    """ORDER BY blending bm25 text relevance with popularity, best first
+
+    bm25() is negative with better matches further below zero, so the blend
+    sorts ascending. Popularity is the average rating scaled to 0..1 and
+    damped by how many ratings back it, so a single 5-star vote does not
+    outrank a well-matched classic. An exact title match always comes first,
+    as before; its parameter is the raw query text.
+    """
+    weights = ", ".join(str(weight) for weight in BM25_WEIGHTS)
+    total = "COALESCE(mrs.total_ratings, 0)"
+    popularity = (
+        f"COALESCE(mrs.average_rating, 0) / 5.0 * {total}"
+        f" / ({total} + {RELEVANCE_RATINGS_PRIOR})"
+    )
+    return (
+        "CASE WHEN LOWER(m.title) = LOWER(?) THEN 0 ELSE 1 END, "
+        f"bm25(movies_fts, {weights}) * (1 + {RELEVANCE_POPULARITY_WEIGHT} * {popularity})"
+    )
 
-    # Sync favorite status with user_favorites table
-    is_favorite = bool(movie.get("favorite", False))
-    if is_favorite:
-        # Add to favorites if not already there
-        sql_add_fav = (
-            "INSERT OR IGNORE INTO user_favorites (user_id, movie_id) VALUES (?, ?)"
-        )
-        db.execute(sql_add_fav, [user_id, movie_id])
-    else:
-        # Remove from favorites if it was there
-        sql_remove_fav = "DELETE FROM user_favorites WHERE user_id = ? AND movie_id = ?"
-        db.execute(sql_remove_fav, [user_id, movie_id])
 
-    return movie_id
+_MOVIE_COLUMNS_SQL = """
+            m.id,
+            m.title,
+            m.year,
+            m.duration,
+            m.owner_id,
+            m.category_id,
+            m.streaming_platform_id,
+            m.director_id,
+            m.created_at,
+            c.name AS category_name,
+            d.name AS director_name,
+            s.name AS platform_name,
+            mrs.average_rating,
+            mrs.total_ratings"""
 
+_SEARCH_ORDER = {
+    "title": "m.title ASC",
+    "year": "m.year DESC, m.title ASC",
+    "rating": "COALESCE(mrs.average_rating, 0) DESC, m.created_at DESC",
+    "date_added": "m.created_at DESC",
+}
 
-def search_movies(user_id=None, filter_options=None, page=1, per_page=20):
-    if filter_options is None:
-        filter_options = {}
 
-    offset = (page - 1) * per_page
-    params = []
+def _compile_search(filter_options):
+    """Compile search filters into one WHERE clause shared by every search query
 
+    Genre and platform names are resolved to ids once, so the predicates hit
+    idx_movies_category_created_at / idx_movies_platform_created_at instead
+    of comparing joined names (and the default date_added sort reads them in
+    order), and the minimum rating filters on mrs.average_rating so
+    idx_movie_rating_stats_average applies. The text query is kept apart
+    because the relevance ranking needs it as the FTS MATCH of its own query.
+    """
     query = filter_options.get("query", "").strip()
     genre = filter_options.get("genre", "").strip()
     year = filter_options.get("year", "").strip()
     platform = filter_options.get("platform", "").strip()
     rating = filter_options.get("rating", "").strip()
-    sort_by = filter_options.get("sort_by", "date_added").strip()
 
     where = []
+    params = []
 
-    # Title query
-    if query:
-        where.append("m.title LIKE ?")
-        params.append(f"%{query}%")
-
-    # Year filters
-    year_filters = {
-        "2024": "m.year = 2024",
-        "2023": "m.year = 2023",
-        "2022": "m.year = 2022",
-        "2021": "m.year = 2021",
-        "2020": "m.year = 2020",
-        "2010s": "m.year BETWEEN 2010 AND 2019",
-        "2000s": "m.year BETWEEN 2000 AND 2009",
-        "1990s": "m.year BETWEEN 1990 AND 1999",
-        "older": "m.year < 1990",
-    }
-    if year in year_filters:
-        where.append(year_filters[year])
+    match_query = fts_match_query(query) if query else None
+    # Text with no searchable words (e.g. only punctuation) matches nothing
+    if query and match_query is None:
+        where.append("0 = 1")
 
-    # Genre
+    if year in YEAR_FILTERS:
+        where.append(YEAR_FILTERS[year])
+
+    # An unknown genre or platform name matches nothing
     if genre:
-        where.append("c.name = ?")
-        params.append(genre)
+        where.append("m.category_id = ?")
+        params.append(lookups.get_id("categories", genre))
 
-    # Platform
     if platform:
-        where.append("s.name = ?")
-        params.append(platform)
+        where.append("m.streaming_platform_id = ?")
+        params.append(lookups.get_id("streaming_platforms", platform))
 
-    # Minimum rating
     if rating:
         try:
             min_rating = float(rating)
-            params.append(min_rating)
-            where.append("COALESCE(mrs.average_rating, 0) >= ?")
+            # Unrated movies count as 0, so a threshold of 0 or less keeps all
+            if min_rating > 0:
+                where.append("mrs.average_rating >= ?")
+                params.append(min_rating)
         except ValueError:
             pass
 
-    # WHERE clause
-    where_sql = f"WHERE {' AND '.join(where)}" if where else ""
-
-    # Sorting
-    order_map = {
-        "title": "m.title ASC",
-        "year": "m.year DESC, m.title ASC",
-        "rating": "COALESCE(mrs.average_rating, 0) DESC, m.created_at DESC",
-        "date_added": "m.created_at DESC",
+    return {
+        "query": query,
+        "match_query": match_query,
+        "where": where,
+        "params": params,
     }
 
-    if sort_by == "relevance" and query:
-        order_sql = (
-            "CASE WHEN LOWER(m.title) = LOWER(?) THEN 0 ELSE 1 END, m.created_at DESC"
-        )
-        params.insert(0, query)
-    else:
-        order_sql = order_map.get(sort_by, "m.created_at DESC")
 
+def _search_ranked(compiled, page, per_page):
+    """One page of relevance-ranked text search results
+
+    The blended score is computed and sorted in SQL, so LIMIT/OFFSET bound
+    what SQLite's sorter keeps and only the page ids come back; their full
+    rows are loaded by a second query. The total is the indexed COUNT(*).
+    """
+    filters_sql = "".join(f" AND {clause}" for clause in compiled["where"])
     sql = f"""
-        SELECT
-            m.id,
-            m.title,
-            m.year,
-            m.duration,
-            m.owner_id,
-            m.category_id,
-            m.streaming_platform_id,
-            m.director_id,
-            m.created_at,
-            c.name AS category_name,
-            d.name AS director_name,
-            s.name AS platform_name,
-            mrs.average_rating,
-            mrs.total_ratings
+        SELECT m.id
+        FROM movies_fts
+        JOIN movies m ON m.id = movies_fts.rowid
+        LEFT JOIN movie_rating_stats mrs ON m.id = mrs.movie_id
+        WHERE movies_fts MATCH ?{filters_sql}
+        ORDER BY {_relevance_order_sql()}
+        LIMIT ? OFFSET ?
+    """
+    params = [compiled["match_query"], *compiled["params"], compiled["query"]]
+    page_ids = [row["id"] for row in db.query(sql, [*params, per_page, (page - 1) * per_page])]
+    total = _search_count(compiled)
+    if not page_ids:
+        return [], total
+
+    placeholders = ", ".join("?" for _ in page_ids)
+    sql = f"""
+        SELECT {_MOVIE_COLUMNS_SQL}
         FROM movies m
         LEFT JOIN categories c ON m.category_id = c.id
         LEFT JOIN directors d ON m.director_id = d.id
         LEFT JOIN streaming_platforms s ON m.streaming_platform_id = s.id
         LEFT JOIN movie_rating_stats mrs ON m.id = mrs.movie_id
-        {where_sql}
-        ORDER BY {order_sql}
-        LIMIT ? OFFSET ?
+        WHERE m.id IN ({placeholders})
     """
+    rows = {row["id"]: row for row in db.query(sql, page_ids)}
+    movies = [_transform_movie(rows[movie_id]) for movie_id in page_ids if movie_id in rows]
+    return movies, total
 
-    params.extend([per_page, offset])
 
-    results = db.query(sql, params)
-    return [_transform_movie(row) for row in results]
+def _search_where(compiled):
+    where = list(compiled["where"])
+    params = list(compiled["params"])
+    if compiled["match_query"]:
+        where.insert(0, "m.id IN (SELECT rowid FROM movies_fts WHERE movies_fts MATCH ?)")
+        params.insert(0, compiled["match_query"])
+    return where, params
 
 
-def get_search_count(filter_options=None):
-    """Get total count of search results for accurate pagination"""
-    if filter_options is None:
-        filter_options = {}
-
-    params = []
-
-    # Extract filters
-    query = filter_options.get("query", "").strip()
-    genre = filter_options.get("genre", "").strip()
-    year = filter_options.get("year", "").strip()
-    platform = filter_options.get("platform", "").strip()
-    rating = filter_options.get("rating", "").strip()
+def _search_count(compiled):
+    where, params = _search_where(compiled)
+    if not where:
+        return get_movies_count()
 
-    # Build WHERE clause
-    where_clauses = []
+    sql = f"""
+        SELECT COUNT(*) AS count
+        FROM movies m
+        LEFT JOIN movie_rating_stats mrs ON m.id = mrs.movie_id
+        WHERE {' AND '.join(where)}
+    """
+    result = db.query(sql, params)
+    return result[0]["count"] if result else 0
 
-    if query:
-        where_clauses.append("(m.title LIKE ?)")
-        params.append(f"%{query}%")
 
-    if year:
-        year_mapping = {
-            "2024": "m.year = 2024",
-            "2023": "m.year = 2023",
-            "2022": "m.year = 2022",
-            "2021": "m.year = 2021",
-            "2020": "m.year = 2020",
-            "2010s": "m.year BETWEEN 2010 AND 2019",
-            "2000s": "m.year BETWEEN 2000 AND 2009",
-            "1990s": "m.year BETWEEN 1990 AND 1999",
-            "older": "m.year < 1990",
-        }
-        if year in year_mapping:
-            where_clauses.append(year_mapping[year])
+def search_movies_page(filter_options=None, page=1, per_page=20):
+    """One page of search results together with the total number of matches
 
-    if genre:
-        where_clauses.append("LOWER(c.name) = LOWER(?)")
-        params.append(genre)
+    The page query reads only offset + per_page rows in sort order, and just
+    those are joined to the display tables. The total is a separate COUNT(*)
+    over the filtered set, so no statement has to sort every match; without
+    filters it is the movie counter.
+    """
+    if filter_options is None:
+        filter_options = {}
 
-    if platform:
-        where_clauses.append("LOWER(s.name) = LOWER(?)")
-        params.append(platform)
+    compiled = _compile_search(filter_options)
+    sort_by = filter_options.get("sort_by", "date_added").strip()
 
-    if rating:
-        try:
-            min_rating = float(rating)
-            where_clauses.append("mrs.average_rating >= ?")
-            params.append(min_rating)
-        except ValueError:
-            pass
+    if sort_by == "relevance" and compiled["match_query"]:
+        return _search_ranked(compiled, page, per_page)
 
-    where_sql = ""
-    if where_clauses:
-        where_sql = " WHERE " + " AND ".join(where_clauses)
+    where, params = _search_where(compiled)
+    order_sql = _SEARCH_ORDER.get(sort_by, "m.created_at DESC")
+    where_sql = f"WHERE {' AND '.join(where)}" if where else ""
 
-    # Optimized count query - only join necessary tables
     sql = f"""
-        SELECT COUNT(DISTINCT m.id) as count
-        FROM movies m
+        WITH matches AS (
+            SELECT m.id
+            FROM movies m
+            LEFT JOIN movie_rating_stats mrs ON m.id = mrs.movie_id
+            {where_sql}
+            ORDER BY {order_sql}
+            LIMIT ? OFFSET ?
+        )
+        SELECT {_MOVIE_COLUMNS_SQL}
+        FROM matches
+        JOIN movies m ON m.id = matches.id
         LEFT JOIN categories c ON m.category_id = c.id
+        LEFT JOIN directors d ON m.director_id = d.id
         LEFT JOIN streaming_platforms s ON m.streaming_platform_id = s.id
         LEFT JOIN movie_rating_stats mrs ON m.id = mrs.movie_id
-        {where_sql}
+        ORDER BY {order_sql}
     """
+    results = db.query(sql, [*params, per_page, (page - 1) * per_page])
+    return [_transform_movie(row) for row in results], _search_count(compiled)
 
-    result = db.query(sql, params)
-    return result[0]["count"] if result else 0
+
+def search_movies(filter_options=None, page=1, per_page=20):
+    movies, _ = search_movies_page(filter_options, page=page, per_page=per_page)
+    return movies
+
+
+def get_search_count(filter_options=None):
+    """Get total count of search results for accurate pagination"""
+    return _search_count(_compile_search(filter_options or {}))
 
 
 def update_movie_owner(user_id, movie):
     if not user_id:
         return "User ID is required."
 
-    # Update movie details owned by the user
-    sql = """UPDATE movies
-             SET title = ?,
-                 year = ?,
-                 duration = ?,
-                 category_id = ?,
-                 streaming_platform_id = ?,
-                 director_id = ?,
-                 review = ?
-             WHERE id = ? AND owner_id = ?"""
-
-    params = (
-        movie["title"],
-        movie["year"] if movie["year"] else None,
-        movie["duration"] if movie["duration"] else None,
-        movie.get("category_id") if movie.get("category_id") else None,
-        (
-            movie.get("streaming_platform_id")
-            if movie.get("streaming_platform_id")
-            else None
-        ),
-        movie.get("director_id") if movie.get("director_id") else None,
-        movie["review"] if movie["review"] else None,
-        movie["id"],
-        user_id,
-    )
+    with db.transaction():
+        # Update movie details owned by the user
+        sql = """UPDATE movies
+                 SET title = ?,
+                     year = ?,
+                     duration = ?,
+                     category_id = ?,
+                     streaming_platform_id = ?,
+                     director_id = ?,
+                     review = ?
+                 WHERE id = ? AND owner_id = ?"""
 
-    db.execute(sql, params)
+        params = (
+            movie["title"],
+            movie["year"] if movie["year"] else None,
+            movie["duration"] if movie["duration"] else None,
+            movie.get("category_id") if movie.get("category_id") else None,
+            (
+                movie.get("streaming_platform_id")
+                if movie.get("streaming_platform_id")
+                else None
+            ),
+            movie.get("director_id") if movie.get("director_id") else None,
+            movie["review"] if movie["review"] else None,
+            movie["id"],
+            user_id,
+        )
 
-    # Also update user_ratings if review/rating/favorite provided
-    rating_value = movie.get("rating")
-    if rating_value:
-        if float(rating_value) > 5:
-            rating_value = float(rating_value) / 2
-
-    sql_rating = """UPDATE user_ratings
-                    SET rating = ?,
-                        watch_date = ?,
-                        watched_with = ?,
-                        review = ?,
-                        favorite = ?
-                    WHERE user_id = ? AND movie_id = ?"""
-
-    params_rating = (
-        rating_value if rating_value else None,
-        movie["watch_date"] if movie.get("watch_date") else None,
-        movie["watched_with"] if movie.get("watched_with") else None,
-        movie.get("review") if movie.get("review") else None,
-        bool(movie.get("favorite", False)),
-        user_id,
-        movie["id"],
-    )
+        db.execute(sql, params)
+
+        # Also update user_ratings if review/rating/favorite provided
+        rating_value = movie.get("rating")
+        if rating_value:
+            if float(rating_value) > 5:
+                rating_value = float(rating_value) / 2
+
+        sql_rating = """UPDATE user_ratings
+                        SET rating = ?,
+                            watch_date = ?,
+                            watched_with = ?,
+                            review = ?,
+                            favorite = ?
+                        WHERE user_id = ? AND movie_id = ?"""
+
+        params_rating = (
+            rating_value if rating_value else None,
+            movie["watch_date"] if movie.get("watch_date") else None,
+            movie["watched_with"] if movie.get("watched_with") else None,
+            movie.get("review") if movie.get("review") else None,
+            bool(movie.get("favorite", False)),
+            user_id,
+            movie["id"],
+        )
 
-    db.execute(sql_rating, params_rating)
+        db.execute(sql_rating, params_rating)
     return movie["id"]
 
 
@@ -537,32 +686,33 @@ def delete_movie(user_id, movie_id):
     if not user_id:
         return "User ID is required."
 
-    # First, check if the user owns this movie or has rated it
-    sql_check = """SELECT m.owner_id FROM movies m
-                   LEFT JOIN user_ratings ur ON m.id = ur.movie_id AND ur.user_id = ?
-                   WHERE m.id = ?"""
-    result = db.query(sql_check, [user_id, movie_id])
-
-    if not result:
-        return "Movie not found."
-
-    movie_owner_id = result[0]["owner_id"]
-
-    # If user is the owner, they can delete it
-    if movie_owner_id == user_id:
-        # Delete all user ratings for this movie
-        sql_delete_ratings = "DELETE FROM user_ratings WHERE movie_id = ?"
-        db.execute(sql_delete_ratings, [movie_id])
-
-        # Delete the movie
-        sql_delete_movie = "DELETE FROM movies WHERE id = ?"
-        db.execute(sql_delete_movie, [movie_id])
-    else:
-        # Just delete the user's rating
-        sql_delete_rating = (
-            "DELETE FROM user_ratings WHERE user_id = ? AND movie_id = ?"
-        )
-        db.execute(sql_delete_rating, [user_id, movie_id])
+    with db.transaction():
+        # First, check if the user owns this movie or has rated it
+        sql_check = """SELECT m.owner_id FROM movies m
+                       LEFT JOIN user_ratings ur ON m.id = ur.movie_id AND ur.user_id = ?
+                       WHERE m.id = ?"""
+        result = db.query(sql_check, [user_id, movie_id])
+
+        if not result:
+            return "Movie not found."
+
+        movie_owner_id = result[0]["owner_id"]
+
+        # If user is the owner, they can delete it
+        if movie_owner_id == user_id:
+            # Delete all user ratings for this movie
+            sql_delete_ratings = "DELETE FROM user_ratings WHERE movie_id = ?"
+            db.execute(sql_delete_ratings, [movie_id])
+
+            # Delete the movie
+            sql_delete_movie = "DELETE FROM movies WHERE id = ?"
+            db.execute(sql_delete_movie, [movie_id])
+        else:
+            # Just delete the user's rating
+            sql_delete_rating = (
+                "DELETE FROM user_ratings WHERE user_id = ? AND movie_id = ?"
+            )
+            db.execute(sql_delete_rating, [user_id, movie_id])
 
     return movie_id
 
@@ -595,9 +745,7 @@ def get_favorites(user_id):
     if not user_id:
         return "User ID is required"
 
-    sql = """SELECT COUNT(uf.id) as count FROM user_favorites uf WHERE user_id = ?"""
-    result = db.query(sql, [user_id])
-    return result[0]["count"] if result else 0
+    return _get_user_counter(user_id, "favorite_movies")
 
 
 def get_favorite_movies(user_id, page=1, per_page=20):
@@ -648,6 +796,134 @@ def get_favorite_movies_count(user_id):
     if not user_id:
         return 0
 
-    sql = """SELECT COUNT(uf.id) as count FROM user_favorites uf WHERE user_id = ?"""
-    result = db.query(sql, [user_id])
-    return result[0]["count"] if result else 0
+    return _get_user_counter(user_id, "favorite_movies")
+
+
+# Facet cube cache, keyed by the FTS match expression (None without text)
+FACET_CACHE_SECONDS = 60
+FACET_CACHE_SIZE = 256
+_facet_cache = OrderedDict()
+_facet_lock = threading.Lock()
+
+# Bumped by every eviction, so a cube counted before one is not stored
+_facet_generation = 0
+
+
+def _evict_facets(keys):
+    global _facet_generation
+    # A cube aggregates over all matched movies, so a movie or dimension
+    # change evicts them all. Rating changes only move movies between rating
+    # cells and are not evicted; the rating counts may lag by the cache TTL.
+    with _facet_lock:
+        _facet_generation += 1
+        _facet_cache.clear()
+
+
+changes.subscribe("movie", _evict_facets)
+changes.subscribe("dimension", _evict_facets)
+
+
+def _facet_cube(match_query):
+    """Count the text-matched movies per (genre, platform, year bucket, rating) cell
+
+    One aggregated pass over the set; every facet count can then be summed
+    from these few hundred cells in Python. Cached per match_query, so any
+    combination of the other filters reuses the same cube.
+    """
+    changes.poll()
+    with _facet_lock:
+        cached = _facet_cache.get(match_query)
+        if cached and cached[0] > time.monotonic():
+            _facet_cache.move_to_end(match_query)
+            return cached[1]
+        generation = _facet_generation
+
+    year_bucket_sql = " ".join(
+        f"WHEN {condition} THEN '{bucket}'" for bucket, condition in YEAR_FILTERS.items()
+    )
+    where_sql = ""
+    params = []
+    if match_query:
+        where_sql = "WHERE m.id IN (SELECT rowid FROM movies_fts WHERE movies_fts MATCH ?)"
+        params.append(match_query)
+
+    sql = f"""
+        SELECT
+            m.category_id,
+            m.streaming_platform_id,
+            CASE {year_bucket_sql} END AS year_bucket,
+            CAST(COALESCE(mrs.average_rating, 0) AS INTEGER) AS rating_floor,
+            COUNT(*) AS count
+        FROM movies m
+        LEFT JOIN movie_rating_stats mrs ON m.id = mrs.movie_id
+        {where_sql}
+        GROUP BY 1, 2, 3, 4
+    """
+    cube = [tuple(row) for row in db.query(sql, params)]
+
+    with _facet_lock:
+        if generation == _facet_generation:
+            _facet_cache[match_query] = (time.monotonic() + FACET_CACHE_SECONDS, cube)
+            _facet_cache.move_to_end(match_query)
+            while len(_facet_cache) > FACET_CACHE_SIZE:
+                _facet_cache.popitem(last=False)
+    return cube
+
+
+def get_search_facets(filter_options=None):
+    """Result counts per genre, platform, year bucket and minimum rating
+
+    Each facet is counted with every other active filter applied but not its
+    own, so the numbers say how many results picking that option would give.
+    Rating cells are bucketed by whole stars, matching the form's options.
+    The counts are summed from the cached cube of the text query.
+    """
+    if filter_options is None:
+        filter_options = {}
+
+    query = filter_options.get("query", "").strip()
+    match_query = fts_match_query(query) if query else None
+    if query and match_query is None:
+        # Like the search itself, text without searchable words matches nothing
+        return {"genre": {}, "platform": {}, "year": {}, "rating": {}}
+    genre = filter_options.get("genre", "").strip().lower()
+    year = filter_options.get("year", "").strip()
+    platform = filter_options.get("platform", "").strip().lower()
+    rating = filter_options.get("rating", "").strip()
+
+    try:
+        min_rating = float(rating) if rating else None
+    except ValueError:
+        min_rating = None
+    year = year if year in YEAR_FILTERS else None
+
+    genre_id = lookups.get_id("categories", genre) if genre else None
+    platform_id = lookups.get_id("streaming_platforms", platform) if platform else None
+
+    # Cell predicates for each active filter; an unknown name matches nothing
+    active = {}
+    if genre:
+        active["genre"] = lambda cell: genre_id is not None and cell[0] == genre_id
+    if platform:
+        active["platform"] = (
+            lambda cell: platform_id is not None and cell[1] == platform_id
+        )
+    if year:
+        active["year"] = lambda cell: cell[2] == year
+    if min_rating is not None:
+        active["rating"] = lambda cell: cell[3] >= min_rating
+
+    facets = {"genre": {}, "platform": {}, "year": {}, "rating": {}}
+    for cell in _facet_cube(match_query):
+        cell_genre, cell_platform, cell_year, cell_rating, count = cell
+        cell_values = {
+            "genre": [cell_genre] if cell_genre is not None else [],
+            "platform": [cell_platform] if cell_platform is not None else [],
+            "year": [cell_year] if cell_year is not None else [],
+            "rating": [t for t in RATING_THRESHOLDS if cell_rating >= t],
+        }
+        for facet, counts in facets.items():
+            if all(matches(cell) for name, matches in active.items() if name != facet):
+                for value in cell_values[facet]:
+                    counts[value] = counts.get(value, 0) + count
+    return facets
@@ -1,4 +1,5 @@
 import db
+import lookups
 
 
 def get_platforms():
@@ -11,4 +12,5 @@ def add_platform(platform_name):
     """Lisää uusi alusta"""
     sql = "INSERT INTO streaming_platforms (name) VALUES (?)"
     platform_id = db.execute(sql, [platform_name])
+    lookups.invalidate()
     return platform_id
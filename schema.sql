@@ -59,6 +59,7 @@ CREATE TABLE movie_rating_stats (
   movie_id INTEGER PRIMARY KEY REFERENCES movies(id) ON DELETE CASCADE,
   average_rating REAL,
   total_ratings INTEGER DEFAULT 0,
+  rating_sum REAL NOT NULL DEFAULT 0,
   updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
 );
 
@@ -71,6 +72,8 @@ CREATE TABLE user_stats (
   avg_rating REAL DEFAULT NULL,
   total_favorites INTEGER DEFAULT 0,
   total_watch_hours REAL DEFAULT 0,
+  total_watch_minutes INTEGER NOT NULL DEFAULT 0,
+  rating_sum REAL NOT NULL DEFAULT 0,
   total_ratings_given INTEGER DEFAULT 0,
   total_reviews_written INTEGER DEFAULT 0,
   updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
@@ -78,13 +81,74 @@ CREATE TABLE user_stats (
 
 CREATE INDEX idx_user_stats_updated_at ON user_stats(updated_at);
 
+-- VIIVÄSTETYT TILASTOPÄIVITYKSET (valinnainen tila massakirjoituksille)
+-- Kun deferred = 1, triggerit vain merkitsevät muuttuneet avaimet jonoon ja
+-- stats.py:n työntekijä laskee tilastot niille erissä.
+CREATE TABLE stats_settings (
+  name TEXT PRIMARY KEY,
+  value INTEGER NOT NULL
+);
+
+INSERT INTO stats_settings (name, value) VALUES ('deferred', 0);
+
+CREATE TABLE stats_queue (
+  kind TEXT NOT NULL CHECK (kind IN ('movie', 'user')),
+  key INTEGER NOT NULL,
+  queued_at REAL NOT NULL DEFAULT (julianday('now')),
+  PRIMARY KEY (kind, key)
+) WITHOUT ROWID;
+
+CREATE INDEX idx_stats_queue_queued_at ON stats_queue(queued_at);
+
+-- MUUTOSLOKI (prosessien välimuistien mitätöinti, changes.py)
+-- seq kasvaa aina (AUTOINCREMENT ei käytä numeroita uudelleen), joten jokainen
+-- prosessi lukee vain viimeksi näkemänsä seq-arvon jälkeiset rivit.
+CREATE TABLE change_log (
+  seq INTEGER PRIMARY KEY AUTOINCREMENT,
+  kind TEXT NOT NULL CHECK (kind IN ('movie', 'rating', 'user', 'dimension', 'all')),
+  key NOT NULL,
+  changed_at REAL NOT NULL DEFAULT (julianday('now'))
+);
+
+-- RIVIMÄÄRÄLASKURIT (triggerit ylläpitävät, korvaavat COUNT(*)-kyselyt)
+CREATE TABLE table_counters (
+  name TEXT PRIMARY KEY,
+  value INTEGER NOT NULL DEFAULT 0
+);
+
+INSERT INTO table_counters (name, value) VALUES ('movies', 0);
+-- Kasvaa jokaisesta categories/streaming_platforms/directors-muutoksesta; elokuvasivun
+-- ETag-tunniste lasketaan siitä (conditional.py). lookups.py seuraa muutoslokia.
+INSERT INTO table_counters (name, value) VALUES ('dimensions_version', 0);
+-- Muutoslaskurit, joista sivujen ETag-tunnisteet lasketaan (conditional.py)
+INSERT INTO table_counters (name, value) VALUES ('movies_version', 0);
+INSERT INTO table_counters (name, value) VALUES ('ratings_version', 0);
+INSERT INTO table_counters (name, value) VALUES ('favorites_version', 0);
+
+CREATE TABLE user_counters (
+  user_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+  owned_movies INTEGER NOT NULL DEFAULT 0,
+  watched_movies INTEGER NOT NULL DEFAULT 0,
+  favorite_movies INTEGER NOT NULL DEFAULT 0
+);
+
+-- KOKOTEKSTIHAKU (FTS5: nimi, ohjaaja ja genre, rowid = movies.id)
+CREATE VIRTUAL TABLE movies_fts USING fts5(
+  title,
+  director,
+  genre,
+  tokenize = 'unicode61 remove_diacritics 2',
+  prefix = '2 3'
+);
+
 -- MOVIES INDEXIT
 CREATE INDEX idx_movies_title ON movies(title);
+CREATE INDEX idx_movies_title_nocase ON movies(title COLLATE NOCASE);
 CREATE INDEX idx_movies_owner_id ON movies(owner_id);
-CREATE INDEX idx_movies_category_id ON movies(category_id);
+CREATE INDEX idx_movies_category_created_at ON movies(category_id, created_at);
 CREATE INDEX idx_movies_director_id ON movies(director_id);
-CREATE INDEX idx_movies_platform_id ON movies(streaming_platform_id);
-CREATE INDEX idx_movies_year ON movies(year);
+CREATE INDEX idx_movies_platform_created_at ON movies(streaming_platform_id, created_at);
+CREATE INDEX idx_movies_year_title ON movies(year DESC, title);
 CREATE INDEX idx_movies_created_at ON movies(created_at);
 
 -- USER_RATINGS INDEXIT
@@ -97,149 +161,607 @@ CREATE INDEX idx_user_ratings_rating ON user_ratings(rating) WHERE rating IS NOT
 -- USER_FAVORITES INDEXIT
 CREATE INDEX idx_user_favorites_user_id ON user_favorites(user_id);
 
--- TRIGGERIT RATING-TILASTOJEN PÄIVITTÄMISEEN
+-- TRIGGERIT RATING-TILASTOJEN PÄIVITTÄMISEEN (juokseva summa ja määrä, O(1) per rivi)
 CREATE TRIGGER update_movie_stats_after_insert
 AFTER INSERT ON user_ratings
-FOR EACH ROW
+FOR EACH ROW WHEN NEW.rating IS NOT NULL
+  AND NOT EXISTS (SELECT 1 FROM stats_settings WHERE name = 'deferred' AND value = 1)
 BEGIN
-  INSERT OR REPLACE INTO movie_rating_stats (movie_id, average_rating, total_ratings, updated_at)
-  SELECT 
-    NEW.movie_id,
-    CASE WHEN COUNT(rating) > 0 THEN AVG(CAST(rating AS FLOAT)) ELSE NULL END,
-    COUNT(rating),
-    CURRENT_TIMESTAMP
-  FROM user_ratings
-  WHERE movie_id = NEW.movie_id AND rating IS NOT NULL;
-  
-  -- Update user stats
-  INSERT OR REPLACE INTO user_stats (
-    user_id, total_movies_watched, avg_rating, total_favorites, 
-    total_watch_hours, total_ratings_given, total_reviews_written, updated_at
+  INSERT INTO movie_rating_stats (movie_id, rating_sum, total_ratings, average_rating, updated_at)
+  VALUES (NEW.movie_id, NEW.rating, 1, NEW.rating, CURRENT_TIMESTAMP)
+  ON CONFLICT(movie_id) DO UPDATE SET
+    rating_sum = rating_sum + excluded.rating_sum,
+    total_ratings = total_ratings + 1,
+    average_rating = (rating_sum + excluded.rating_sum) / (total_ratings + 1),
+    updated_at = CURRENT_TIMESTAMP;
+END;
+
+CREATE TRIGGER update_movie_stats_after_update
+AFTER UPDATE OF movie_id, rating ON user_ratings
+FOR EACH ROW WHEN NOT EXISTS (SELECT 1 FROM stats_settings WHERE name = 'deferred' AND value = 1)
+BEGIN
+  -- Summa nollataan, kun viimeinen arvio poistuu, ettei liukulukujäännös jää
+  UPDATE movie_rating_stats SET
+    rating_sum = CASE WHEN total_ratings > 1 THEN rating_sum - OLD.rating ELSE 0 END,
+    total_ratings = total_ratings - 1,
+    average_rating = (rating_sum - OLD.rating) / NULLIF(total_ratings - 1, 0),
+    updated_at = CURRENT_TIMESTAMP
+  WHERE movie_id = OLD.movie_id AND OLD.rating IS NOT NULL;
+
+  INSERT INTO movie_rating_stats (movie_id, rating_sum, total_ratings, average_rating, updated_at)
+  SELECT NEW.movie_id, NEW.rating, 1, NEW.rating, CURRENT_TIMESTAMP
+  WHERE NEW.rating IS NOT NULL
+  ON CONFLICT(movie_id) DO UPDATE SET
+    rating_sum = rating_sum + excluded.rating_sum,
+    total_ratings = total_ratings + 1,
+    average_rating = (rating_sum + excluded.rating_sum) / (total_ratings + 1),
+    updated_at = CURRENT_TIMESTAMP;
+END;
+
+CREATE TRIGGER update_movie_stats_after_delete
+AFTER DELETE ON user_ratings
+FOR EACH ROW WHEN OLD.rating IS NOT NULL
+  AND NOT EXISTS (SELECT 1 FROM stats_settings WHERE name = 'deferred' AND value = 1)
+BEGIN
+  UPDATE movie_rating_stats SET
+    rating_sum = CASE WHEN total_ratings > 1 THEN rating_sum - OLD.rating ELSE 0 END,
+    total_ratings = total_ratings - 1,
+    average_rating = (rating_sum - OLD.rating) / NULLIF(total_ratings - 1, 0),
+    updated_at = CURRENT_TIMESTAMP
+  WHERE movie_id = OLD.movie_id;
+END;
+
+-- TRIGGERIT KÄYTTÄJÄTILASTOILLE (delta-päivitys: vain muutos OLD -> NEW, O(1) per rivi)
+CREATE TRIGGER update_user_stats_after_rating_insert
+AFTER INSERT ON user_ratings
+FOR EACH ROW WHEN NOT EXISTS (SELECT 1 FROM stats_settings WHERE name = 'deferred' AND value = 1)
+BEGIN
+  INSERT INTO user_stats (
+    user_id, total_movies_watched, rating_sum, total_ratings_given, avg_rating,
+    total_reviews_written, total_watch_minutes, total_watch_hours, updated_at
   )
-  SELECT 
+  SELECT
     NEW.user_id,
-    COUNT(DISTINCT ur.movie_id),
-    CASE WHEN COUNT(ur.rating) > 0 THEN AVG(CAST(ur.rating AS FLOAT)) ELSE NULL END,
-    COUNT(DISTINCT uf.movie_id),
-    COALESCE(SUM(m.duration) / 60.0, 0),
-    COUNT(CASE WHEN ur.rating IS NOT NULL THEN 1 END),
-    COUNT(CASE WHEN ur.review IS NOT NULL AND ur.review != '' THEN 1 END),
+    1,
+    COALESCE(NEW.rating, 0),
+    NEW.rating IS NOT NULL,
+    NEW.rating,
+    COALESCE(NEW.review, '') != '',
+    minutes,
+    minutes / 60.0,
     CURRENT_TIMESTAMP
-  FROM user_ratings ur
-  LEFT JOIN user_favorites uf ON ur.user_id = uf.user_id
-  LEFT JOIN movies m ON ur.movie_id = m.id
-  WHERE ur.user_id = NEW.user_id;
+  FROM (SELECT COALESCE((SELECT duration FROM movies WHERE id = NEW.movie_id), 0) AS minutes)
+  WHERE 1
+  ON CONFLICT(user_id) DO UPDATE SET
+    total_movies_watched = total_movies_watched + 1,
+    rating_sum = rating_sum + excluded.rating_sum,
+    total_ratings_given = total_ratings_given + excluded.total_ratings_given,
+    avg_rating = (rating_sum + excluded.rating_sum)
+      / NULLIF(total_ratings_given + excluded.total_ratings_given, 0),
+    total_reviews_written = total_reviews_written + excluded.total_reviews_written,
+    total_watch_minutes = total_watch_minutes + excluded.total_watch_minutes,
+    total_watch_hours = (total_watch_minutes + excluded.total_watch_minutes) / 60.0,
+    updated_at = CURRENT_TIMESTAMP;
 END;
 
-CREATE TRIGGER update_movie_stats_after_update
-AFTER UPDATE ON user_ratings
-FOR EACH ROW
+CREATE TRIGGER update_user_stats_after_rating_update
+AFTER UPDATE OF user_id, movie_id, rating, review ON user_ratings
+FOR EACH ROW WHEN NOT EXISTS (SELECT 1 FROM stats_settings WHERE name = 'deferred' AND value = 1)
 BEGIN
-  INSERT OR REPLACE INTO movie_rating_stats (movie_id, average_rating, total_ratings, updated_at)
-  SELECT 
-    NEW.movie_id,
-    CASE WHEN COUNT(rating) > 0 THEN AVG(CAST(rating AS FLOAT)) ELSE NULL END,
-    COUNT(rating),
-    CURRENT_TIMESTAMP
-  FROM user_ratings
-  WHERE movie_id = NEW.movie_id AND rating IS NOT NULL;
-  
-  -- Update user stats
-  INSERT OR REPLACE INTO user_stats (
-    user_id, total_movies_watched, avg_rating, total_favorites, 
-    total_watch_hours, total_ratings_given, total_reviews_written, updated_at
+  -- Vanhan rivin osuus pois...
+  UPDATE user_stats SET
+    total_movies_watched = total_movies_watched - 1,
+    rating_sum = rating_sum - COALESCE(OLD.rating, 0),
+    total_ratings_given = total_ratings_given - (OLD.rating IS NOT NULL),
+    avg_rating = (rating_sum - COALESCE(OLD.rating, 0))
+      / NULLIF(total_ratings_given - (OLD.rating IS NOT NULL), 0),
+    total_reviews_written = total_reviews_written - (COALESCE(OLD.review, '') != ''),
+    total_watch_minutes = total_watch_minutes
+      - COALESCE((SELECT duration FROM movies WHERE id = OLD.movie_id), 0),
+    total_watch_hours = (total_watch_minutes
+      - COALESCE((SELECT duration FROM movies WHERE id = OLD.movie_id), 0)) / 60.0,
+    updated_at = CURRENT_TIMESTAMP
+  WHERE user_id = OLD.user_id;
+
+  -- ...ja uuden rivin osuus tilalle
+  INSERT INTO user_stats (
+    user_id, total_movies_watched, rating_sum, total_ratings_given, avg_rating,
+    total_reviews_written, total_watch_minutes, total_watch_hours, updated_at
   )
-  SELECT 
+  SELECT
     NEW.user_id,
-    COUNT(DISTINCT ur.movie_id),
-    CASE WHEN COUNT(ur.rating) > 0 THEN AVG(CAST(ur.rating AS FLOAT)) ELSE NULL END,
-    COUNT(DISTINCT uf.movie_id),
-    COALESCE(SUM(m.duration) / 60.0, 0),
-    COUNT(CASE WHEN ur.rating IS NOT NULL THEN 1 END),
-    COUNT(CASE WHEN ur.review IS NOT NULL AND ur.review != '' THEN 1 END),
+    1,
+    COALESCE(NEW.rating, 0),
+    NEW.rating IS NOT NULL,
+    NEW.rating,
+    COALESCE(NEW.review, '') != '',
+    minutes,
+    minutes / 60.0,
     CURRENT_TIMESTAMP
-  FROM user_ratings ur
-  LEFT JOIN user_favorites uf ON ur.user_id = uf.user_id
-  LEFT JOIN movies m ON ur.movie_id = m.id
-  WHERE ur.user_id = NEW.user_id;
+  FROM (SELECT COALESCE((SELECT duration FROM movies WHERE id = NEW.movie_id), 0) AS minutes)
+  WHERE 1
+  ON CONFLICT(user_id) DO UPDATE SET
+    total_movies_watched = total_movies_watched + 1,
+    rating_sum = rating_sum + excluded.rating_sum,
+    total_ratings_given = total_ratings_given + excluded.total_ratings_given,
+    avg_rating = (rating_sum + excluded.rating_sum)
+      / NULLIF(total_ratings_given + excluded.total_ratings_given, 0),
+    total_reviews_written = total_reviews_written + excluded.total_reviews_written,
+    total_watch_minutes = total_watch_minutes + excluded.total_watch_minutes,
+    total_watch_hours = (total_watch_minutes + excluded.total_watch_minutes) / 60.0,
+    updated_at = CURRENT_TIMESTAMP;
 END;
 
-CREATE TRIGGER update_movie_stats_after_delete
+CREATE TRIGGER update_user_stats_after_rating_delete
 AFTER DELETE ON user_ratings
-FOR EACH ROW
+FOR EACH ROW WHEN NOT EXISTS (SELECT 1 FROM stats_settings WHERE name = 'deferred' AND value = 1)
 BEGIN
-  INSERT OR REPLACE INTO movie_rating_stats (movie_id, average_rating, total_ratings, updated_at)
-  SELECT 
-    OLD.movie_id,
-    CASE WHEN COUNT(rating) > 0 THEN AVG(CAST(rating AS FLOAT)) ELSE NULL END,
-    COUNT(rating),
-    CURRENT_TIMESTAMP
-  FROM user_ratings
-  WHERE movie_id = OLD.movie_id AND rating IS NOT NULL;
-  
-  -- Update user stats
-  INSERT OR REPLACE INTO user_stats (
-    user_id, total_movies_watched, avg_rating, total_favorites, 
-    total_watch_hours, total_ratings_given, total_reviews_written, updated_at
-  )
-  SELECT 
-    OLD.user_id,
-    COUNT(DISTINCT ur.movie_id),
-    CASE WHEN COUNT(ur.rating) > 0 THEN AVG(CAST(ur.rating AS FLOAT)) ELSE NULL END,
-    COUNT(DISTINCT uf.movie_id),
-    COALESCE(SUM(m.duration) / 60.0, 0),
-    COUNT(CASE WHEN ur.rating IS NOT NULL THEN 1 END),
-    COUNT(CASE WHEN ur.review IS NOT NULL AND ur.review != '' THEN 1 END),
-    CURRENT_TIMESTAMP
-  FROM user_ratings ur
-  LEFT JOIN user_favorites uf ON ur.user_id = uf.user_id
-  LEFT JOIN movies m ON ur.movie_id = m.id
-  WHERE ur.user_id = OLD.user_id;
+  UPDATE user_stats SET
+    total_movies_watched = total_movies_watched - 1,
+    rating_sum = rating_sum - COALESCE(OLD.rating, 0),
+    total_ratings_given = total_ratings_given - (OLD.rating IS NOT NULL),
+    avg_rating = (rating_sum - COALESCE(OLD.rating, 0))
+      / NULLIF(total_ratings_given - (OLD.rating IS NOT NULL), 0),
+    total_reviews_written = total_reviews_written - (COALESCE(OLD.review, '') != ''),
+    total_watch_minutes = total_watch_minutes
+      - COALESCE((SELECT duration FROM movies WHERE id = OLD.movie_id), 0),
+    total_watch_hours = (total_watch_minutes
+      - COALESCE((SELECT duration FROM movies WHERE id = OLD.movie_id), 0)) / 60.0,
+    updated_at = CURRENT_TIMESTAMP
+  WHERE user_id = OLD.user_id;
 END;
 
--- Trigger for favorites updates
 CREATE TRIGGER update_user_stats_after_favorite_insert
 AFTER INSERT ON user_favorites
-FOR EACH ROW
+FOR EACH ROW WHEN NOT EXISTS (SELECT 1 FROM stats_settings WHERE name = 'deferred' AND value = 1)
 BEGIN
-  INSERT OR REPLACE INTO user_stats (
-    user_id, total_movies_watched, avg_rating, total_favorites, 
-    total_watch_hours, total_ratings_given, total_reviews_written, updated_at
-  )
-  SELECT 
-    NEW.user_id,
-    COUNT(DISTINCT ur.movie_id),
-    CASE WHEN COUNT(ur.rating) > 0 THEN AVG(CAST(ur.rating AS FLOAT)) ELSE NULL END,
-    COUNT(DISTINCT uf.movie_id),
-    COALESCE(SUM(m.duration) / 60.0, 0),
-    COUNT(CASE WHEN ur.rating IS NOT NULL THEN 1 END),
-    COUNT(CASE WHEN ur.review IS NOT NULL AND ur.review != '' THEN 1 END),
-    CURRENT_TIMESTAMP
-  FROM user_ratings ur
-  LEFT JOIN user_favorites uf ON ur.user_id = uf.user_id
-  LEFT JOIN movies m ON ur.movie_id = m.id
-  WHERE ur.user_id = NEW.user_id;
+  INSERT INTO user_stats (user_id, total_favorites, updated_at)
+  VALUES (NEW.user_id, 1, CURRENT_TIMESTAMP)
+  ON CONFLICT(user_id) DO UPDATE SET
+    total_favorites = total_favorites + 1,
+    updated_at = CURRENT_TIMESTAMP;
 END;
 
 CREATE TRIGGER update_user_stats_after_favorite_delete
 AFTER DELETE ON user_favorites
+FOR EACH ROW WHEN NOT EXISTS (SELECT 1 FROM stats_settings WHERE name = 'deferred' AND value = 1)
+BEGIN
+  UPDATE user_stats SET
+    total_favorites = total_favorites - 1,
+    updated_at = CURRENT_TIMESTAMP
+  WHERE user_id = OLD.user_id;
+END;
+
+-- Elokuvan keston muutos päivittää kaikkien sen arvostelleiden katseluajan
+CREATE TRIGGER update_user_stats_after_duration_update
+AFTER UPDATE OF duration ON movies
+FOR EACH ROW WHEN NEW.duration IS NOT OLD.duration
+  AND NOT EXISTS (SELECT 1 FROM stats_settings WHERE name = 'deferred' AND value = 1)
+BEGIN
+  UPDATE user_stats SET
+    total_watch_minutes = total_watch_minutes
+      + COALESCE(NEW.duration, 0) - COALESCE(OLD.duration, 0),
+    total_watch_hours = (total_watch_minutes
+      + COALESCE(NEW.duration, 0) - COALESCE(OLD.duration, 0)) / 60.0,
+    updated_at = CURRENT_TIMESTAMP
+  WHERE user_id IN (SELECT user_id FROM user_ratings WHERE movie_id = NEW.id);
+END;
+
+-- TRIGGERIT VIIVÄSTETYLLE TILASTOJONOLLE (vain kun deferred = 1)
+CREATE TRIGGER queue_stats_after_rating_insert
+AFTER INSERT ON user_ratings
+FOR EACH ROW WHEN EXISTS (SELECT 1 FROM stats_settings WHERE name = 'deferred' AND value = 1)
+BEGIN
+  INSERT INTO stats_queue (kind, key) VALUES ('movie', NEW.movie_id), ('user', NEW.user_id)
+  ON CONFLICT DO NOTHING;
+END;
+
+CREATE TRIGGER queue_stats_after_rating_update
+AFTER UPDATE OF user_id, movie_id, rating, review ON user_ratings
+FOR EACH ROW WHEN EXISTS (SELECT 1 FROM stats_settings WHERE name = 'deferred' AND value = 1)
+BEGIN
+  INSERT INTO stats_queue (kind, key)
+  VALUES ('movie', OLD.movie_id), ('user', OLD.user_id), ('movie', NEW.movie_id), ('user', NEW.user_id)
+  ON CONFLICT DO NOTHING;
+END;
+
+CREATE TRIGGER queue_stats_after_rating_delete
+AFTER DELETE ON user_ratings
+FOR EACH ROW WHEN EXISTS (SELECT 1 FROM stats_settings WHERE name = 'deferred' AND value = 1)
+BEGIN
+  INSERT INTO stats_queue (kind, key) VALUES ('movie', OLD.movie_id), ('user', OLD.user_id)
+  ON CONFLICT DO NOTHING;
+END;
+
+CREATE TRIGGER queue_stats_after_favorite_insert
+AFTER INSERT ON user_favorites
+FOR EACH ROW WHEN EXISTS (SELECT 1 FROM stats_settings WHERE name = 'deferred' AND value = 1)
+BEGIN
+  INSERT INTO stats_queue (kind, key) VALUES ('user', NEW.user_id)
+  ON CONFLICT DO NOTHING;
+END;
+
+CREATE TRIGGER queue_stats_after_favorite_delete
+AFTER DELETE ON user_favorites
+FOR EACH ROW WHEN EXISTS (SELECT 1 FROM stats_settings WHERE name = 'deferred' AND value = 1)
+BEGIN
+  INSERT INTO stats_queue (kind, key) VALUES ('user', OLD.user_id)
+  ON CONFLICT DO NOTHING;
+END;
+
+CREATE TRIGGER queue_stats_after_duration_update
+AFTER UPDATE OF duration ON movies
+FOR EACH ROW WHEN NEW.duration IS NOT OLD.duration
+  AND EXISTS (SELECT 1 FROM stats_settings WHERE name = 'deferred' AND value = 1)
+BEGIN
+  INSERT INTO stats_queue (kind, key)
+  SELECT 'user', user_id FROM user_ratings WHERE movie_id = NEW.id
+  ON CONFLICT DO NOTHING;
+END;
+
+-- TRIGGERIT RIVIMÄÄRÄLASKUREILLE (O(1) päivitys per rivi)
+CREATE TRIGGER count_movies_after_insert
+AFTER INSERT ON movies
+FOR EACH ROW
+BEGIN
+  UPDATE table_counters SET value = value + 1 WHERE name = 'movies';
+  INSERT INTO user_counters (user_id, owned_movies) VALUES (NEW.owner_id, 1)
+  ON CONFLICT(user_id) DO UPDATE SET owned_movies = owned_movies + 1;
+END;
+
+CREATE TRIGGER count_movies_after_delete
+AFTER DELETE ON movies
+FOR EACH ROW
+BEGIN
+  UPDATE table_counters SET value = value - 1 WHERE name = 'movies';
+  UPDATE user_counters SET owned_movies = owned_movies - 1 WHERE user_id = OLD.owner_id;
+END;
+
+CREATE TRIGGER count_movies_after_owner_update
+AFTER UPDATE OF owner_id ON movies
+FOR EACH ROW WHEN NEW.owner_id IS NOT OLD.owner_id
+BEGIN
+  UPDATE user_counters SET owned_movies = owned_movies - 1 WHERE user_id = OLD.owner_id;
+  INSERT INTO user_counters (user_id, owned_movies) VALUES (NEW.owner_id, 1)
+  ON CONFLICT(user_id) DO UPDATE SET owned_movies = owned_movies + 1;
+END;
+
+CREATE TRIGGER count_watched_after_insert
+AFTER INSERT ON user_ratings
+FOR EACH ROW WHEN NEW.watched
+BEGIN
+  INSERT INTO user_counters (user_id, watched_movies) VALUES (NEW.user_id, 1)
+  ON CONFLICT(user_id) DO UPDATE SET watched_movies = watched_movies + 1;
+END;
+
+CREATE TRIGGER count_watched_after_delete
+AFTER DELETE ON user_ratings
+FOR EACH ROW WHEN OLD.watched
+BEGIN
+  UPDATE user_counters SET watched_movies = watched_movies - 1 WHERE user_id = OLD.user_id;
+END;
+
+CREATE TRIGGER count_watched_after_update
+AFTER UPDATE OF user_id, watched ON user_ratings
+FOR EACH ROW
+BEGIN
+  UPDATE user_counters SET watched_movies = watched_movies - 1
+  WHERE user_id = OLD.user_id AND OLD.watched;
+  INSERT INTO user_counters (user_id, watched_movies)
+  SELECT NEW.user_id, 1 WHERE NEW.watched
+  ON CONFLICT(user_id) DO UPDATE SET watched_movies = watched_movies + 1;
+END;
+
+CREATE TRIGGER count_favorites_after_insert
+AFTER INSERT ON user_favorites
+FOR EACH ROW
+BEGIN
+  INSERT INTO user_counters (user_id, favorite_movies) VALUES (NEW.user_id, 1)
+  ON CONFLICT(user_id) DO UPDATE SET favorite_movies = favorite_movies + 1;
+END;
+
+CREATE TRIGGER count_favorites_after_delete
+AFTER DELETE ON user_favorites
 FOR EACH ROW
 BEGIN
-  INSERT OR REPLACE INTO user_stats (
-    user_id, total_movies_watched, avg_rating, total_favorites, 
-    total_watch_hours, total_ratings_given, total_reviews_written, updated_at
-  )
-  SELECT 
-    OLD.user_id,
-    COUNT(DISTINCT ur.movie_id),
-    CASE WHEN COUNT(ur.rating) > 0 THEN AVG(CAST(ur.rating AS FLOAT)) ELSE NULL END,
-    COUNT(DISTINCT uf.movie_id),
-    COALESCE(SUM(m.duration) / 60.0, 0),
-    COUNT(CASE WHEN ur.rating IS NOT NULL THEN 1 END),
-    COUNT(CASE WHEN ur.review IS NOT NULL AND ur.review != '' THEN 1 END),
-    CURRENT_TIMESTAMP
-  FROM user_ratings ur
-  LEFT JOIN user_favorites uf ON ur.user_id = uf.user_id
-  LEFT JOIN movies m ON ur.movie_id = m.id
-  WHERE ur.user_id = OLD.user_id;
+  UPDATE user_counters SET favorite_movies = favorite_movies - 1 WHERE user_id = OLD.user_id;
+END;
+
+-- TRIGGERIT HAKUTAULUJEN VERSIOLLE (elokuvasivun ETag vaihtuu, kun versio muuttuu)
+CREATE TRIGGER bump_dimensions_version_after_category_insert
+AFTER INSERT ON categories
+FOR EACH ROW
+BEGIN
+  UPDATE table_counters SET value = value + 1 WHERE name = 'dimensions_version';
+END;
+
+CREATE TRIGGER bump_dimensions_version_after_category_update
+AFTER UPDATE ON categories
+FOR EACH ROW
+BEGIN
+  UPDATE table_counters SET value = value + 1 WHERE name = 'dimensions_version';
+END;
+
+CREATE TRIGGER bump_dimensions_version_after_category_delete
+AFTER DELETE ON categories
+FOR EACH ROW
+BEGIN
+  UPDATE table_counters SET value = value + 1 WHERE name = 'dimensions_version';
+END;
+
+CREATE TRIGGER bump_dimensions_version_after_platform_insert
+AFTER INSERT ON streaming_platforms
+FOR EACH ROW
+BEGIN
+  UPDATE table_counters SET value = value + 1 WHERE name = 'dimensions_version';
+END;
+
+CREATE TRIGGER bump_dimensions_version_after_platform_update
+AFTER UPDATE ON streaming_platforms
+FOR EACH ROW
+BEGIN
+  UPDATE table_counters SET value = value + 1 WHERE name = 'dimensions_version';
+END;
+
+CREATE TRIGGER bump_dimensions_version_after_platform_delete
+AFTER DELETE ON streaming_platforms
+FOR EACH ROW
+BEGIN
+  UPDATE table_counters SET value = value + 1 WHERE name = 'dimensions_version';
+END;
+
+CREATE TRIGGER bump_dimensions_version_after_director_insert
+AFTER INSERT ON directors
+FOR EACH ROW
+BEGIN
+  UPDATE table_counters SET value = value + 1 WHERE name = 'dimensions_version';
+END;
+
+CREATE TRIGGER bump_dimensions_version_after_director_update
+AFTER UPDATE ON directors
+FOR EACH ROW
+BEGIN
+  UPDATE table_counters SET value = value + 1 WHERE name = 'dimensions_version';
 END;
+
+CREATE TRIGGER bump_dimensions_version_after_director_delete
+AFTER DELETE ON directors
+FOR EACH ROW
+BEGIN
+  UPDATE table_counters SET value = value + 1 WHERE name = 'dimensions_version';
+END;
+
+-- TRIGGERIT MUUTOSLASKUREILLE (sivujen ETag-tunnisteet, conditional.py)
+CREATE TRIGGER bump_movies_version_after_insert
+AFTER INSERT ON movies
+FOR EACH ROW
+BEGIN
+  UPDATE table_counters SET value = value + 1 WHERE name = 'movies_version';
+END;
+
+CREATE TRIGGER bump_movies_version_after_update
+AFTER UPDATE ON movies
+FOR EACH ROW
+BEGIN
+  UPDATE table_counters SET value = value + 1 WHERE name = 'movies_version';
+END;
+
+CREATE TRIGGER bump_movies_version_after_delete
+AFTER DELETE ON movies
+FOR EACH ROW
+BEGIN
+  UPDATE table_counters SET value = value + 1 WHERE name = 'movies_version';
+END;
+
+CREATE TRIGGER bump_ratings_version_after_insert
+AFTER INSERT ON user_ratings
+FOR EACH ROW
+BEGIN
+  UPDATE table_counters SET value = value + 1 WHERE name = 'ratings_version';
+END;
+
+CREATE TRIGGER bump_ratings_version_after_update
+AFTER UPDATE ON user_ratings
+FOR EACH ROW
+BEGIN
+  UPDATE table_counters SET value = value + 1 WHERE name = 'ratings_version';
+END;
+
+CREATE TRIGGER bump_ratings_version_after_delete
+AFTER DELETE ON user_ratings
+FOR EACH ROW
+BEGIN
+  UPDATE table_counters SET value = value + 1 WHERE name = 'ratings_version';
+END;
+
+CREATE TRIGGER bump_favorites_version_after_insert
+AFTER INSERT ON user_favorites
+FOR EACH ROW
+BEGIN
+  UPDATE table_counters SET value = value + 1 WHERE name = 'favorites_version';
+END;
+
+CREATE TRIGGER bump_favorites_version_after_delete
+AFTER DELETE ON user_favorites
+FOR EACH ROW
+BEGIN
+  UPDATE table_counters SET value = value + 1 WHERE name = 'favorites_version';
+END;
+
+-- TRIGGERIT MUUTOSLOKILLE (kuka tahansa prosessi näkee, mitkä avaimet muuttuivat)
+CREATE TRIGGER log_change_after_movie_insert
+AFTER INSERT ON movies
+FOR EACH ROW
+BEGIN
+  INSERT INTO change_log (kind, key) VALUES ('movie', NEW.id), ('user', NEW.owner_id);
+END;
+
+CREATE TRIGGER log_change_after_movie_update
+AFTER UPDATE ON movies
+FOR EACH ROW
+BEGIN
+  INSERT INTO change_log (kind, key)
+  SELECT 'movie', NEW.id
+  UNION SELECT 'user', OLD.owner_id WHERE NEW.owner_id IS NOT OLD.owner_id
+  UNION SELECT 'user', NEW.owner_id WHERE NEW.owner_id IS NOT OLD.owner_id;
+END;
+
+CREATE TRIGGER log_change_after_movie_delete
+AFTER DELETE ON movies
+FOR EACH ROW
+BEGIN
+  INSERT INTO change_log (kind, key) VALUES ('movie', OLD.id), ('user', OLD.owner_id);
+END;
+
+-- Arvio muuttaa elokuvan keskiarvoa, ei sen tietoja, joten se kirjataan
+-- omalla lajillaan ('rating', elokuva)
+CREATE TRIGGER log_change_after_rating_insert
+AFTER INSERT ON user_ratings
+FOR EACH ROW
+BEGIN
+  INSERT INTO change_log (kind, key) VALUES ('rating', NEW.movie_id), ('user', NEW.user_id);
+END;
+
+CREATE TRIGGER log_change_after_rating_update
+AFTER UPDATE ON user_ratings
+FOR EACH ROW
+BEGIN
+  INSERT INTO change_log (kind, key)
+  SELECT 'rating', NEW.movie_id UNION SELECT 'rating', OLD.movie_id
+  UNION SELECT 'user', NEW.user_id UNION SELECT 'user', OLD.user_id;
+END;
+
+CREATE TRIGGER log_change_after_rating_delete
+AFTER DELETE ON user_ratings
+FOR EACH ROW
+BEGIN
+  INSERT INTO change_log (kind, key) VALUES ('rating', OLD.movie_id), ('user', OLD.user_id);
+END;
+
+-- Suosikki on käyttäjäkohtainen tieto, joten se kirjataan vain käyttäjälle
+CREATE TRIGGER log_change_after_favorite_insert
+AFTER INSERT ON user_favorites
+FOR EACH ROW
+BEGIN
+  INSERT INTO change_log (kind, key) VALUES ('user', NEW.user_id);
+END;
+
+CREATE TRIGGER log_change_after_favorite_delete
+AFTER DELETE ON user_favorites
+FOR EACH ROW
+BEGIN
+  INSERT INTO change_log (kind, key) VALUES ('user', OLD.user_id);
+END;
+
+CREATE TRIGGER log_change_after_category_insert
+AFTER INSERT ON categories
+FOR EACH ROW
+BEGIN
+  INSERT INTO change_log (kind, key) VALUES ('dimension', 'categories');
+END;
+
+CREATE TRIGGER log_change_after_category_update
+AFTER UPDATE ON categories
+FOR EACH ROW
+BEGIN
+  INSERT INTO change_log (kind, key) VALUES ('dimension', 'categories');
+END;
+
+CREATE TRIGGER log_change_after_category_delete
+AFTER DELETE ON categories
+FOR EACH ROW
+BEGIN
+  INSERT INTO change_log (kind, key) VALUES ('dimension', 'categories');
+END;
+
+CREATE TRIGGER log_change_after_platform_insert
+AFTER INSERT ON streaming_platforms
+FOR EACH ROW
+BEGIN
+  INSERT INTO change_log (kind, key) VALUES ('dimension', 'streaming_platforms');
+END;
+
+CREATE TRIGGER log_change_after_platform_update
+AFTER UPDATE ON streaming_platforms
+FOR EACH ROW
+BEGIN
+  INSERT INTO change_log (kind, key) VALUES ('dimension', 'streaming_platforms');
+END;
+
+CREATE TRIGGER log_change_after_platform_delete
+AFTER DELETE ON streaming_platforms
+FOR EACH ROW
+BEGIN
+  INSERT INTO change_log (kind, key) VALUES ('dimension', 'streaming_platforms');
+END;
+
+CREATE TRIGGER log_change_after_director_insert
+AFTER INSERT ON directors
+FOR EACH ROW
+BEGIN
+  INSERT INTO change_log (kind, key) VALUES ('dimension', 'directors');
+END;
+
+CREATE TRIGGER log_change_after_director_update
+AFTER UPDATE ON directors
+FOR EACH ROW
+BEGIN
+  INSERT INTO change_log (kind, key) VALUES ('dimension', 'directors');
+END;
+
+CREATE TRIGGER log_change_after_director_delete
+AFTER DELETE ON directors
+FOR EACH ROW
+BEGIN
+  INSERT INTO change_log (kind, key) VALUES ('dimension', 'directors');
+END;
+
+-- TRIGGERIT KOKOTEKSTIHAKUINDEKSILLE
+CREATE TRIGGER movies_fts_after_insert
+AFTER INSERT ON movies
+FOR EACH ROW
+BEGIN
+  INSERT INTO movies_fts (rowid, title, director, genre)
+  VALUES (
+    NEW.id,
+    NEW.title,
+    (SELECT name FROM directors WHERE id = NEW.director_id),
+    (SELECT name FROM categories WHERE id = NEW.category_id)
+  );
+END;
+
+CREATE TRIGGER movies_fts_after_update
+AFTER UPDATE OF title, director_id, category_id ON movies
+FOR EACH ROW
+BEGIN
+  UPDATE movies_fts
+  SET title = NEW.title,
+      director = (SELECT name FROM directors WHERE id = NEW.director_id),
+      genre = (SELECT name FROM categories WHERE id = NEW.category_id)
+  WHERE rowid = NEW.id;
+END;
+
+CREATE TRIGGER movies_fts_after_delete
+AFTER DELETE ON movies
+FOR EACH ROW
+BEGIN
+  DELETE FROM movies_fts WHERE rowid = OLD.id;
+END;
+
+CREATE TRIGGER movies_fts_after_director_rename
+AFTER UPDATE OF name ON directors
+FOR EACH ROW
+BEGIN
+  UPDATE movies_fts SET director = NEW.name
+  WHERE rowid IN (SELECT id FROM movies WHERE director_id = NEW.id);
+END;
+
+CREATE TRIGGER movies_fts_after_category_rename
+AFTER UPDATE OF name ON categories
+FOR EACH ROW
+BEGIN
+  UPDATE movies_fts SET genre = NEW.name
+  WHERE rowid IN (SELECT id FROM movies WHERE category_id = NEW.id);
+END;
+
+PRAGMA user_version = 12;
@@ -3,12 +3,21 @@ Seed script to populate the database with test data for performance testing.
 This script generates a large amount of realistic movie data.
 """
 
+import argparse
+import itertools
 import sqlite3
-import random
-from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
 from werkzeug.security import generate_password_hash
 import os
+import re
 import sys
+import time
+
+import numpy as np
+
+import db
+import stats
 
 # Sample data for realistic generation
 MOVIE_TITLES = [
@@ -195,9 +204,17 @@ REVIEWS = [
 ]
 
 
+# Database file to seed; tools that build fixture databases point this elsewhere
+DATABASE = os.getenv("DATABASE_PATH", "database.db")
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "schema.sql")
+
+# Random generator for the vectorised sampling; see set_random_seed()
+rng = np.random.default_rng()
+
+
 def get_connection():
     """Get database connection with max optimizations"""
-    con = sqlite3.connect("database.db", timeout=60)
+    con = sqlite3.connect(DATABASE, timeout=60)
     con.execute("PRAGMA foreign_keys = OFF")  # Disable during seeding
     con.execute("PRAGMA journal_mode = WAL")
     con.execute("PRAGMA synchronous = OFF")  # DANGEROUS but fastest for seeding
@@ -220,16 +237,33 @@ def disable_all_triggers(con):
     con.commit()
 
 
+def schema_statements():
+    """Split schema.sql into complete statements
+
+    A plain split on ";" would cut trigger bodies (BEGIN ... END) apart, so
+    statements are accumulated until sqlite3 reports them complete.
+    """
+    with open(SCHEMA_PATH, "r") as f:
+        schema = f.read()
+
+    statements = []
+    current = ""
+    for part in schema.split(";"):
+        current += part + ";"
+        if sqlite3.complete_statement(current):
+            if current.strip(" \n;"):
+                statements.append(current.strip())
+            current = ""
+    return statements
+
+
 def recreate_triggers_from_schema(con):
     """Recreate triggers from schema"""
     cursor = con.cursor()
-    # Read and execute schema with triggers
-    with open("schema.sql", "r") as f:
-        schema = f.read()
 
     # Extract only trigger statements
     trigger_statements = [
-        stmt.strip() for stmt in schema.split(";") if "TRIGGER" in stmt and stmt.strip()
+        stmt for stmt in schema_statements() if "CREATE TRIGGER" in stmt
     ]
 
     for trigger_sql in trigger_statements:
@@ -241,12 +275,66 @@ def recreate_triggers_from_schema(con):
     con.commit()
 
 
+def index_statements():
+    """(name, CREATE INDEX statement) for the non-unique indexes in schema.sql
+
+    UNIQUE indexes enforce constraints the load relies on, so they are left
+    out; so are the automatic indexes behind UNIQUE/PRIMARY KEY columns,
+    which never appear in schema.sql.
+    """
+    indexes = []
+    for stmt in schema_statements():
+        # Statements can be preceded by the section comments of schema.sql
+        match = re.search(r"^CREATE INDEX (?:IF NOT EXISTS )?(\w+)", stmt, re.M)
+        if match:
+            indexes.append((match.group(1), stmt))
+    return indexes
+
+
+def drop_secondary_indexes(con):
+    """Drop the schema.sql secondary indexes before a bulk load"""
+    cursor = con.cursor()
+    for name, _ in index_statements():
+        cursor.execute(f"DROP INDEX IF EXISTS {name}")
+    con.commit()
+
+
+def recreate_indexes_from_schema(con):
+    """Build the secondary indexes from schema.sql, printing how long each took
+
+    Indexes that already exist are skipped, so this also repairs a load that
+    was interrupted with its indexes dropped.
+    """
+    cursor = con.cursor()
+    existing = {
+        row[0] for row in cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index'")
+    }
+    timings = []
+    for name, index_sql in index_statements():
+        if name in existing:
+            continue
+        start = time.perf_counter()
+        cursor.execute(index_sql)
+        con.commit()
+        timings.append((name, time.perf_counter() - start))
+        print(f"  • {name}: {timings[-1][1]:.2f}s")
+    if timings:
+        print(f"✓ Rebuilt {len(timings)} index(es) in {sum(t for _, t in timings):.2f}s")
+    return timings
+
+
 def clear_database():
-    """Clear existing data from tables"""
+    """Clear existing data from tables
+
+    The triggers are dropped first, so the deletes do not queue stats work or
+    log every row to change_log; the derived tables are then rebuilt (empty)
+    and a single 'all' entry tells other processes to drop their caches.
+    """
     con = get_connection()
     cursor = con.cursor()
 
     try:
+        disable_all_triggers(con)
         cursor.execute("DELETE FROM user_favorites")
         cursor.execute("DELETE FROM user_ratings")
         cursor.execute("DELETE FROM movies")
@@ -256,11 +344,20 @@ def clear_database():
         cursor.execute("DELETE FROM directors")
         cursor.execute("DELETE FROM user_stats")
         cursor.execute("DELETE FROM movie_rating_stats")
+        cursor.execute("DELETE FROM user_counters")
+        cursor.execute("DELETE FROM movies_fts")
+        cursor.execute("DELETE FROM stats_queue")
+        cursor.execute("DELETE FROM change_log")
         con.commit()
-        print("✓ Database cleared")
+        recreate_triggers_from_schema(con)
     finally:
         con.close()
 
+    # Recounts the row counters; the version counters only ever grow, so
+    # an ETag issued before the clear cannot match afterwards
+    stats.rebuild()
+    print("✓ Database cleared")
+
 
 def progress_bar(current, total, label=""):
     """Display a simple progress bar"""
@@ -271,18 +368,87 @@ def progress_bar(current, total, label=""):
     sys.stdout.flush()
 
 
-def seed_users(num_users=50):
-    """Generate test users"""
+def set_random_seed(seed):
+    """Make a seeding run reproducible"""
+    global rng
+    rng = np.random.default_rng(seed)
+
+
+def _random_timestamps(count, max_days=365):
+    """count timestamps 1..max_days days before now, as SQLite datetime strings"""
+    days = rng.integers(1, max_days + 1, size=count).astype("timedelta64[D]")
+    stamps = np.datetime64(datetime.now(), "us") - days
+    return np.char.replace(np.datetime_as_string(stamps), "T", " ").tolist()
+
+
+def _random_dates(count, max_days=365):
+    days = rng.integers(1, max_days + 1, size=count).astype("timedelta64[D]")
+    return np.datetime_as_string(np.datetime64(datetime.now().date(), "D") - days).tolist()
+
+
+def _optional(values, probability):
+    """Replace values with None with the given probability"""
+    keep = rng.random(len(values)) >= probability
+    return [value if kept else None for value, kept in zip(values, keep.tolist())]
+
+
+def _unique_pairs(count, user_ids, movie_ids):
+    """count distinct (user_id, movie_id) pairs, sampled without replacement
+
+    A pair is encoded as one int64 key, user_index * len(movie_ids) +
+    movie_index, so uniqueness comes from sampling distinct integers instead
+    of checking a set of tuples.
+    """
+    user_ids = np.asarray(user_ids, dtype=np.int64)
+    movie_ids = np.asarray(movie_ids, dtype=np.int64)
+    total = len(user_ids) * len(movie_ids)
+    if count > total:
+        print(f"  • Only {total} distinct user/movie pairs exist, creating {total} instead of {count}")
+        count = total
+    keys = rng.choice(total, size=count, replace=False)
+    return user_ids[keys // len(movie_ids)], movie_ids[keys % len(movie_ids)]
+
+
+def _insert_batches(cursor, con, sql, rows, total, label, batch_size):
+    """executemany from a row generator, one commit per batch"""
+    done = 0
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            break
+        cursor.executemany(sql, batch)
+        con.commit()
+        done += len(batch)
+        progress_bar(done, total, label)
+    print()
+    return done
+
+
+def seed_users(num_users=50, workers=None):
+    """Generate test users
+
+    Password hashing dominates the run time, so it is spread over a process
+    pool.
+    """
     con = get_connection()
     cursor = con.cursor()
 
-    users_data = []
-    for i in range(num_users):
-        username = f"user_{i+1}"
-        password_hash = generate_password_hash(f"password{i+1}")
-        created_at = datetime.now() - timedelta(days=random.randint(1, 365))
-        users_data.append((username, password_hash, created_at))
+    passwords = [f"password{i+1}" for i in range(num_users)]
+    workers = max(1, min(workers or os.cpu_count() or 1, num_users))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        password_hashes = list(
+            pool.map(
+                generate_password_hash,
+                passwords,
+                chunksize=max(1, num_users // (workers * 4)),
+            )
+        )
 
+    users_data = zip(
+        (f"user_{i+1}" for i in range(num_users)),
+        password_hashes,
+        _random_timestamps(num_users),
+    )
     cursor.executemany(
         "INSERT INTO users (username, password_hash, created_at) VALUES (?, ?, ?)",
         users_data,
@@ -342,8 +508,8 @@ def seed_directors():
     print(f"✓ Created {len(DIRECTORS)} directors")
 
 
-def seed_movies(num_movies=1000, user_ids=None):
-    """Generate test movies with batch inserts"""
+def seed_movies(num_movies=1000, user_ids=None, batch_size=50000):
+    """Generate test movies, one vectorised batch at a time"""
     if not user_ids:
         con = get_connection()
         cursor = con.cursor()
@@ -363,58 +529,42 @@ def seed_movies(num_movies=1000, user_ids=None):
     cursor.execute("SELECT id FROM directors")
     directors = [row[0] for row in cursor.fetchall()]
 
-    batch_size = 50000
-    movies_data = []
-
-    for i in range(num_movies):
-        title = f"{random.choice(MOVIE_TITLES)} ({i+1})"
-        year = random.randint(1980, 2024)
-        duration = random.randint(80, 180)
-        owner_id = random.choice(user_ids)
-        category_id = random.choice(categories) if random.random() > 0.2 else None
-        platform_id = random.choice(platforms) if random.random() > 0.2 else None
-        director_id = random.choice(directors) if random.random() > 0.2 else None
-        created_at = datetime.now() - timedelta(days=random.randint(1, 365))
-
-        movies_data.append(
-            (
-                title,
-                year,
-                duration,
-                owner_id,
-                category_id,
-                platform_id,
-                director_id,
-                created_at,
+    def movie_rows():
+        for start in range(0, num_movies, batch_size):
+            count = min(batch_size, num_movies - start)
+            titles = rng.integers(len(MOVIE_TITLES), size=count).tolist()
+            yield from zip(
+                (
+                    f"{MOVIE_TITLES[title]} ({start + i + 1})"
+                    for i, title in enumerate(titles)
+                ),
+                rng.integers(1980, 2025, size=count).tolist(),
+                rng.integers(80, 181, size=count).tolist(),
+                rng.choice(user_ids, size=count).tolist(),
+                _optional(rng.choice(categories, size=count).tolist(), 0.2),
+                _optional(rng.choice(platforms, size=count).tolist(), 0.2),
+                _optional(rng.choice(directors, size=count).tolist(), 0.2),
+                _random_timestamps(count),
             )
-        )
 
-        if len(movies_data) >= batch_size:
-            cursor.executemany(
-                """INSERT INTO movies 
-                (title, year, duration, owner_id, category_id, streaming_platform_id, director_id, created_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
-                movies_data,
-            )
-            con.commit()
-            progress_bar(i + 1, num_movies, f"Creating movies")
-            movies_data = []
-
-    if movies_data:
-        cursor.executemany(
-            """INSERT INTO movies 
-            (title, year, duration, owner_id, category_id, streaming_platform_id, director_id, created_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
-            movies_data,
-        )
-        con.commit()
+    _insert_batches(
+        cursor,
+        con,
+        """INSERT INTO movies 
+        (title, year, duration, owner_id, category_id, streaming_platform_id, director_id, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+        movie_rows(),
+        num_movies,
+        "Creating movies",
+        batch_size,
+    )
 
     con.close()
-    print(f"\n✓ Created {num_movies} movies")
+    print(f"✓ Created {num_movies} movies")
 
 
-def seed_ratings(num_ratings=5000, user_ids=None, movie_ids=None):
-    """Generate test ratings with efficient duplicate avoidance"""
+def seed_ratings(num_ratings=5000, user_ids=None, movie_ids=None, batch_size=100000):
+    """Generate test ratings for distinct (user, movie) pairs"""
     if not user_ids:
         con = get_connection()
         cursor = con.cursor()
@@ -427,62 +577,39 @@ def seed_ratings(num_ratings=5000, user_ids=None, movie_ids=None):
     con = get_connection()
     cursor = con.cursor()
 
-    # Pre-generate unique pairs in memory
-    seen = set()
-    ratings_data = []
-    attempts = 0
-    max_attempts = num_ratings * 2
-
     print(f"Generating {num_ratings} unique ratings...")
-    while len(ratings_data) < num_ratings and attempts < max_attempts:
-        user_id = random.choice(user_ids)
-        movie_id = random.choice(movie_ids)
-
-        if (user_id, movie_id) not in seen:
-            seen.add((user_id, movie_id))
-            rating = round(random.uniform(1, 5), 1)
-            watch_date = (
-                datetime.now() - timedelta(days=random.randint(1, 365))
-            ).date()
-            watched_with = random.choice(WATCH_WITH) if random.random() > 0.3 else None
-            watched = random.choice([0, 1])
-            review = random.choice(REVIEWS) if random.random() > 0.5 else None
-            created_at = datetime.now() - timedelta(days=random.randint(1, 365))
-
-            ratings_data.append(
-                (
-                    user_id,
-                    movie_id,
-                    rating,
-                    watch_date,
-                    watched_with,
-                    watched,
-                    review,
-                    created_at,
-                )
+    pair_users, pair_movies = _unique_pairs(num_ratings, user_ids, movie_ids)
+    num_ratings = len(pair_users)
+
+    def rating_rows():
+        for start in range(0, num_ratings, batch_size):
+            end = min(start + batch_size, num_ratings)
+            count = end - start
+            yield from zip(
+                pair_users[start:end].tolist(),
+                pair_movies[start:end].tolist(),
+                np.round(rng.uniform(1, 5, size=count), 1).tolist(),
+                _random_dates(count),
+                _optional(rng.choice(WATCH_WITH, size=count).tolist(), 0.3),
+                rng.integers(0, 2, size=count).tolist(),
+                _optional(rng.choice(REVIEWS, size=count).tolist(), 0.5),
+                _random_timestamps(count),
             )
 
-        attempts += 1
-        if attempts % 100000 == 0:
-            progress_bar(len(ratings_data), num_ratings, "Generating ratings")
-
-    print(f"\n")
-
-    # Batch insert in very large chunks
-    batch_size = 100000
-    for i in range(0, len(ratings_data), batch_size):
-        batch = ratings_data[i : i + batch_size]
-        cursor.executemany(
-            """INSERT INTO user_ratings 
-            (user_id, movie_id, rating, watch_date, watched_with, watched, review, created_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
-            batch,
-        )
-        con.commit()
-        progress_bar(i + len(batch), len(ratings_data), "Inserting ratings")
+    _insert_batches(
+        cursor,
+        con,
+        """INSERT INTO user_ratings 
+        (user_id, movie_id, rating, watch_date, watched_with, watched, review, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+        rating_rows(),
+        num_ratings,
+        "Inserting ratings",
+        batch_size,
+    )
 
     con.close()
-    print(f"\n✓ Created {len(ratings_data)} ratings")
+    print(f"✓ Created {num_ratings} ratings")
 
 
 def seed_favorites(num_favorites=500, user_ids=None, movie_ids=None):
@@ -499,121 +626,150 @@ def seed_favorites(num_favorites=500, user_ids=None, movie_ids=None):
     con = get_connection()
     cursor = con.cursor()
 
-    seen = set()
-    favorites_data = []
-    attempts = 0
-    max_attempts = num_favorites * 3
-
-    while len(favorites_data) < num_favorites and attempts < max_attempts:
-        user_id = random.choice(user_ids)
-        movie_id = random.choice(movie_ids)
+    pair_users, pair_movies = _unique_pairs(num_favorites, user_ids, movie_ids)
+    cursor.executemany(
+        "INSERT INTO user_favorites (user_id, movie_id) VALUES (?, ?)",
+        zip(pair_users.tolist(), pair_movies.tolist()),
+    )
+    con.commit()
+    con.close()
 
-        if (user_id, movie_id) not in seen:
-            seen.add((user_id, movie_id))
-            favorites_data.append((user_id, movie_id))
+    print(f"✓ Created {len(pair_users)} favorites")
 
-        attempts += 1
 
-    cursor.executemany(
-        "INSERT INTO user_favorites (user_id, movie_id) VALUES (?, ?)", favorites_data
-    )
+def create_database(path):
+    """Replace any database at path with an empty one created from schema.sql"""
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    con = sqlite3.connect(path)
+    for statement in schema_statements():
+        con.execute(statement)
     con.commit()
     con.close()
 
-    print(f"✓ Created {len(favorites_data)} favorites")
 
+def seed_database(num_users, num_movies, num_ratings, num_favorites, workers=None, bulk_load=False):
+    """Fill DATABASE with triggers off, then restore them and rebuild the derived tables"""
+    con = get_connection()
+    disable_all_triggers(con)
+    if bulk_load:
+        drop_secondary_indexes(con)
+    con.close()
 
-def populate_user_stats():
-    """Populate user_stats in one efficient batch operation"""
+    # Seed basic data
+    seed_categories()
+    seed_platforms()
+    seed_directors()
+    user_ids = seed_users(num_users, workers)
+    seed_movies(num_movies, user_ids)
+
+    # Get movie IDs
     con = get_connection()
-    con.execute("PRAGMA foreign_keys = ON")
     cursor = con.cursor()
+    cursor.execute("SELECT id FROM movies")
+    movie_ids = [row[0] for row in cursor.fetchall()]
+    con.close()
 
-    print("Calculating user statistics...")
-
-    cursor.execute(
-        """INSERT OR REPLACE INTO user_stats (
-            user_id, 
-            total_movies_watched, 
-            avg_rating, 
-            total_favorites, 
-            total_watch_hours, 
-            total_ratings_given, 
-            total_reviews_written, 
-            updated_at
-        )
-        SELECT 
-            ur.user_id,
-            COUNT(DISTINCT ur.movie_id),
-            CASE WHEN COUNT(ur.rating) > 0 THEN AVG(CAST(ur.rating AS FLOAT)) ELSE NULL END,
-            COUNT(DISTINCT uf.movie_id),
-            COALESCE(SUM(m.duration) / 60.0, 0),
-            COUNT(CASE WHEN ur.rating IS NOT NULL THEN 1 END),
-            COUNT(CASE WHEN ur.review IS NOT NULL AND ur.review != '' THEN 1 END),
-            CURRENT_TIMESTAMP
-        FROM user_ratings ur
-        LEFT JOIN user_favorites uf ON ur.user_id = uf.user_id
-        LEFT JOIN movies m ON ur.movie_id = m.id
-        GROUP BY ur.user_id"""
-    )
+    # Seed ratings and favorites
+    seed_ratings(num_ratings, user_ids, movie_ids)
+    seed_favorites(num_favorites, user_ids, movie_ids)
 
-    con.commit()
+    # Recreate indexes and triggers and calculate stats; the rebuild
+    # needs the indexes in place
+    con = get_connection()
+    recreate_indexes_from_schema(con)
+    recreate_triggers_from_schema(con)
     con.close()
-    print("✓ User statistics calculated")
+
+    stats.rebuild()
+
+
+def build_fixture_database(
+    path, num_users=20, num_movies=2000, num_ratings=5000, num_favorites=500, random_seed=42
+):
+    """Create a small, reproducible database for tools and benchmarks
+
+    The schema is created from schema.sql and the data is seeded with the
+    triggers in place, so every derived table is filled exactly as the
+    application would fill it. Meant for fixture sizes, not full seeding.
+    """
+    global DATABASE
+    previous, DATABASE = DATABASE, path
+    try:
+        create_database(path)
+        set_random_seed(random_seed)
+        seed_categories()
+        seed_platforms()
+        seed_directors()
+        user_ids = seed_users(num_users)
+        seed_movies(num_movies, user_ids)
+
+        con = get_connection()
+        movie_ids = [row[0] for row in con.execute("SELECT id FROM movies")]
+        con.close()
+
+        seed_ratings(num_ratings, user_ids, movie_ids)
+        seed_favorites(num_favorites, user_ids, movie_ids)
+    finally:
+        DATABASE = previous
+    return path
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Seed the database with test data")
+    parser.add_argument("--users", type=int, default=100, help="number of users")
+    parser.add_argument("--movies", type=int, default=50000, help="number of movies")
+    parser.add_argument("--ratings", type=int, default=500000, help="number of ratings")
+    parser.add_argument("--favorites", type=int, default=1000, help="number of favorites")
+    parser.add_argument("--seed", type=int, help="random seed for a reproducible run")
+    parser.add_argument("--workers", type=int, help="processes for password hashing")
+    parser.add_argument("--database", default=DATABASE, help="database file")
+    parser.add_argument("--yes", action="store_true", help="clear an existing database without asking")
+    parser.add_argument(
+        "--bulk-load",
+        action="store_true",
+        help="drop the secondary indexes during the load and rebuild them afterwards",
+    )
+    return parser.parse_args()
 
 
 def main():
     """Main seed function"""
+    global DATABASE
+    args = parse_args()
+    DATABASE = db.DATABASE = args.database
+    set_random_seed(args.seed)
+
     print("\n" + "=" * 60)
     print("DATABASE SEEDING - OPTIMIZED FOR PERFORMANCE")
     print("=" * 60 + "\n")
 
-    # RECOMMENDED: These numbers complete in ~5-10 minutes
-    num_users = 100  # Increase if needed
-    num_movies = 50000  # Adjust this
-    num_ratings = 500000  # Adjust this
-    num_favorites = 1000  # Adjust this
+    num_users = args.users
+    num_movies = args.movies
+    num_ratings = args.ratings
+    num_favorites = args.favorites
 
     print("Current configuration:")
     print(f"  • Users: {num_users}")
     print(f"  • Movies: {num_movies}")
     print(f"  • Ratings: {num_ratings}")
     print(f"  • Favorites: {num_favorites}")
-    print(f"\nEstimated time: 5-10 minutes\n")
+    print(f"  • Random seed: {args.seed if args.seed is not None else 'random'}\n")
 
     try:
-        if os.path.exists("database.db"):
-            response = input("Database already exists. Clear it? (y/n): ")
+        if os.path.exists(DATABASE):
+            response = "y" if args.yes else input("Database already exists. Clear it? (y/n): ")
             if response.lower() == "y":
                 clear_database()
             else:
                 print("Seeding cancelled.")
                 return
 
-        # Seed basic data
-        seed_categories()
-        seed_platforms()
-        seed_directors()
-        user_ids = seed_users(num_users)
-        seed_movies(num_movies, user_ids)
-
-        # Get movie IDs
-        con = get_connection()
-        cursor = con.cursor()
-        cursor.execute("SELECT id FROM movies")
-        movie_ids = [row[0] for row in cursor.fetchall()]
-        con.close()
-
-        # Seed ratings and favorites
-        seed_ratings(num_ratings, user_ids, movie_ids)
-        seed_favorites(num_favorites, user_ids, movie_ids)
-
-        # Recreate triggers and calculate stats
-        con = get_connection()
-        recreate_triggers_from_schema(con)
-        con.close()
-
-        populate_user_stats()
+        # Triggers are rebuilt from schema.sql and their tables recomputed at the end
+        seed_database(
+            num_users, num_movies, num_ratings, num_favorites, args.workers, args.bulk_load
+        )
 
         print("\n" + "=" * 60)
         print("SEEDING COMPLETED SUCCESSFULLY! ✓")
@@ -0,0 +1,567 @@
+"""
+Derived tables: movie_rating_stats, user_stats, the row counters and the
+search index.
+
+Triggers keep them up to date incrementally from the OLD/NEW row
+difference. This module holds the full-recompute queries they must agree
+with, a command that checks the stored values against them (exit status 1
+when any row differs), and a rebuild for after imports or suspected drift:
+
+    $ python stats.py verify
+    $ python stats.py rebuild --dry-run   # show what would change
+    $ python stats.py rebuild [TABLE ...]
+
+For bursty writes (bulk imports, deleting a movie with many ratings) the
+tables can be switched to deferred mode. The triggers then only record the
+changed movie and user ids in stats_queue, and a worker recomputes the
+queued keys in batches, each key once however many times it changed:
+
+    $ python stats.py deferred on
+    $ python stats.py worker        # or STATS_WORKER=1 for a thread in the app
+    $ python stats.py flush         # apply everything queued right now
+    $ python stats.py deferred off  # flushes, then back to per-row triggers
+
+Without a worker the app flushes the queue itself before serving a request
+once a change has waited MAX_STALENESS_SECONDS, so the bound still holds;
+the worker keeps that flush off the request path.
+"""
+
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+
+import changes
+import db
+
+# Running sums are floats; differences below this are rounding, not drift
+TOLERANCE = 1e-6
+
+# Deferred mode: no queued change stays unapplied for longer than this
+MAX_STALENESS_SECONDS = float(os.getenv("STATS_MAX_STALENESS_SECONDS", "5"))
+
+# Keys refreshed per transaction; keeps the write lock short for the app
+REFRESH_BATCH_SIZE = int(os.getenv("STATS_REFRESH_BATCH_SIZE", "500"))
+
+# Key range rebuilt per transaction by `rebuild`
+REBUILD_CHUNK_SIZE = 10000
+
+log = logging.getLogger("stats")
+
+_worker = None
+
+
+def movie_stats_query(key_filter=""):
+    """Full recompute of movie_rating_stats from user_ratings
+
+    key_filter (e.g. "IN (?, ?)") restricts it to some movie ids.
+    """
+    where = f"AND movie_id {key_filter}" if key_filter else ""
+    return f"""
+    SELECT
+        movie_id,
+        TOTAL(rating) AS rating_sum,
+        COUNT(rating) AS total_ratings,
+        AVG(rating) AS average_rating
+    FROM user_ratings
+    WHERE rating IS NOT NULL {where}
+    GROUP BY movie_id
+"""
+
+
+def user_stats_query(key_filter=""):
+    """Full recompute of user_stats
+
+    Ratings and favorites are aggregated separately: joining them directly
+    would multiply every sum by the number of favorites. key_filter is
+    applied in all three places, so its parameters are passed three times.
+    """
+    ratings_where = f"WHERE ur.user_id {key_filter}" if key_filter else ""
+    favorites_where = f"WHERE user_id {key_filter}" if key_filter else ""
+    users_where = f"AND u.id {key_filter}" if key_filter else ""
+    return f"""
+    SELECT
+        u.id AS user_id,
+        COALESCE(r.movies, 0) AS total_movies_watched,
+        COALESCE(r.rating_sum, 0) AS rating_sum,
+        COALESCE(r.ratings, 0) AS total_ratings_given,
+        r.rating_sum / NULLIF(r.ratings, 0) AS avg_rating,
+        COALESCE(r.reviews, 0) AS total_reviews_written,
+        COALESCE(r.minutes, 0) AS total_watch_minutes,
+        COALESCE(r.minutes, 0) / 60.0 AS total_watch_hours,
+        COALESCE(f.favorites, 0) AS total_favorites
+    FROM users u
+    LEFT JOIN (
+        SELECT
+            ur.user_id,
+            COUNT(*) AS movies,
+            TOTAL(ur.rating) AS rating_sum,
+            COUNT(ur.rating) AS ratings,
+            SUM(COALESCE(ur.review, '') != '') AS reviews,
+            COALESCE(SUM(m.duration), 0) AS minutes
+        FROM user_ratings ur
+        LEFT JOIN movies m ON ur.movie_id = m.id
+        {ratings_where}
+        GROUP BY ur.user_id
+    ) r ON r.user_id = u.id
+    LEFT JOIN (
+        SELECT user_id, COUNT(*) AS favorites
+        FROM user_favorites
+        {favorites_where}
+        GROUP BY user_id
+    ) f ON f.user_id = u.id
+    WHERE (r.user_id IS NOT NULL OR f.user_id IS NOT NULL) {users_where}
+"""
+
+
+def user_counters_query(key_filter=""):
+    """Full recompute of user_counters"""
+    where = f"WHERE u.id {key_filter}" if key_filter else ""
+    return f"""
+    SELECT
+        u.id AS user_id,
+        (SELECT COUNT(*) FROM movies m WHERE m.owner_id = u.id) AS owned_movies,
+        (SELECT COUNT(*) FROM user_ratings ur WHERE ur.user_id = u.id AND ur.watched)
+            AS watched_movies,
+        (SELECT COUNT(*) FROM user_favorites uf WHERE uf.user_id = u.id) AS favorite_movies
+    FROM users u
+    {where}
+"""
+
+
+def table_counters_query(key_filter=""):
+    """Full recompute of the table_counters rows kept by triggers"""
+    where = f"WHERE name {key_filter}" if key_filter else ""
+    return f"""
+    SELECT name, value FROM (
+        SELECT 'movies' AS name, (SELECT COUNT(*) FROM movies) AS value
+    )
+    {where}
+"""
+
+
+def search_index_query(key_filter=""):
+    """Full recompute of the movies_fts rows (rowid = movies.id)"""
+    where = f"WHERE m.id {key_filter}" if key_filter else ""
+    return f"""
+    SELECT m.id AS rowid, m.title AS title, d.name AS director, c.name AS genre
+    FROM movies m
+    LEFT JOIN directors d ON m.director_id = d.id
+    LEFT JOIN categories c ON m.category_id = c.id
+    {where}
+"""
+
+
+MOVIE_STATS_SQL = movie_stats_query()
+USER_STATS_SQL = user_stats_query()
+
+# Every table maintained by triggers, with how to recompute it. "source" is
+# the table whose ids the keys are drawn from, for chunking by key range;
+# "filter_uses" is how many times the recompute query repeats its key filter.
+DERIVED_TABLES = {
+    "movie_rating_stats": {
+        "key": "movie_id",
+        "source": "movies",
+        "query": movie_stats_query,
+        "filter_uses": 1,
+        "columns": ["rating_sum", "total_ratings", "average_rating"],
+        "timestamped": True,
+    },
+    "user_stats": {
+        "key": "user_id",
+        "source": "users",
+        "query": user_stats_query,
+        "filter_uses": 3,
+        "columns": [
+            "total_movies_watched",
+            "rating_sum",
+            "total_ratings_given",
+            "avg_rating",
+            "total_reviews_written",
+            "total_watch_minutes",
+            "total_watch_hours",
+            "total_favorites",
+        ],
+        "timestamped": True,
+    },
+    "user_counters": {
+        "key": "user_id",
+        "source": "users",
+        "query": user_counters_query,
+        "filter_uses": 1,
+        "columns": ["owned_movies", "watched_movies", "favorite_movies"],
+        "timestamped": False,
+    },
+    "table_counters": {
+        "key": "name",
+        "source": None,  # a handful of rows, rebuilt in one go
+        "query": table_counters_query,
+        "filter_uses": 1,
+        "columns": ["value"],
+        "timestamped": False,
+    },
+    "movies_fts": {
+        "key": "rowid",
+        "source": "movies",
+        "query": search_index_query,
+        "filter_uses": 1,
+        "columns": ["title", "director", "genre"],
+        "timestamped": False,
+    },
+}
+
+# Deferred-mode queue kind -> the table its keys are refreshed in
+QUEUE_TABLES = {"movie": "movie_rating_stats", "user": "user_stats"}
+
+# table_counters rows that triggers bump on every change to their tables;
+# the page ETags (conditional.py) and the lookup cache (lookups.py) use them
+VERSION_COUNTERS = ["movies_version", "ratings_version", "favorites_version", "dimensions_version"]
+
+
+def _differs(stored, expected):
+    if stored is None or expected is None:
+        return (stored is None) != (expected is None)
+    if isinstance(stored, str) or isinstance(expected, str):
+        return stored != expected
+    return abs(stored - expected) > TOLERANCE
+
+
+def _is_empty(row, columns):
+    """A stored row whose every value is zero/NULL, e.g. after all ratings were removed"""
+    return all(not row[column] for column in columns)
+
+
+def diff_table(table):
+    """Compare a derived table with its full recompute
+
+    Returns a list of (key, column, stored, expected). A missing row counts
+    as all zeros, so rows left behind at zero and rows never created for an
+    empty aggregate are both fine.
+    """
+    spec = DERIVED_TABLES[table]
+    key, columns = spec["key"], spec["columns"]
+    recompute_sql = spec["query"]()
+    stored_sql = f"SELECT {key}, {', '.join(columns)} FROM {table}"
+    if spec["source"] is None:
+        # Only the rows the recompute covers; other rows belong to someone else
+        stored_sql += f" WHERE {key} IN (SELECT {key} FROM ({recompute_sql}))"
+
+    expected = {row[key]: row for row in db.stream(recompute_sql)}
+    mismatches = []
+
+    for row in db.stream(stored_sql):
+        want = expected.pop(row[key], None)
+        if want is None:
+            if not _is_empty(row, columns):
+                mismatches.append((row[key], "(row)", "present", "no source rows"))
+            continue
+        for column in columns:
+            if _differs(row[column], want[column]):
+                mismatches.append((row[key], column, row[column], want[column]))
+
+    for missing_key, want in expected.items():
+        if not _is_empty(want, columns):
+            mismatches.append((missing_key, "(row)", "missing", "present"))
+    return mismatches
+
+
+def verify(limit=20, tables=None):
+    """Check derived tables; print the differences and return their count"""
+    total = 0
+    for table in tables or DERIVED_TABLES:
+        key = DERIVED_TABLES[table]["key"]
+        mismatches = diff_table(table)
+        total += len(mismatches)
+        if not mismatches:
+            print(f"✓ {table}: matches a full recompute")
+            continue
+        rows = len({row_key for row_key, *_ in mismatches})
+        print(f"✗ {table}: {rows} row(s) differ, {len(mismatches)} value(s)")
+        for row_key, column, stored, expected in mismatches[:limit]:
+            print(f"    {key}={row_key} {column}: stored {stored}, expected {expected}")
+    return total
+
+
+def _recompute_insert_sql(table, key_filter):
+    """INSERT ... SELECT that writes the recompute for the keys matching key_filter"""
+    spec = DERIVED_TABLES[table]
+    column_list = ", ".join([spec["key"]] + spec["columns"])
+    if spec["timestamped"]:
+        return f"""INSERT INTO {table} ({column_list}, updated_at)
+            SELECT {column_list}, CURRENT_TIMESTAMP
+            FROM ({spec["query"](key_filter)})"""
+    return f"""INSERT INTO {table} ({column_list})
+        SELECT {column_list} FROM ({spec["query"](key_filter)})"""
+
+
+def rebuild_table(table, chunk_size=None):
+    """Replace a derived table with its recompute, one key range per transaction
+
+    Writers may keep going during the rebuild: a range that is already done
+    gets their trigger deltas on top of correct values, and a range that is
+    not done yet is recomputed after their change anyway.
+    """
+    spec = DERIVED_TABLES[table]
+    key, source = spec["key"], spec["source"]
+    chunk_size = chunk_size or REBUILD_CHUNK_SIZE
+
+    if source is None:
+        with db.transaction():
+            keys_sql = f"SELECT {key} FROM ({spec['query']()})"
+            db.execute(f"DELETE FROM {table} WHERE {key} IN ({keys_sql})")
+            db.execute(_recompute_insert_sql(table, ""))
+        return
+
+    # Stored keys outside the source's range (deleted users/movies) are covered too
+    bounds = db.query(
+        f"""SELECT MIN(low) AS low, MAX(high) AS high FROM (
+                SELECT MIN(id) AS low, MAX(id) AS high FROM {source}
+                UNION ALL
+                SELECT MIN({key}), MAX({key}) FROM {table}
+            )"""
+    )[0]
+    if bounds["low"] is None:
+        return
+
+    low, high = bounds["low"], bounds["high"]
+    insert_sql = _recompute_insert_sql(table, "BETWEEN ? AND ?")
+    for start in range(low, high + 1, chunk_size):
+        end = min(start + chunk_size - 1, high)
+        with db.transaction():
+            db.execute(f"DELETE FROM {table} WHERE {key} BETWEEN ? AND ?", [start, end])
+            db.execute(insert_sql, [start, end] * spec["filter_uses"])
+        sys.stdout.write(
+            f"\r  {table}: {(end - low + 1) * 100 // (high - low + 1)}% ({key} {end}/{high})"
+        )
+        sys.stdout.flush()
+    print()
+
+
+def rebuild(tables=None, chunk_size=None, dry_run=False):
+    """Rebuild derived tables from scratch, or with dry_run only show what would change
+
+    Returns the number of differing values found (dry run) or 0.
+    """
+    tables = tables or list(DERIVED_TABLES)
+    if dry_run:
+        differences = verify(tables=tables)
+        print("Dry run: nothing was written")
+        return differences
+
+    started = time.perf_counter()
+    for table in tables:
+        table_started = time.perf_counter()
+        rebuild_table(table, chunk_size)
+        rows = db.query(f"SELECT COUNT(*) AS n FROM {table}")[0]["n"]
+        print(f"✓ {table}: {rows} rows in {time.perf_counter() - table_started:.1f}s")
+
+    # Everything queued in deferred mode is covered by the rebuild
+    if set(QUEUE_TABLES.values()) <= set(tables):
+        db.execute("DELETE FROM stats_queue")
+    bump_versions()
+    changes.log_all()
+    print(f"✓ Rebuilt {len(tables)} table(s) in {time.perf_counter() - started:.1f}s")
+    return 0
+
+
+def bump_versions(names=None):
+    """Bump version counters for changes the triggers did not see
+
+    Bulk loads run with the triggers off, and rebuilds and deferred refreshes
+    rewrite derived rows long after the triggering write.
+    """
+    names = names or VERSION_COUNTERS
+    db.execute(
+        f"UPDATE table_counters SET value = value + 1 WHERE name IN ({', '.join('?' * len(names))})",
+        names,
+    )
+
+
+def is_deferred():
+    rows = db.query("SELECT value FROM stats_settings WHERE name = 'deferred'")
+    return bool(rows and rows[0]["value"])
+
+
+def set_deferred(enabled):
+    """Switch between per-row trigger maintenance and the deferred queue
+
+    Switching back flushes the queue afterwards; keys written in between get
+    a delta on a stale row, which the flush then overwrites with a recompute.
+    """
+    db.execute(
+        "UPDATE stats_settings SET value = ? WHERE name = 'deferred'", [int(enabled)]
+    )
+    if not enabled:
+        flush()
+
+
+def queue_status():
+    """Queued key count and the age in seconds of the oldest queued change"""
+    row = db.query(
+        """SELECT COUNT(*) AS queued,
+                  (julianday('now') - MIN(queued_at)) * 86400.0 AS oldest_seconds
+           FROM stats_queue"""
+    )[0]
+    return row["queued"], row["oldest_seconds"] or 0.0
+
+
+def refresh_batch(kind, batch_size=None):
+    """Recompute the oldest queued keys of one kind; returns how many were done
+
+    The stale rows are replaced with a recompute restricted to those keys, and
+    the keys are dequeued in the same transaction.
+    """
+    table = QUEUE_TABLES[kind]
+    spec = DERIVED_TABLES[table]
+    with db.transaction():
+        keys = [
+            row["key"]
+            for row in db.query(
+                "SELECT key FROM stats_queue WHERE kind = ? ORDER BY queued_at LIMIT ?",
+                [kind, batch_size or REFRESH_BATCH_SIZE],
+            )
+        ]
+        if not keys:
+            return 0
+
+        placeholders = ", ".join("?" * len(keys))
+        db.execute(f"DELETE FROM {table} WHERE {spec['key']} IN ({placeholders})", keys)
+        db.execute(
+            _recompute_insert_sql(table, f"IN ({placeholders})"),
+            keys * spec["filter_uses"],
+        )
+        db.execute(
+            f"DELETE FROM stats_queue WHERE kind = ? AND key IN ({placeholders})",
+            [kind] + keys,
+        )
+        # The ratings changed earlier, but the averages on the pages change now
+        if kind == "movie":
+            bump_versions(["ratings_version"])
+        # A refreshed movie row means its ratings changed, not the movie itself
+        changes.log_keys("rating" if kind == "movie" else kind, keys)
+    return len(keys)
+
+
+def flush(batch_size=None):
+    """Apply everything queued so far, one batch per transaction"""
+    refreshed = 0
+    for kind in QUEUE_TABLES:
+        while True:
+            count = refresh_batch(kind, batch_size)
+            if not count:
+                break
+            refreshed += count
+    return refreshed
+
+
+def flush_stale(max_staleness=None):
+    """Flush the queue once its oldest change has waited max_staleness seconds
+
+    Called before serving a request, so the staleness bound holds even when
+    no worker is running; with nothing overdue it costs one index lookup.
+    Returns how many keys were refreshed.
+    """
+    bound = max_staleness or MAX_STALENESS_SECONDS
+    overdue = db.query(
+        "SELECT 1 FROM stats_queue WHERE queued_at <= julianday('now') - ? / 86400.0 LIMIT 1",
+        [bound],
+    )
+    return flush() if overdue else 0
+
+
+def start_worker(max_staleness=None):
+    """Flush the queue from a daemon thread
+
+    The queue is checked every max_staleness / 2 seconds, leaving the other
+    half of the bound for the flush itself. Returns an Event that stops it.
+    """
+    global _worker
+    if _worker is not None and _worker[0].is_alive():
+        return _worker[1]
+
+    interval = (max_staleness or MAX_STALENESS_SECONDS) / 2
+    stop = threading.Event()
+
+    def run():
+        while not stop.wait(interval):
+            try:
+                flush()
+            except Exception:
+                log.exception("stats queue flush failed")
+
+    thread = threading.Thread(target=run, name="stats-worker", daemon=True)
+    thread.start()
+    _worker = (thread, stop)
+    return stop
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Derived statistics tables")
+    commands = parser.add_subparsers(dest="command", required=True)
+    verify_parser = commands.add_parser(
+        "verify", help="compare the trigger-maintained stats with a full recompute"
+    )
+    verify_parser.add_argument(
+        "--limit", type=int, default=20, help="differences to print per table"
+    )
+    rebuild_parser = commands.add_parser(
+        "rebuild", help="recompute every derived table from the source tables"
+    )
+    rebuild_parser.add_argument(
+        "tables", nargs="*", metavar="TABLE",
+        help=f"tables to rebuild (default: all of {', '.join(DERIVED_TABLES)})",
+    )
+    rebuild_parser.add_argument(
+        "--chunk-size", type=int, default=REBUILD_CHUNK_SIZE,
+        help="keys per transaction (default: %(default)s)",
+    )
+    rebuild_parser.add_argument(
+        "--dry-run", action="store_true", help="only show the rows that would change"
+    )
+    deferred_parser = commands.add_parser(
+        "deferred", help="show or switch deferred stats maintenance"
+    )
+    deferred_parser.add_argument("state", nargs="?", choices=["on", "off"])
+    commands.add_parser("flush", help="apply all queued stats changes now")
+    worker_parser = commands.add_parser(
+        "worker", help="keep flushing the queue until interrupted"
+    )
+    worker_parser.add_argument(
+        "--max-staleness",
+        type=float,
+        default=MAX_STALENESS_SECONDS,
+        help="seconds a queued change may wait (default: %(default)s)",
+    )
+    args = parser.parse_args()
+
+    if args.command == "verify":
+        sys.exit(1 if verify(args.limit) else 0)
+    elif args.command == "rebuild":
+        unknown = set(args.tables) - set(DERIVED_TABLES)
+        if unknown:
+            parser.error(f"unknown table(s): {', '.join(sorted(unknown))}")
+        rebuild(args.tables, args.chunk_size, args.dry_run)
+    elif args.command == "deferred":
+        if args.state:
+            set_deferred(args.state == "on")
+        queued, oldest = queue_status()
+        mode = "deferred" if is_deferred() else "immediate"
+        print(f"Stats maintenance: {mode}, {queued} key(s) queued, oldest {oldest:.1f}s")
+    elif args.command == "flush":
+        print(f"✓ Refreshed {flush()} key(s)")
+    elif args.command == "worker":
+        logging.basicConfig(level=logging.INFO)
+        stop = start_worker(args.max_staleness)
+        print(f"Flushing the stats queue every {args.max_staleness / 2:g}s (Ctrl-C to stop)")
+        try:
+            while not stop.wait(3600):
+                pass
+        except KeyboardInterrupt:
+            stop.set()
+            print(f"✓ Refreshed {flush()} key(s)")
+
+
+if __name__ == "__main__":
+    main()